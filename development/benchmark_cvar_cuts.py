@@ -0,0 +1,26 @@
+# Run from the repository root with: python -m development.benchmark_cvar_cuts
+import numpy as np
+
+from src.optimization.cvar_cuts import compare_with_full_model
+from src.optimization.instance_data import create_instance
+from src.optimization.om_continuous_cvar import create_model
+
+N_SCENARIOS = 500
+HORIZON_PERIODS = 12
+N_ASSETS = 5
+
+rng = np.random.default_rng(42)
+prices_syms = 50*np.exp(np.cumsum(rng.normal(0.005, 0.04, size=(N_SCENARIOS, N_ASSETS, HORIZON_PERIODS+1)), axis=2))
+prices_syms[:, :, 0] = 50
+income_syms = rng.normal(2000, 50, size=(N_SCENARIOS, HORIZON_PERIODS+1)).clip(0)
+expenses_syms = rng.normal(1600, 80, size=(N_SCENARIOS, HORIZON_PERIODS+1)).clip(0)
+non_cash_assets = [f'Asset{i}' for i in range(N_ASSETS)]
+
+model = create_model()
+instances = [
+    create_instance(model, prices_syms, income_syms, expenses_syms, non_cash_assets, pInitialCashAllocations=100_000, pTradeFee=0.01, pCVaRAlpha=0.05, pCVaRGamma=0.8)
+    for _ in range(2)
+]
+result = compare_with_full_model(*instances)
+for k, v in result.items():
+    print(f"{k}: {v}")
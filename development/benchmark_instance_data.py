@@ -0,0 +1,19 @@
+# Run from the repository root with: python -m development.benchmark_instance_data
+import numpy as np
+
+from src.optimization.om_continuous_cvar import create_model
+from src.optimization.instance_data import compare_with_data_dict
+
+N_SCENARIOS = 300
+HORIZON_PERIODS = 60
+N_ASSETS = 20
+
+rng = np.random.default_rng(42)
+prices_syms = 50*np.exp(np.cumsum(rng.normal(0.005, 0.04, size=(N_SCENARIOS, N_ASSETS, HORIZON_PERIODS+1)), axis=2))
+income_syms = rng.normal(2000, 50, size=(N_SCENARIOS, HORIZON_PERIODS+1)).clip(0)
+expenses_syms = rng.normal(1600, 80, size=(N_SCENARIOS, HORIZON_PERIODS+1)).clip(0)
+non_cash_assets = [f'Asset{a_i+1}' for a_i in range(N_ASSETS)]
+
+report = compare_with_data_dict(create_model(), prices_syms, income_syms, expenses_syms, non_cash_assets, pInitialCashAllocations=100_000, pTradeFee=0.01, pCVaRAlpha=0.5, pCVaRGamma=0.8)
+for k, v in report.items():
+    print(f"{k}: {v:.3f}")
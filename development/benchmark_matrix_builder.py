@@ -0,0 +1,26 @@
+# Run from the repository root with: python -m development.benchmark_matrix_builder
+import numpy as np
+import time
+from pyomo.environ import SolverFactory
+
+from src.optimization.matrix_builder import create_matrix_model, compare_with_pyomo
+
+N_SCENARIOS = 1000
+HORIZON_PERIODS = 60
+N_ASSETS = 20
+
+rng = np.random.default_rng(42)
+prices_syms = 50*np.exp(np.cumsum(rng.normal(0.005, 0.04, size=(N_SCENARIOS, N_ASSETS, HORIZON_PERIODS+1)), axis=2))
+prices_syms[:, :, 0] = 50
+income_syms = rng.normal(2000, 50, size=(N_SCENARIOS, HORIZON_PERIODS+1)).clip(0)
+expenses_syms = rng.normal(1600, 80, size=(N_SCENARIOS, HORIZON_PERIODS+1)).clip(0)
+
+t1 = time.time()
+mm = create_matrix_model(prices_syms, income_syms, expenses_syms, initial_cash=100_000, trade_fee=0.01, cvar_alpha=0.5, cvar_gamma=0.8)
+t2 = time.time()
+print(f"Matrix model with {mm.n_vars} variables, {mm.n_rows} rows and {mm.A.nnz} non zeros built in {t2-t1:.2f} s")
+
+# Objective check against the Pyomo model on a smaller problem
+result = compare_with_pyomo(prices_syms[:100, :5, :13], income_syms[:100, :13], expenses_syms[:100, :13], initial_cash=100_000, trade_fee=0.01, cvar_alpha=0.5, cvar_gamma=0.8, solver=SolverFactory('appsi_highs'))
+for k, v in result.items():
+    print(f"{k}: {v}")
@@ -0,0 +1,49 @@
+# Run from the repository root with: python -m development.benchmark_negative_cash_big_m
+import numpy as np
+import time
+import pyomo.environ as pe
+from pyomo.contrib import appsi
+
+from src.optimization.big_m import negative_cash_big_m, transform_indicators
+from src.optimization.instance_data import create_instance
+from src.optimization.model_factory import create_model
+
+N_SCENARIOS = 60
+HORIZON_PERIODS = 6
+N_ASSETS = 3
+INITIAL_CASH = 20_000
+
+rng = np.random.default_rng(42)
+prices_syms = 50*np.exp(np.cumsum(rng.normal(0.005, 0.04, size=(N_SCENARIOS, N_ASSETS, HORIZON_PERIODS+1)), axis=2))
+prices_syms[:, :, 0] = 50
+# Expenses above income, so that the negative cash chance constraint is binding
+income_syms = rng.normal(2000, 50, size=(N_SCENARIOS, HORIZON_PERIODS+1)).clip(0)
+expenses_syms = rng.normal(2600, 600, size=(N_SCENARIOS, HORIZON_PERIODS+1)).clip(0)
+non_cash_assets = [f'Asset{i}' for i in range(N_ASSETS)]
+params = dict(pInitialCashAllocations=INITIAL_CASH, pTradeFee=0.01, pCVaRAlpha=0.05, pCVaRGamma=0.3, pPropNegativeCash=0.1)
+
+big_m = negative_cash_big_m(prices_syms, income_syms, expenses_syms, INITIAL_CASH)
+legacy_big_m = np.full(big_m.shape, (HORIZON_PERIODS+1)*INITIAL_CASH, dtype=float)
+print(f"Big-M: legacy {legacy_big_m[0, 0]:.0f}, data-driven mean {big_m.mean():.0f} and max {big_m.max():.0f}")
+
+formulations = {
+    'legacy big-M': (create_model(negative_cash='chance'), {'pNegativeCashBigM': legacy_big_m}, None),
+    'data-driven big-M': (create_model(negative_cash='chance'), {}, None),
+    'indicator (gdp.bigm)': (create_model(negative_cash='chance', negative_cash_formulation='indicator'), {}, 'gdp.bigm'),
+    'indicator (gdp.hull)': (create_model(negative_cash='chance', negative_cash_formulation='indicator'), {}, 'gdp.hull'),
+}
+for name, (model, big_m_params, transformation) in formulations.items():
+    instance = create_instance(model, prices_syms, income_syms, expenses_syms, non_cash_assets, **params, **big_m_params)
+    if transformation is not None:
+        transform_indicators(instance, transformation)
+
+    # Root gap: distance between the LP relaxation and the integer optimum
+    relaxation = instance.clone()
+    pe.TransformationFactory('core.relax_integer_vars').apply_to(relaxation)
+    appsi.solvers.Highs().solve(relaxation)
+
+    t1 = time.time()
+    appsi.solvers.Highs().solve(instance)
+    t2 = time.time()
+    objective, relaxed_objective = pe.value(instance.f_obj), pe.value(relaxation.f_obj)
+    print(f"{name}: objective {objective:.2f}, LP relaxation {relaxed_objective:.2f}, root gap {100*(relaxed_objective - objective)/abs(objective):.2f}%, solved in {t2-t1:.2f} s")
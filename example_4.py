@@ -1,9 +1,11 @@
+import numpy as np
 import pandas as pd
 from development.synth_data import generate_synth_income, generate_synth_expenses
 from src.returns import LogNormalReturns
 from src.cashflows import NormalCashFlows
 from src.results import ResultsAnalyzer
 from src.optimization.om_continuous_cvar import create_model as create_model_continuous
+from src.optimization.instance_data import create_instance
 from pyomo.environ import SolverFactory
 from pyomo.opt.results import SolverStatus
 import time
@@ -13,12 +15,15 @@ print('Read prices')
 arr_income = generate_synth_income(mean=2000, std=50)
 arr_expenses = generate_synth_expenses(mean=1600, std=80)
 print('Read income and expenses')
-returns_model = LogNormalReturns()
+# Independent and reproducible random streams for every simulator, so that income and expenses
+# do not get the same noise
+returns_seed, income_seed, expenses_seed = np.random.SeedSequence(42).spawn(3)
+returns_model = LogNormalReturns(seed=returns_seed)
 returns_model.fit(df_prices=df_prices)
 print('Fitted returns')
-income_model = NormalCashFlows()
+income_model = NormalCashFlows(seed=income_seed)
 income_model.fit(cash_flow=arr_income)
-expenses_model = NormalCashFlows()
+expenses_model = NormalCashFlows(seed=expenses_seed)
 expenses_model.fit(cash_flow=arr_expenses)
 print('Fitted cashflows')
 N_SCENARIOS = 300 # The more scenarios the more accurate the solution but more difficult to solve
@@ -33,34 +38,14 @@ income_syms = income_model.predict(horizon=HORIZON_PERIODS, n_paths=N_SCENARIOS)
 expenses_syms = expenses_model.predict(horizon=HORIZON_PERIODS, n_paths=N_SCENARIOS) # Expenses are simulated
 print('Generated simulated paths')
 non_cash_assets = list(df_prices.columns)
-sScenarios = list(range(N_SCENARIOS))
-sInitialTime = [0]
-sIntermediateTime = list(range(1, HORIZON_PERIODS))
-sFinalTime = [HORIZON_PERIODS]
-sNonInitialTimes = sIntermediateTime + sFinalTime
-sNonFinalTimes = sInitialTime + sIntermediateTime
-sTime = sInitialTime + sIntermediateTime + sFinalTime
-
-data = {
-    None: {
-        'sInitialTime': {None: sInitialTime},
-        'sIntermediateTime': {None: sIntermediateTime},
-        'sFinalTime': {None: sFinalTime},
-        'sNonCashAssets': {None: non_cash_assets},
-        'sScenarios': {None: sScenarios},
-        'pPrices': {(s_i,non_cash_assets[a_i], t_i): prices_syms[s_i,a_i,t_i] for s_i in sScenarios for t_i in sTime for a_i in range(len(non_cash_assets))},
-        'pInitialNonCashAllocations': {a: 0 for a in non_cash_assets},
-        'pInitialCashAllocations': {None: STARTING_CASH},
-        'pIncome': {(s_i,t_i): income_syms[s_i, t_i] for s_i in sScenarios for t_i in sNonFinalTimes},
-        'pExpense': {(s_i,t_i): expenses_syms[s_i, t_i] for s_i in sScenarios for t_i in sNonFinalTimes},
-        'pTradeFee': {None: TRADING_FEE},
-        'pCVaRAlpha': {None: CVAR_ALPHA1},
-        'pCVaRGamma': {None: CVAR_GAMMA1},
-    }
-}
-
 optimization_model = create_model_continuous()
-instance = optimization_model.create_instance(data)
+instance = create_instance(
+    optimization_model, prices_syms, income_syms, expenses_syms, non_cash_assets,
+    pInitialCashAllocations=STARTING_CASH,
+    pTradeFee=TRADING_FEE,
+    pCVaRAlpha=CVAR_ALPHA1,
+    pCVaRGamma=CVAR_GAMMA1,
+)
 solver = SolverFactory('gurobi', solver_io="python")
 solver.options['TimeLimit'] = 300
 solver.options['NoRelHeurTime'] = 120
@@ -1,7 +1,9 @@
 from src.returns import LogNormalReturns
 from src.cashflows import NormalCashFlows, ZeroCashFlows
 from src.optimization.om_discrete_cvar import create_model
+from src.optimization.instance_data import create_instance
 from src.results import ResultsAnalyzer
+from src.cache import DiskCache, cached_fit, cached_predict
 
 from development.synth_data import generate_synth_prices, generate_synth_income, generate_synth_expenses
 import src.constants as cte
@@ -12,52 +14,38 @@ import time
 
 import pandas as pd
 
+# Fitted models and scenarios are reused across runs with the same inputs
+cache = DiskCache(cte.CACHE_DIR, max_size_mb=cte.CACHE_MAX_SIZE_MB)
+
+# Independent and reproducible random streams for every simulator
+returns_seed, income_seed, expenses_seed = np.random.SeedSequence(42).spawn(3)
+
 price_data = generate_synth_prices()
-returns_model = LogNormalReturns()
-returns_model.fit(price_data)
+returns_model = LogNormalReturns(seed=returns_seed)
+cached_fit(returns_model, price_data, cache)
 
 income_data = generate_synth_income()
-income_model = ZeroCashFlows()
-income_model.fit(income_data)
+income_model = ZeroCashFlows(seed=income_seed)
+cached_fit(income_model, income_data, cache)
 
 expenses_data = generate_synth_expenses()
-expenses_model = ZeroCashFlows()
-expenses_model.fit(expenses_data)
+expenses_model = ZeroCashFlows(seed=expenses_seed)
+cached_fit(expenses_model, expenses_data, cache)
 
 non_cash_assets = list(price_data.columns)
 
 
-prices_syms = returns_model.predict(horizon=cte.HORIZON_PERIODS, n_paths=cte.N_SCENARIOS, price_0=np.array([100,20]))
-income_syms = income_model.predict(horizon=cte.HORIZON_PERIODS, n_paths=cte.N_SCENARIOS)
-expenses_syms = expenses_model.predict(horizon=cte.HORIZON_PERIODS, n_paths=cte.N_SCENARIOS)
-sScenarios = list(range(cte.N_SCENARIOS))
-sInitialTime = [0]
-sIntermediateTime = list(range(1, cte.HORIZON_PERIODS))
-sFinalTime = [cte.HORIZON_PERIODS]
-sNonInitialTimes = sIntermediateTime + sFinalTime
-sNonFinalTimes = sInitialTime + sIntermediateTime
-sTime = sInitialTime + sIntermediateTime + sFinalTime
-
-data = {
-    None: {
-        'sInitialTime': {None: sInitialTime},
-        'sIntermediateTime': {None: sIntermediateTime},
-        'sFinalTime': {None: sFinalTime},
-        'sNonCashAssets': {None: non_cash_assets},
-        'sScenarios': {None: sScenarios},
-        'pPrices': {(s_i,non_cash_assets[a_i], t_i): prices_syms[s_i,a_i,t_i] for s_i in sScenarios for t_i in sTime for a_i in range(len(non_cash_assets))},
-        'pInitialNonCashAllocations': {a: 0 for a in non_cash_assets},
-        'pInitialCashAllocations': {None: cte.STARTING_CASH},
-        'pIncome': {(s_i,t_i): income_syms[s_i, t_i] for s_i in sScenarios for t_i in sNonFinalTimes},
-        'pExpense': {(s_i,t_i): expenses_syms[s_i, t_i] for s_i in sScenarios for t_i in sNonFinalTimes},
-        'pTradeFee': {None: cte.TRADING_FEE},
-        'pCVaRAlpha': {None: cte.CVAR_ALPHA},
-        'pCVaRGamma': {None: cte.CVAR_GAMMA},
-    }
-}
-
+prices_syms = cached_predict(returns_model, cache, horizon=cte.HORIZON_PERIODS, n_paths=cte.N_SCENARIOS, price_0=np.array([100,20]))
+income_syms = cached_predict(income_model, cache, horizon=cte.HORIZON_PERIODS, n_paths=cte.N_SCENARIOS)
+expenses_syms = cached_predict(expenses_model, cache, horizon=cte.HORIZON_PERIODS, n_paths=cte.N_SCENARIOS)
 optimization_model = create_model()
-instance = optimization_model.create_instance(data)
+instance = create_instance(
+    optimization_model, prices_syms, income_syms, expenses_syms, non_cash_assets,
+    pInitialCashAllocations=cte.STARTING_CASH,
+    pTradeFee=cte.TRADING_FEE,
+    pCVaRAlpha=cte.CVAR_ALPHA,
+    pCVaRGamma=cte.CVAR_GAMMA,
+)
 solver = SolverFactory('cbc')
 # solver = SolverFactory('clp')
 # solver = SolverFactory('glpk')
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+def hash_inputs(*objects):
+    """
+    SHA-256 of the content of the given objects (arrays, DataFrames, dicts, lists and scalars), used
+    as the key of the cached results computed from them.
+    """
+    h = hashlib.sha256()
+
+    def update(obj):
+        if isinstance(obj, (pd.DataFrame, pd.Series)):
+            h.update(b'pandas')
+            update(list(obj.columns) if isinstance(obj, pd.DataFrame) else obj.name)
+            h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        elif isinstance(obj, np.random.SeedSequence):
+            # Only what identifies the seed, the spawned children are part of the rng state
+            h.update(b'SeedSequence')
+            update(obj.entropy)
+            update(obj.spawn_key)
+        elif isinstance(obj, np.ndarray):
+            h.update(f'ndarray{obj.dtype.str}{obj.shape}'.encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+        elif isinstance(obj, dict):
+            h.update(b'dict')
+            for k in sorted(obj, key=repr):
+                update(k)
+                update(obj[k])
+        elif isinstance(obj, (list, tuple)):
+            h.update(f'{type(obj).__name__}{len(obj)}'.encode())
+            for item in obj:
+                update(item)
+        else:
+            h.update(repr(obj).encode())
+
+    for obj in objects:
+        update(obj)
+    return h.hexdigest()
+
+
+class DiskCache():
+    """
+    Content-addressed cache of dicts of NumPy arrays, each stored as a compressed .npz file named
+    after its key. When the total size goes over max_size_mb the least recently used entries are
+    evicted (file modification times are refreshed on every hit).
+    """
+    def __init__(self, path='.spopt_cache', max_size_mb=1024):
+        self.path = path
+        self.max_size = max_size_mb*2**20
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def get(self, key):
+        try:
+            with np.load(self._file(key)) as data:
+                arrays = {k: data[k] for k in data.files}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(self._file(key))
+        self.hits += 1
+        return arrays
+
+    def put(self, key, arrays):
+        # Written to a temporary file first so that an interrupted run never leaves a broken entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, self._file(key))
+        self._evict(keep=key)
+
+    def entries(self):
+        """
+        (key, size in bytes, last access time) of every entry, least recently used first.
+        """
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                entries.append((entry.name[:-len('.npz')], stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda e: e[2])
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def _evict(self, keep=None):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            os.remove(self._file(key))
+            total -= size
+
+    def clear(self):
+        for key, _, _ in self.entries():
+            os.remove(self._file(key))
+
+
+def _get_rng_state(model):
+    # The state of the seed sequence of the model is the number of simulation streams spawned
+    seed_sequence = getattr(model, 'seed_sequence', None)
+    if seed_sequence is None:
+        return {}
+    return {
+        'rng_entropy': np.array(json.dumps(seed_sequence.entropy)),
+        'rng_spawn_key': np.array(seed_sequence.spawn_key, dtype=np.int64),
+        'rng_n_children': np.array(seed_sequence.n_children_spawned),
+    }
+
+
+def _set_rng_state(model, arrays):
+    if 'rng_entropy' not in arrays:
+        return
+    model.seed_sequence = np.random.SeedSequence(
+        json.loads(str(arrays['rng_entropy'])),
+        spawn_key=tuple(int(k) for k in arrays['rng_spawn_key']),
+        n_children_spawned=int(arrays['rng_n_children']),
+    )
+
+
+def cached_fit(model, data, cache):
+    """
+    Fits the returns or cashflows model on data, or restores its fitted params (get_params and
+    set_params of the model) from the cache if it has already been fitted on the same data with the
+    same seed and settings (get_config).
+    """
+    key = hash_inputs('fit', type(model).__name__, model.seed, model.get_config(), data)
+    params = cache.get(key)
+    if params is None:
+        model.fit(data)
+        cache.put(key, model.get_params())
+    else:
+        model.set_params(params)
+    return model
+
+
+def cached_predict(model, cache, horizon, n_paths=1, **kwargs):
+    """
+    model.predict(horizon, n_paths, **kwargs) or the cached scenarios of a previous identical call.
+    The key includes the settings, fitted params, seed and state of the random stream of the model,
+    whose state after the call is restored on a hit, so that the following simulations do not change.
+    """
+    rng_state = _get_rng_state(model)
+    key = hash_inputs('predict', type(model).__name__, model.seed, model.get_config(), model.get_params(), rng_state, horizon, n_paths, kwargs)
+    arrays = cache.get(key)
+    if arrays is None:
+        scenarios = model.predict(horizon, n_paths, **kwargs)
+        cache.put(key, {'scenarios': scenarios, **_get_rng_state(model)})
+        return scenarios
+    _set_rng_state(model, arrays)
+    return arrays['scenarios']
@@ -1,26 +1,104 @@
-from scipy.stats import norm
 import numpy as np
 
+from src.moments import RunningMoments
+from src.returns.gaussian import CHUNK_ELEMENTS
+from src.sampling import BATCH_SAMPLING_METHODS, NormalSampler, PathDrawer, as_path_drawer, as_seed_sequence, path_chunks
+from src.scenarios.store import write_chunks
+
 class NormalCashFlows():
-    def __init__(self, seed=42):
+    def __init__(self, seed=42, sampling='random', decay=None):
         self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
+        self.sampling = sampling
+        self.decay = decay
+        self.moments = None
         self.cash_flow = None
         self.mean = None
         self.var = None
-        self.dist = None
 
     def fit(self, cash_flow):
         self.cash_flow = cash_flow
-        self.mean = np.mean(cash_flow)
-        self.var = np.var(cash_flow)
-        self.dist = norm(self.mean, self.var**.5)
+        self.moments = RunningMoments.from_data(np.ravel(cash_flow), decay=self.decay)
+        if self.decay is None:
+            self.mean = np.mean(cash_flow)
+            self.var = np.var(cash_flow)
+        else:
+            self.mean = self.moments.mean
+            self.var = self.moments.var()
+
+    def partial_fit(self, new_cash_flow):
+        """
+        Updates the mean and variance with new cashflow observations, in O(1) per observation. With
+        decay, older observations are exponentially down-weighted.
+        """
+        if self.moments is None:
+            raise ValueError("Model not fitted. Please use fit() method first.")
+        for value in np.ravel(new_cash_flow):
+            self.moments.update(value)
+        self.mean = self.moments.mean
+        self.var = self.moments.var()
+
+    def update(self, new_cash_flow):
+        self.partial_fit(new_cash_flow)
+
+    def get_config(self):
+        return {'sampling': self.sampling, 'decay': self.decay}
+
+    def get_params(self):
+        return {'mean': np.array(self.mean), 'var': np.array(self.var), 'weight': np.array(self.moments.weight), 'weight_sq': np.array(self.moments.weight_sq)}
+
+    def set_params(self, params):
+        self.mean = float(params['mean'])
+        self.var = float(params['var'])
+        self.moments = RunningMoments(decay=self.decay)
+        self.moments.weight = float(params['weight'])
+        self.moments.weight_sq = float(params['weight_sq'])
+        self.moments.mean = self.mean
+        self.moments.m2 = self.var*self.moments.weight
 
-    def predict(self, horizon, n_paths=1):
+    def set_seed(self, seed):
+        self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
+
+    def next_stream(self):
+        """
+        SeedSequence of the next simulation. Every simulation uses a new child of the seed, so
+        repeated calls give different but reproducible paths.
+        """
+        return self.seed_sequence.spawn(1)[0]
+
+    def simulate(self, stream, horizon, n_paths, start=0, stop=None, sampling=None, dtype=np.float64):
+        """
+        Paths start to stop of the simulation of n_paths paths with the stream (a SeedSequence from
+        next_stream, or a src.sampling.PathDrawer of it).
+        """
         if self.mean is None or self.var is None:
             raise ValueError("Model not fitted. Please use fit() method first.")
-        
+        stop = n_paths if stop is None else stop
+        method = self.sampling if sampling is None else sampling
+        drawer = as_path_drawer(stream, n_paths)
+        z = drawer.draw(start, stop, lambda rng: NormalSampler(horizon+1, method, rng).draw, method not in BATCH_SAMPLING_METHODS)
+        return np.clip(z*self.var**.5 + self.mean, 0, None).astype(dtype, copy=False)
+
+    def predict_chunks(self, horizon, n_paths=1, chunk_size=None, sampling=None, dtype=np.float64, stream=None):
+        """
+        Yields the simulated cashflows chunk_size paths at a time, with shape (chunk_size, horizon+1).
+        """
+        if chunk_size is None:
+            chunk_size = max(1, CHUNK_ELEMENTS//(horizon+1))
+        drawer = PathDrawer(self.next_stream() if stream is None else stream, n_paths)
+        for start, stop in path_chunks(n_paths, chunk_size):
+            yield self.simulate(drawer, horizon, n_paths, start, stop, sampling, dtype)
+
+    def predict(self, horizon, n_paths=1, sampling=None, stream=None):
         # Generate new cashflows for each path
-        cashflows = np.clip(self.dist.rvs(size=(n_paths, horizon+1),random_state=self.seed), 0, None)
+        cashflows = self.simulate(self.next_stream() if stream is None else stream, horizon, n_paths, sampling=sampling)
         
         return cashflows
 
+    def predict_to_file(self, path, horizon, n_paths=1, chunk_size=None, sampling=None, dtype=np.float64):
+        """
+        Writes the simulated cashflows chunk by chunk to a .npy file and returns it memory-mapped.
+        """
+        chunks = self.predict_chunks(horizon, n_paths, chunk_size, sampling, dtype)
+        return write_chunks(path, chunks, (n_paths, horizon+1), dtype)
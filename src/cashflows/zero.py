@@ -1,16 +1,47 @@
 import numpy as np
 
+from src.sampling import as_seed_sequence, path_chunks
+from src.scenarios.store import write_chunks
+
 class ZeroCashFlows():
     def __init__(self, seed=42):
         self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
         self.cash_flow = None
 
     def fit(self, cash_flow=None):
         self.cash_flow = cash_flow
 
-    def predict(self, horizon, n_paths=1):        
+    def get_config(self):
+        return {}
+
+    def get_params(self):
+        return {}
+
+    def set_params(self, params):
+        pass
+
+    def set_seed(self, seed):
+        self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
+
+    def next_stream(self):
+        return self.seed_sequence.spawn(1)[0]
+
+    def simulate(self, stream, horizon, n_paths, start=0, stop=None, sampling=None, dtype=np.float64):
+        stop = n_paths if stop is None else stop
+        return np.zeros(shape=(stop-start, horizon+1), dtype=dtype)
+
+    def predict_chunks(self, horizon, n_paths=1, chunk_size=None, sampling=None, dtype=np.float64, stream=None):
+        for start, stop in path_chunks(n_paths, chunk_size):
+            yield np.zeros(shape=(stop-start, horizon+1), dtype=dtype)
+
+    def predict(self, horizon, n_paths=1, sampling=None, stream=None):
         # Generate new prices for each path
         cashflows = np.zeros(shape=(n_paths, horizon+1))
         
         return cashflows
 
+    def predict_to_file(self, path, horizon, n_paths=1, chunk_size=None, sampling=None, dtype=np.float64):
+        chunks = self.predict_chunks(horizon, n_paths, chunk_size, sampling, dtype)
+        return write_chunks(path, chunks, (n_paths, horizon+1), dtype)
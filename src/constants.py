@@ -3,4 +3,6 @@ HORIZON_PERIODS = 5
 STARTING_CASH = 10_000
 TRADING_FEE = 0.001
 CVAR_ALPHA = 0.1
-CVAR_GAMMA = 0.5
\ No newline at end of file
+CVAR_GAMMA = 0.5
+CACHE_DIR = '.spopt_cache'
+CACHE_MAX_SIZE_MB = 1024
\ No newline at end of file
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class RunningMoments():
+    """
+    Running mean and covariance (or variance, for 1-dimensional data) updated one observation at a
+    time with Welford's algorithm, in O(dim^2) per observation. With decay (0 < decay < 1) the
+    weight of the previous observations is multiplied by decay on every update, which gives
+    exponentially weighted moments.
+    """
+    def __init__(self, dim=None, decay=None):
+        if decay is not None and not 0 < decay <= 1:
+            raise ValueError(f"decay should be in (0, 1], got {decay}")
+        self.dim = dim
+        self.decay = decay
+        self.weight = 0.
+        self.weight_sq = 0.
+        self.mean = None if dim is None else np.zeros(dim)
+        self.m2 = None if dim is None else np.zeros((dim, dim))
+
+    @classmethod
+    def from_data(cls, data, decay=None, mean=None, cov=None):
+        """
+        Moments of the rows of data (n_obs, dim) or of a 1-dimensional series. Already computed
+        unweighted mean and covariance can be passed to avoid computing them again.
+        """
+        data = np.asarray(data, dtype=float)
+        scalar = data.ndim == 1
+        data = data.reshape(len(data), -1)
+        n = len(data)
+        moments = cls(None if scalar else data.shape[1], decay)
+        weights = np.ones(n) if decay is None else decay**np.arange(n-1, -1, -1)
+        moments.weight = weights.sum()
+        moments.weight_sq = (weights**2).sum()
+        if decay is None and mean is not None and cov is not None:
+            moments.mean = np.asarray(mean, dtype=float).reshape(-1)
+            moments.m2 = np.asarray(cov, dtype=float).reshape(len(moments.mean), -1)*moments._cov_denominator()
+        else:
+            moments.mean = weights@data/moments.weight
+            deviations = data - moments.mean
+            moments.m2 = (deviations*weights[:, None]).T@deviations
+        if scalar:
+            moments.mean = moments.mean[0]
+            moments.m2 = moments.m2[0, 0]
+        return moments
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float).reshape(np.shape(self.mean))
+        if self.decay is not None:
+            self.weight *= self.decay
+            self.weight_sq *= self.decay**2
+            self.m2 = self.m2*self.decay
+        self.weight += 1
+        self.weight_sq += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta/self.weight
+        self.m2 = self.m2 + np.multiply.outer(delta, x - self.mean)
+
+    def _cov_denominator(self):
+        # Unbiased for reliability weights, which is n-1 without decay
+        return self.weight - self.weight_sq/self.weight
+
+    def cov(self):
+        return self.m2/self._cov_denominator()
+
+    def var(self):
+        # Population variance, as np.var
+        return self.m2/self.weight
@@ -0,0 +1,195 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from pyomo.contrib import appsi
+
+from src.cashflows import NormalCashFlows, ZeroCashFlows
+from src.optimization.policy_evaluation import PolicyEvaluator
+from src.optimization.rolling_horizon import RollingHorizonSolver
+from src.returns import LogNormalReturns
+from src.sampling import as_seed_sequence
+
+logger = logging.getLogger(__name__)
+
+
+class Backtest():
+    """
+    Walks the rebalancing dates of a price history running the Model Predictive Control loop: at
+    every date the returns (and cashflow) models are refitted on the trailing window, scenarios are
+    simulated from the current prices, the om_* model is solved and only its first period trades are
+    executed at the actual prices. The portfolio is then carried to the next rebalancing date with
+    the actual prices, income and expenses (see PolicyEvaluator).
+        create_model: create_model function of an om_* module without pCashReturns (or a picklable
+            equivalent)
+        window: number of prices the models are fitted on
+        initial_cash, initial_non_cash: allocations at the first rebalancing date
+        income, expenses: actual cashflows of every period of df_prices, 0 if not given
+        start, end: positions in df_prices of the first rebalancing date and of the last price
+        solver: callable returning a (persistent) solver, appsi Highs by default
+    Extra keyword arguments are scalar params of the model (pTradeFee, pCVaRAlpha...).
+    With a checkpoint directory, every step is appended to <checkpoint_dir>/<name>.jsonl as soon as
+    it is done, and an interrupted backtest resumes from its last step.
+    """
+    def __init__(self, name, create_model, df_prices, window, horizon, n_scenarios, initial_cash, initial_non_cash=None, income=None,
+                 expenses=None, rebalance_every=1, start=None, end=None, seed=42, returns_model=LogNormalReturns, solver=None, warm_start=True, **params):
+        self.name = name
+        self.create_model = create_model
+        self.df_prices = df_prices
+        self.window = window
+        self.horizon = horizon
+        self.n_scenarios = n_scenarios
+        self.initial_cash = initial_cash
+        self.initial_non_cash = np.zeros(df_prices.shape[1]) if initial_non_cash is None else np.asarray(initial_non_cash, dtype=float)
+        self.income = np.zeros(len(df_prices)) if income is None else np.asarray(income, dtype=float)
+        self.expenses = np.zeros(len(df_prices)) if expenses is None else np.asarray(expenses, dtype=float)
+        self.has_cashflows = income is not None or expenses is not None
+        self.rebalance_every = rebalance_every
+        self.start = window - 1 if start is None else max(start, window - 1)
+        self.end = len(df_prices) - 1 if end is None else min(end, len(df_prices) - 1)
+        self.seed = seed
+        self.returns_model = returns_model
+        self.solver = solver if solver is not None else appsi.solvers.Highs
+        self.warm_start = warm_start
+        self.params = params
+        self._driver = None
+
+    def _checkpoint_path(self, checkpoint_dir):
+        return None if checkpoint_dir is None else os.path.join(checkpoint_dir, self.name + '.jsonl')
+
+    def _load_checkpoint(self, path):
+        if path is None or not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _cashflow_model(self, values, seed):
+        model = NormalCashFlows(seed=seed) if self.has_cashflows else ZeroCashFlows(seed=seed)
+        model.fit(values)
+        return model
+
+    def _step(self, step, position, cash, holdings):
+        timings = {}
+        t1 = time.perf_counter()
+        window = slice(position - self.window + 1, position + 1)
+        # Every step has its own seeds, so that a resumed backtest simulates the same scenarios
+        step_seed = as_seed_sequence(self.seed)
+        returns_seed, income_seed, expenses_seed = np.random.SeedSequence(step_seed.entropy, spawn_key=step_seed.spawn_key + (step,)).spawn(3)
+        returns_model = self.returns_model(seed=returns_seed)
+        returns_model.fit(self.df_prices.iloc[window])
+        income_model = self._cashflow_model(self.income[window], income_seed)
+        expenses_model = self._cashflow_model(self.expenses[window], expenses_seed)
+        timings['fit'] = time.perf_counter() - t1
+
+        t1 = time.perf_counter()
+        prices_syms = returns_model.predict(self.horizon, self.n_scenarios)
+        income_syms = income_model.predict(self.horizon, self.n_scenarios)
+        expenses_syms = expenses_model.predict(self.horizon, self.n_scenarios)
+        timings['simulate'] = time.perf_counter() - t1
+
+        if cash < 0:
+            logger.warning(f"{self.name}: cash is negative ({cash:.2f}) at position {position}, the model starts from 0 cash")
+        output = self._driver.step(prices_syms, income_syms, expenses_syms, max(cash, 0.), holdings)
+        timings['build'] = output['timing']['update_time']
+        timings['solve'] = output['timing']['solve_time']
+        termination = str(output['results'].termination_condition)
+
+        t1 = time.perf_counter()
+        trades = np.zeros(len(holdings))
+        if 'optimal' in termination:
+            trades = np.nan_to_num(np.array(output['non_cash_trades'], dtype=float))
+            if 0.5 not in self._driver.instance.pInitialNonCashAllocations.domain:
+                # Models taking whole initial holdings are executed in whole units, rounded towards
+                # 0 so that no more is bought than planned nor more sold than held
+                trades = np.trunc(np.round(trades, 6))
+        # The trades are executed at the current prices and the portfolio is carried to the next
+        # rebalancing date with the actual prices and cashflows
+        periods = min(self.rebalance_every, self.end - position)
+        schedule = np.zeros((len(holdings), periods))
+        schedule[:, 0] = trades
+        evaluator = PolicyEvaluator(schedule, holdings, cash, self.params.get('pTradeFee', 0.))
+        actual = slice(position, position + periods + 1)
+        replay = evaluator.evaluate(
+            self.df_prices.to_numpy(dtype=float).T[None, :, actual],
+            self.income[None, actual],
+            self.expenses[None, actual],
+            return_paths=True,
+        )
+        timings['execute'] = time.perf_counter() - t1
+
+        return {
+            'step': step,
+            'position': position,
+            'date': str(self.df_prices.index[position]),
+            'termination_condition': termination,
+            'objective': output['objective'] if 'optimal' in termination else None,
+            'wealth': float(replay['total_wealth'][0, 0]),
+            'trades': trades.tolist(),
+            'fees': float(replay['fees'][0, 0]),
+            'next_position': position + periods,
+            'next_wealth': float(replay['total_wealth'][0, -1]),
+            'cash': float(replay['cash'][0, -1]),
+            'holdings': (holdings + trades).tolist(),
+            **{f'time_{k}': v for k, v in timings.items()},
+            'time_total': sum(timings.values()),
+        }
+
+    def run(self, checkpoint_dir=None):
+        """
+        Runs (or resumes) the backtest and returns a DataFrame with one row per rebalancing date:
+        wealth before and after the period, executed trades, fees, holdings, solver termination and
+        the time of every stage of the step (fit, simulate, build, solve, execute).
+        """
+        path = self._checkpoint_path(checkpoint_dir)
+        if path is not None:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        records = self._load_checkpoint(path)
+        if records:
+            step = records[-1]['step'] + 1
+            position = records[-1]['next_position']
+            cash = records[-1]['cash']
+            holdings = np.array(records[-1]['holdings'])
+            logger.info(f"{self.name}: resuming at step {step} from {path}")
+        else:
+            step, position, cash = 0, self.start, float(self.initial_cash)
+            holdings = self.initial_non_cash
+
+        # The instance is built on the first step and then only updated and re-solved (see
+        # RollingHorizonSolver), as horizon and number of scenarios are the same on every step
+        self._driver = RollingHorizonSolver(self.create_model(), self.df_prices.columns, self.solver(), self.warm_start, **self.params)
+        while position < self.end:
+            record = self._step(step, position, cash, holdings)
+            records.append(record)
+            if path is not None:
+                with open(path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+            logger.info(f"{self.name}: step {step} ({record['date']}) solved in {record['time_solve']:.2f}s, wealth {record['next_wealth']:.2f}")
+            step, position, cash = step + 1, record['next_position'], record['cash']
+            holdings = np.array(record['holdings'])
+        return pd.DataFrame(records)
+
+
+def _run(args):
+    backtest, checkpoint_dir = args
+    return backtest.name, backtest.run(checkpoint_dir)
+
+
+def run_backtests(backtests, n_workers=None, checkpoint_dir=None):
+    """
+    Runs independent backtests (e.g. strategy configurations, or windows of the history with their
+    own start and end) with a pool of n_workers processes. Returns a dict name -> results DataFrame.
+    """
+    names = [backtest.name for backtest in backtests]
+    if len(set(names)) != len(names):
+        raise ValueError("Backtest names should be unique, as they name the checkpoint files")
+    tasks = [(backtest, checkpoint_dir) for backtest in backtests]
+    if n_workers == 1 or len(tasks) <= 1:
+        results = [_run(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(n_workers) as executor:
+            results = list(executor.map(_run, tasks))
+    return dict(results)
@@ -0,0 +1,119 @@
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pe
+from pyomo.contrib import appsi
+
+from src.optimization.instance_data import create_instance, update_instance
+
+logger = logging.getLogger(__name__)
+
+# Template instance of the current process, built once by _init_worker and re-used by every client
+_worker = {}
+
+
+def _init_worker(create_model, prices_syms, non_cash_assets, cash_returns_syms, scenario_probabilities, solver, params):
+    t1 = time.perf_counter()
+    n_scenarios, n_assets, n_times = np.shape(prices_syms)
+    zeros = np.zeros((n_scenarios, n_times))
+    instance = create_instance(
+        create_model(), prices_syms, zeros, zeros, non_cash_assets, cash_returns_syms, scenario_probabilities,
+        **{'pInitialCashAllocations': 0., **params},
+    )
+    # Values every client starts from, so that params set by a client do not leak into the next one
+    defaults = {
+        param.local_name: pe.value(param)
+        for param in instance.component_objects(pe.Param)
+        if param.mutable and not param.is_indexed()
+    }
+    defaults['pInitialNonCashAllocations'] = np.zeros(n_assets)
+    _worker.update({
+        'instance': instance,
+        'solver': solver() if solver is not None else appsi.solvers.Highs(),
+        'defaults': defaults,
+        'zeros': zeros,
+        'non_cash_assets': list(non_cash_assets),
+        'probabilities': np.full(n_scenarios, 1/n_scenarios) if scenario_probabilities is None else np.asarray(scenario_probabilities, dtype=float),
+        'template_time': time.perf_counter() - t1,
+    })
+    # Clients that can not be solved are recorded instead of stopping the batch
+    if hasattr(_worker['solver'], 'config') and hasattr(_worker['solver'].config, 'load_solution'):
+        _worker['solver'].config.load_solution = False
+
+
+def _solve_client(args):
+    name, client = args
+    instance, solver = _worker['instance'], _worker['solver']
+    client = dict(client)
+    income_syms = client.pop('income_syms', None)
+    expenses_syms = client.pop('expenses_syms', None)
+    row = {'client': name, 'pid': os.getpid(), 'template_time': _worker.pop('template_time', 0.), 'error': None}
+
+    t1 = time.perf_counter()
+    try:
+        update_instance(
+            instance,
+            income_syms=_worker['zeros'] if income_syms is None else income_syms,
+            expenses_syms=_worker['zeros'] if expenses_syms is None else expenses_syms,
+            **{**_worker['defaults'], **client},
+        )
+        row['update_time'] = time.perf_counter() - t1
+        t1 = time.perf_counter()
+        results = solver.solve(instance)
+        row['solve_time'] = time.perf_counter() - t1
+        row['termination_condition'] = str(results.termination_condition)
+        if results.best_feasible_objective is None:
+            row['error'] = f"No feasible solution ({row['termination_condition']})"
+        else:
+            results.solution_loader.load_vars()
+            t_final = instance.sFinalTime.first()
+            final_wealth = np.array([instance.vTotalWealth[s, t_final].value for s in instance.sScenarios], dtype=float)
+            row.update({
+                'objective': pe.value(instance.f_obj),
+                'expected_wealth': _worker['probabilities']@final_wealth,
+                'trades': np.array([[instance.vNonCashTrades[a, t].value for t in instance.sNonFinalTime] for a in _worker['non_cash_assets']], dtype=float),
+            })
+    except Exception as e:
+        row['error'] = repr(e)
+        logger.warning(f"Client {name} failed: {row['error']}")
+    return row
+
+
+def solve_clients(create_model, clients, prices_syms, non_cash_assets, cash_returns_syms=None, scenario_probabilities=None,
+                  solver=None, n_workers=None, **params):
+    """
+    Solves an om_* model for many clients that share the asset universe and the price scenarios
+    (simulated once by the caller), but differ in their allocations, cashflows and risk params.
+        clients: dict name -> dict of client data, with optional income_syms and expenses_syms
+            arrays (n_scenarios, horizon+1), 0 if not given, and any mutable scalar params
+            (pInitialCashAllocations, pInitialNonCashAllocations, pCVaRGamma...)
+        params: params shared by all the clients, which they can override
+        solver: callable returning a (persistent) solver, appsi Highs by default
+    Each of the n_workers processes builds a template instance once and then, for every client it
+    gets, only overwrites the mutable params (see instance_data.update_instance) before re-solving.
+    Returns a DataFrame with one row per client: termination condition, objective, expected final
+    wealth, the trades (n_assets, horizon) array, the error if the client could not be solved, and
+    the time to build the template (first client of every worker), update and solve.
+    """
+    tasks = list(clients.items())
+    n_workers = min(len(tasks), n_workers or os.cpu_count() or 1)
+    initargs = (create_model, prices_syms, non_cash_assets, cash_returns_syms, scenario_probabilities, solver, params)
+    if n_workers <= 1:
+        _init_worker(*initargs)
+        try:
+            rows = [_solve_client(task) for task in tasks]
+        finally:
+            _worker.clear()
+    else:
+        # Scenarios and template are sent to and built in every worker once, not once per client
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=initargs) as executor:
+            rows = list(executor.map(_solve_client, tasks, chunksize=max(1, len(tasks)//(4*n_workers))))
+    df = pd.DataFrame(rows)
+    n_failed = df['error'].notna().sum()
+    if n_failed:
+        logger.warning(f"{n_failed} of {len(df)} clients could not be solved")
+    return df
@@ -0,0 +1,56 @@
+import numpy as np
+import pyomo.environ as pe
+
+
+def negative_cash_big_m(prices_syms, income_syms, expenses_syms, initial_cash, initial_non_cash=None, minimum_cash=0., cash_returns_syms=None):
+    """
+    (n_scenarios, horizon+1) big-M of c14_count_negative_scenarios in the om_*_negativecash models,
+    i.e. valid upper bounds of pMinimumCash - vCashAllocations[s,t] over every feasible solution:
+        - total wealth is non negative, so -vCashAllocations[s,t] is at most the value of the
+          holdings at the prices of s
+        - while pPropNegativeCash < 1 some scenario s* keeps its cash above pMinimumCash at all
+          times, so its wealth can not grow faster than its best asset (or cash) every period:
+              W[s*,t+1] <= g[s*,t]*(W[s*,t] + income - expenses)
+          and the holdings are worth at most W[s*,t] - pMinimumCash at the prices of s*
+        - the holdings are the same in every scenario, so their value at the prices of s is at
+          most max_a p[s,a,t]*max_s* (W[s*,t] - pMinimumCash)/p[s*,a,t]
+    The bounds do not hold when pPropNegativeCash >= 1, as every scenario can then go below
+    pMinimumCash. Prices should be positive. The bounds are usually far below n_times*pInitialCashAllocations
+    and, unlike it, do not depend on the cashflows being small compared to the initial cash.
+    """
+    prices = np.asarray(prices_syms, dtype=float)
+    n_scenarios, n_assets, n_times = prices.shape
+    if np.any(prices <= 0):
+        raise ValueError("Prices should be positive to bound the negative cash")
+    initial_non_cash = np.zeros(n_assets) if initial_non_cash is None else np.asarray(initial_non_cash, dtype=float)
+    flows = np.asarray(income_syms, dtype=float)[:, :n_times-1] - np.asarray(expenses_syms, dtype=float)[:, :n_times-1]
+
+    # Largest growth factor of a long only portfolio every period
+    growth = (prices[:, :, 1:]/prices[:, :, :-1]).max(axis=1)
+    growth = np.maximum(growth, 1. if cash_returns_syms is None else np.asarray(cash_returns_syms, dtype=float)[:, :n_times-1])
+    wealth = np.empty((n_scenarios, n_times))
+    wealth[:, 0] = initial_cash + prices[:, :, 0]@initial_non_cash
+    for t in range(1, n_times):
+        wealth[:, t] = growth[:, t-1]*np.maximum(wealth[:, t-1] + flows[:, t-1], 0)
+
+    # (n_assets, n_times) largest number of units of every asset the holdings can be worth
+    units = (np.maximum(wealth - minimum_cash, 0)[:, None, :]/prices).max(axis=0)
+    big_m = minimum_cash + (prices*units[None]).max(axis=1)
+    big_m[:, 0] = minimum_cash - initial_cash
+    return np.maximum(big_m, 0)
+
+
+def transform_indicators(instance, method='gdp.bigm'):
+    """
+    Reformulates in place the disjunctions of an instance built with
+    model_factory.create_model(negative_cash='chance', negative_cash_formulation='indicator'):
+        'gdp.bigm': big-M constraints with the bounds of vNegativeCashAllocations, i.e. the
+            pNegativeCashBigM values at the time of the transformation
+        'gdp.hull': convex hull reformulation, tighter but larger
+        'gdp.binary_multiplication': vNegativeCashAllocations[s,t]*binary >= 0, which solvers with
+            indicator or bilinear binary support (Gurobi, SCIP) handle without any big-M
+    The big-M of the instance can not be changed afterwards, so instance_data.update_instance
+    refuses new scenarios, allocations or negative cash params on a transformed instance.
+    """
+    pe.TransformationFactory(method).apply_to(instance)
+    return instance
@@ -0,0 +1,218 @@
+import logging
+import time
+
+import numpy as np
+import pyomo.environ as pe
+from pyomo.contrib import appsi
+from pyomo.core.expr.visitor import identify_variables
+
+logger = logging.getLogger(__name__)
+
+UPDATE_FLAGS = (
+    'check_for_new_or_removed_constraints', 'check_for_new_or_removed_vars', 'check_for_new_or_removed_params', 'check_for_new_objective',
+    'update_constraints', 'update_vars', 'update_params', 'update_named_expressions', 'update_objective',
+)
+
+
+def find_cvar_blocks(instance):
+    """
+    Returns one dict per CVaR term (vCVaR, vCVaR1, vCVaR2...) of an om_* instance with its
+    vVaR/vCVaR variables and alpha/gamma params. Terms of the per scenario loss formulation also
+    have their vLoss variable and loss and CVaR definition constraints, while the ones already in cut
+    form (model_factory with cvar_cuts) have their vExcess variable and cCVaRCuts list.
+    """
+    constraints = [c for c in instance.component_objects(pe.Constraint, active=True) if len(c) > 0]
+    blocks = []
+    for cvar in list(instance.component_objects(pe.Var)):
+        if not cvar.local_name.startswith('vCVaR'):
+            continue
+        suffix = cvar.local_name[len('vCVaR'):]
+        block = {
+            'suffix': suffix,
+            'cvar': cvar,
+            'var': getattr(instance, 'vVaR'+suffix),
+            'alpha': getattr(instance, 'pCVaRAlpha'+suffix),
+            'gamma': getattr(instance, 'pCVaRGamma'+suffix),
+            'loss': getattr(instance, 'vLoss'+suffix, None),
+            'excess': getattr(instance, 'vExcess'+suffix, None),
+            'cuts': getattr(instance, 'cCVaRCuts'+suffix, None),
+        }
+        if block['loss'] is not None:
+            for c in constraints:
+                if not any(v.parent_component() is block['loss'] for v in identify_variables(next(c.values()).body)):
+                    continue
+                if c.dim() == 2:
+                    block['loss_constraint'] = c
+                else:
+                    block['cvar_constraint'] = c
+        blocks.append(block)
+    return blocks
+
+
+class CVaRCuttingPlane():
+    """
+    Solves the CVaR om_* models with the aggregated cut formulation of Künzi-Bay & Mayer instead of
+    one loss variable and constraint per scenario. Each CVaR term is written as
+        vCVaR[t] = vVaR[t] + 1/alpha*vExcess[t]
+        vExcess[t] >= sum(p[s]*(-vVaR[t] - vTotalWealth[s,t]) for s in J)    for the generated J
+    The instance is modified in place (the vLoss constraints are deactivated) and re-solved, adding
+    for every term the cut of the scenarios in the tail of the current solution, until no cut is
+    violated. Blocks with a zero gamma when the solver is created keep their loss formulation.
+    With relax_first, the cuts of the discrete models are first generated on the LP relaxation, so
+    that the MIP is only re-solved a few times at the end. tail_multiples adds, besides the tail
+    cut, the cuts of the worst scenarios up to each multiple of alpha.
+    """
+    def __init__(self, instance, solver=None, tol=1e-6, max_iter=200, relax_first=True, tail_multiples=(1,)):
+        self.instance = instance
+        self.solver = solver if solver is not None else appsi.solvers.Highs()
+        self.tol = tol
+        self.max_iter = max_iter
+        self.relax_first = relax_first
+        self.tail_multiples = tail_multiples
+        self.blocks = [block for block in find_cvar_blocks(instance) if pe.value(block['gamma']) != 0]
+        if not self.blocks:
+            raise ValueError("The instance has no CVaR terms with a non zero gamma")
+        self.n_iterations = 0
+        self.n_cuts = 0
+        self.timings = []
+        self._new_cuts = []
+        self._convert()
+
+    def _convert(self):
+        instance = self.instance
+        for block in self.blocks:
+            if block['excess'] is not None:
+                continue
+            suffix = block['suffix']
+            block['loss_constraint'].deactivate()
+            block['cvar_constraint'].deactivate()
+            excess = pe.Var(instance.sFinalTime, domain=pe.NonNegativeReals, initialize=0)
+            instance.add_component('vExcess'+suffix, excess)
+
+            def cvar_definition(model, t, block=block, excess=excess):
+                return block['cvar'][t] == block['var'][t] + 1/block['alpha']*excess[t]
+            instance.add_component('cCVaRCutDefinition'+suffix, pe.Constraint(instance.sFinalTime, rule=cvar_definition))
+            cuts = pe.ConstraintList()
+            instance.add_component('cCVaRCuts'+suffix, cuts)
+            block['excess'] = excess
+            block['cuts'] = cuts
+            # Cut of the whole scenario set, which together with vExcess >= 0 keeps the first
+            # problem bounded: vCVaR >= -expected wealth
+            for t in instance.sFinalTime:
+                self._add_cut(block, t, list(instance.sScenarios))
+
+    def _add_cut(self, block, t, scenarios):
+        instance = self.instance
+        p = instance.pScenarioProbability
+        cut = block['cuts'].add(block['excess'][t] >= -sum(p[s] for s in scenarios)*block['var'][t] - sum(p[s]*instance.vTotalWealth[s,t] for s in scenarios))
+        self._new_cuts.append(cut)
+        self.n_cuts += 1
+
+    def _separate(self):
+        instance = self.instance
+        scenarios = list(instance.sScenarios)
+        p = np.array([pe.value(instance.pScenarioProbability[s]) for s in scenarios])
+        n_added = 0
+        for block in self.blocks:
+            if pe.value(block['gamma']) == 0:
+                continue
+            for t in instance.sFinalTime:
+                wealth = np.array([instance.vTotalWealth[s,t].value for s in scenarios])
+                losses = -block['var'][t].value - wealth
+                tail = losses > 0
+                excess = p[tail]@losses[tail]
+                if excess - block['excess'][t].value <= self.tol*max(1, abs(excess)):
+                    continue
+                self._add_cut(block, t, [scenarios[i] for i in np.flatnonzero(tail)])
+                n_added += 1
+                # Cuts of the worst scenarios up to (multiples of) alpha are tight at the optimal VaR
+                # of the current wealths and save iterations
+                order = np.argsort(losses)[::-1]
+                cumulative = np.cumsum(p[order])
+                for multiple in self.tail_multiples:
+                    k = min(np.searchsorted(cumulative, multiple*pe.value(block['alpha']) - 1e-12) + 1, len(order))
+                    if k != tail.sum():
+                        self._add_cut(block, t, [scenarios[i] for i in order[:k]])
+                        n_added += 1
+        return n_added
+
+    def _fill_losses(self):
+        # The per scenario losses are not part of the problem anymore, but are kept up to date
+        for block in self.blocks:
+            if block['loss'] is None:
+                continue
+            for s, t in block['loss']:
+                block['loss'][s,t].set_value(max(0, -block['var'][t].value - self.instance.vTotalWealth[s,t].value), skip_validation=True)
+
+    def _solve(self, full_update):
+        config = getattr(self.solver, 'update_config', None)
+        if config is None or full_update:
+            self._new_cuts = []
+            return self.solver.solve(self.instance)
+        # Between iterations only cuts are added, so the persistent solver is given them directly
+        # instead of checking the whole model for changes
+        flags = {name: getattr(config, name) for name in UPDATE_FLAGS}
+        for name in UPDATE_FLAGS:
+            setattr(config, name, False)
+        try:
+            self.solver.add_constraints(self._new_cuts)
+            self._new_cuts = []
+            return self.solver.solve(self.instance)
+        finally:
+            for name, value in flags.items():
+                setattr(config, name, value)
+
+    def _cut_loop(self, relaxed):
+        results = None
+        for i in range(self.max_iter):
+            t1 = time.time()
+            results = self._solve(full_update=i == 0)
+            t2 = time.time()
+            n_added = self._separate()
+            t3 = time.time()
+            self.n_iterations += 1
+            self.timings.append({'iteration': self.n_iterations, 'relaxed': relaxed, 'solve_time': t2 - t1, 'separation_time': t3 - t2, 'n_cuts_added': n_added})
+            logger.info(f"Iteration {self.n_iterations}{' (relaxed)' if relaxed else ''}: solved in {t2-t1:.2f} s, {n_added} cuts added")
+            if n_added == 0:
+                break
+        else:
+            logger.warning(f"CVaR cuts still violated after {self.max_iter} iterations")
+        return results
+
+    def solve(self):
+        discrete = any(v.is_integer() for v in self.instance.component_data_objects(pe.Var, active=True))
+        if self.relax_first and discrete:
+            relax = pe.TransformationFactory('core.relax_integer_vars')
+            relax.apply_to(self.instance)
+            try:
+                self._cut_loop(relaxed=True)
+            finally:
+                relax.apply_to(self.instance, undo=True)
+        results = self._cut_loop(relaxed=False)
+        self._fill_losses()
+        return results
+
+
+def compare_with_full_model(instance_full, instance_cuts, solver_factory=None, tol=1e-6):
+    """
+    Solves the same problem with the per scenario loss formulation and with the cutting plane
+    one, each instance with a fresh solver from solver_factory(), and reports objectives and times.
+    """
+    solver_factory = solver_factory if solver_factory is not None else appsi.solvers.Highs
+    t1 = time.time()
+    solver_factory().solve(instance_full)
+    t2 = time.time()
+    cutting_plane = CVaRCuttingPlane(instance_cuts, solver=solver_factory(), tol=tol)
+    cutting_plane.solve()
+    t3 = time.time()
+    full_objective = pe.value(instance_full.f_obj)
+    cuts_objective = pe.value(instance_cuts.f_obj)
+    return {
+        'full_objective': full_objective,
+        'cuts_objective': cuts_objective,
+        'relative_difference': abs(full_objective - cuts_objective)/max(1, abs(full_objective)),
+        'full_time': t2 - t1,
+        'cuts_time': t3 - t2,
+        'n_iterations': cutting_plane.n_iterations,
+        'n_cuts': cutting_plane.n_cuts,
+    }
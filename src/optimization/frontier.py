@@ -0,0 +1,108 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pe
+from pyomo.contrib import appsi
+
+from src.optimization.instance_data import create_instance, update_instance
+from src.optimization.policy_evaluation import cvar
+from src.optimization.rolling_horizon import solve_warm
+
+logger = logging.getLogger(__name__)
+
+
+def frontier_grid(alphas, gammas):
+    """
+    (alpha, gamma) points of the grid in serpentine order: gamma goes up for the first alpha, down
+    for the second one and so on, so that consecutive points differ in a single param and every solve
+    starts from the solution of a neighbour.
+    """
+    gammas = list(gammas)
+    return [(alpha, gamma) for i, alpha in enumerate(alphas) for gamma in (gammas if i % 2 == 0 else gammas[::-1])]
+
+
+def frontier_sweep(create_model, points, prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms=None,
+                   scenario_probabilities=None, suffix='', solver=None, warm_start=True, **params):
+    """
+    Solves the points of the frontier in the given order on a single instance: it is built once and
+    then only pCVaRAlpha<suffix> and pCVaRGamma<suffix> are overwritten before every re-solve with a
+    persistent solver, which keeps the previous basis and gets the previous values as MIP start (see
+    rolling_horizon.solve_warm). Returns one row per point, see efficient_frontier.
+    """
+    solver = solver() if solver is not None else appsi.solvers.Highs()
+    # Points that can not be solved are recorded instead of stopping the sweep
+    if hasattr(solver, 'config') and hasattr(solver.config, 'load_solution'):
+        solver.config.load_solution = False
+    non_cash_assets = list(non_cash_assets)
+    alpha_name, gamma_name = 'pCVaRAlpha'+suffix, 'pCVaRGamma'+suffix
+    n_scenarios = np.shape(prices_syms)[0]
+    probabilities = np.full(n_scenarios, 1/n_scenarios) if scenario_probabilities is None else np.asarray(scenario_probabilities, dtype=float)
+
+    t1 = time.perf_counter()
+    instance = create_instance(
+        create_model(), prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms, scenario_probabilities,
+        **{alpha_name: points[0][0], gamma_name: points[0][1]}, **params,
+    )
+    build_time = time.perf_counter() - t1
+    t_final = instance.sFinalTime.first()
+    t_initial = instance.sInitialTime.first()
+
+    rows = []
+    for i, (alpha, gamma) in enumerate(points):
+        t1 = time.perf_counter()
+        update_instance(instance, **{alpha_name: alpha, gamma_name: gamma})
+        results = solve_warm(solver, instance) if warm_start and i > 0 else solver.solve(instance)
+        solve_time = time.perf_counter() - t1
+        termination = str(results.termination_condition)
+        row = {'alpha': alpha, 'gamma': gamma, 'termination_condition': termination, 'build_time': build_time if i == 0 else 0., 'solve_time': solve_time}
+        if results.best_feasible_objective is not None:
+            results.solution_loader.load_vars()
+            final_wealth = np.array([instance.vTotalWealth[s, t_final].value for s in instance.sScenarios], dtype=float)
+            var, cvar_ = cvar(final_wealth, alpha, probabilities)
+            row.update({
+                'objective': pe.value(instance.f_obj),
+                'expected_wealth': probabilities@final_wealth,
+                'var': var,
+                'cvar': cvar_,
+                **{f'trade_{a}': instance.vNonCashTrades[a, t_initial].value for a in non_cash_assets},
+            })
+        logger.info(f"Frontier point alpha={alpha}, gamma={gamma}: {termination} in {solve_time:.2f} s")
+        rows.append(row)
+    return rows
+
+
+def _frontier_sweep(args):
+    create_model, points, data, kwargs = args
+    return frontier_sweep(create_model, points, *data, **kwargs)
+
+
+def efficient_frontier(create_model, alphas, gammas, prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms=None,
+                       scenario_probabilities=None, suffix='', solver=None, warm_start=True, n_workers=None, **params):
+    """
+    Expected final wealth against CVaR of the CVaR om_* models over a grid of alphas and gammas of
+    the CVaR term <suffix> ('' for om_*_cvar, '1', '2'... for the numbered ones). The other params
+    are fixed through the keyword arguments, as for instance_data.create_instance.
+    The grid is walked in serpentine order (see frontier_grid) and split in n_workers contiguous
+    chunks, each one solved in its own process with a single warm-started instance (see
+    frontier_sweep). solver is a callable returning a persistent solver, appsi Highs by default.
+    Returns a DataFrame with one row per point: alpha, gamma, termination_condition, objective,
+    expected_wealth, var and cvar of the final wealth (computed from the solved wealth, so they are
+    also meaningful with a zero gamma), the first period trades (trade_<asset>) and the times.
+    """
+    points = frontier_grid(alphas, gammas)
+    n_chunks = min(len(points), n_workers or os.cpu_count() or 1)
+    chunks = [[points[i] for i in chunk] for chunk in np.array_split(np.arange(len(points)), n_chunks)]
+    data = (prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms, scenario_probabilities)
+    kwargs = {'suffix': suffix, 'solver': solver, 'warm_start': warm_start, **params}
+    tasks = list(zip(repeat(create_model), chunks, repeat(data), repeat(kwargs)))
+    if len(tasks) <= 1:
+        rows = [_frontier_sweep(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(n_workers) as executor:
+            rows = list(executor.map(_frontier_sweep, tasks))
+    return pd.DataFrame([row for chunk in rows for row in chunk])
@@ -0,0 +1,299 @@
+import gc
+import time
+import tracemalloc
+from collections.abc import Mapping
+from itertools import product
+
+import numpy as np
+import pyomo.environ as pe
+from pyomo import gdp
+
+from src.optimization.big_m import negative_cash_big_m
+
+
+class ArrayParamData(Mapping):
+    """
+    Read-only mapping view over a NumPy array that Pyomo can use to construct an indexed Param,
+    passed as its data to create_instance. Keys are the tuples of the given index values, one
+    sequence per array axis, but they are only generated while Pyomo iterates over them, so no
+    intermediate dict nor nested list is ever built.
+    """
+    def __init__(self, array, index_values):
+        if array.ndim != len(index_values):
+            raise ValueError(f"Array has {array.ndim} dimensions but {len(index_values)} index sequences have been provided")
+        for axis, values in enumerate(index_values):
+            if array.shape[axis] != len(values):
+                raise ValueError(f"Axis {axis} has length {array.shape[axis]} but {len(values)} index values have been provided")
+        self.array = array
+        self.index_values = [list(values) for values in index_values]
+        self._positions = [{v: i for i, v in enumerate(values)} for values in self.index_values]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        try:
+            return float(self.array[tuple(p[k] for p, k in zip(self._positions, key))])
+        except KeyError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return product(*self.index_values)
+
+    def __len__(self):
+        return self.array.size
+
+    def __contains__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        return len(key) == len(self._positions) and all(k in p for p, k in zip(self._positions, key))
+
+    def items(self):
+        # Values are converted one leading-axis slice at a time to keep the memory overhead small
+        outer_values = self.index_values[0]
+        inner_keys = list(product(*self.index_values[1:]))
+        for i, v in enumerate(outer_values):
+            for inner_key, value in zip(inner_keys, self.array[i].ravel().tolist()):
+                yield (v,) + inner_key, value
+
+
+def _check_param(model, name):
+    if hasattr(model, name):
+        return
+    if name.startswith(('pCVaRAlpha', 'pCVaRGamma')):
+        raise ValueError(f"{name} is not a param of the model: model_factory.create_model does not build the CVaR levels with a zero gamma, so they can not be set afterwards")
+    raise ValueError(f"{name} is not a param of the model")
+
+
+def _check_probabilities(probabilities, n_scenarios):
+    probabilities = np.asarray(probabilities, dtype=float)
+    if probabilities.shape != (n_scenarios,):
+        raise ValueError(f"{probabilities.shape[0] if probabilities.ndim else 1} scenario probabilities have been provided but there are {n_scenarios} scenarios")
+    if np.any(probabilities < 0) or not np.isclose(probabilities.sum(), 1):
+        raise ValueError("Scenario probabilities should be non negative and add up to 1")
+    return probabilities
+
+
+def create_data(model, prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms=None, scenario_probabilities=None, **params):
+    """
+    Builds the data dict used by model.create_instance for any of the om_* models.
+        prices_syms: (n_scenarios, n_assets, horizon+1)
+        income_syms, expenses_syms: (n_scenarios, horizon+1)
+        cash_returns_syms: (n_scenarios, horizon+1), only for the models with pCashReturns
+        scenario_probabilities: (n_scenarios,), uniform if not given
+    Scalar params (pInitialCashAllocations, pTradeFee, pCVaRAlpha...) are passed as keyword
+    arguments. pInitialNonCashAllocations can be given as an array or a dict and defaults to 0.
+    pNegativeCashBigM, for the models with a negative cash chance constraint, is computed from the
+    scenarios with big_m.negative_cash_big_m unless given as an (n_scenarios, horizon+1) array. Its
+    bounds only hold while pPropNegativeCash < 1, otherwise the n_times*pInitialCashAllocations
+    bound of the original om_*_negativecash models is used.
+    """
+    prices_syms = np.asarray(prices_syms)
+    n_scenarios, n_assets, n_times = prices_syms.shape
+    horizon = n_times - 1
+    non_cash_assets = list(non_cash_assets)
+    if len(non_cash_assets) != n_assets:
+        raise ValueError(f"{len(non_cash_assets)} asset names have been provided but prices have {n_assets} assets")
+
+    sScenarios = list(range(n_scenarios))
+    sTime = list(range(n_times))
+    sNonFinalTimes = list(range(horizon))
+
+    data = {
+        'sInitialTime': {None: [0]},
+        'sIntermediateTime': {None: list(range(1, horizon))},
+        'sFinalTime': {None: [horizon]},
+        'sNonCashAssets': {None: non_cash_assets},
+        'sScenarios': {None: sScenarios},
+        'pPrices': ArrayParamData(prices_syms, [sScenarios, non_cash_assets, sTime]),
+        'pIncome': ArrayParamData(np.asarray(income_syms)[:, :horizon], [sScenarios, sNonFinalTimes]),
+        'pExpense': ArrayParamData(np.asarray(expenses_syms)[:, :horizon], [sScenarios, sNonFinalTimes]),
+    }
+    if hasattr(model, 'pCashReturns'):
+        if cash_returns_syms is None:
+            raise ValueError("The model has a pCashReturns param but no cash_returns_syms have been provided")
+        data['pCashReturns'] = ArrayParamData(np.asarray(cash_returns_syms), [sScenarios, sTime])
+    if scenario_probabilities is not None:
+        data['pScenarioProbability'] = ArrayParamData(_check_probabilities(scenario_probabilities, n_scenarios), [sScenarios])
+
+    initial_non_cash = params.pop('pInitialNonCashAllocations', None)
+    if initial_non_cash is None:
+        initial_non_cash = np.zeros(n_assets)
+    if not isinstance(initial_non_cash, dict):
+        initial_non_cash = {a: float(v) for a, v in zip(non_cash_assets, initial_non_cash)}
+    data['pInitialNonCashAllocations'] = initial_non_cash
+
+    if hasattr(model, 'pNegativeCashBigM'):
+        big_m = params.pop('pNegativeCashBigM', None)
+        if big_m is None and params.get('pPropNegativeCash', model.pPropNegativeCash.default()) >= 1:
+            big_m = _legacy_big_m(n_scenarios, n_times, params.get('pInitialCashAllocations', 0.))
+        elif big_m is None:
+            big_m = negative_cash_big_m(
+                prices_syms, income_syms, expenses_syms, params.get('pInitialCashAllocations', 0.),
+                [initial_non_cash[a] for a in non_cash_assets], params.get('pMinimumCash', model.pMinimumCash.default()), cash_returns_syms,
+            )
+        data['pNegativeCashBigM'] = ArrayParamData(np.asarray(big_m, dtype=float), [sScenarios, sTime])
+
+    for name, value in params.items():
+        _check_param(model, name)
+        data[name] = value if isinstance(value, Mapping) else {None: value}
+
+    return {None: data}
+
+
+def create_instance(model, prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms=None, scenario_probabilities=None, **params):
+    """
+    Returns a ConcreteModel of the given om_* AbstractModel initialised straight from the simulated
+    arrays. See create_data for the arguments.
+    """
+    data = create_data(model, prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms, scenario_probabilities, **params)
+    return model.create_instance(data)
+
+
+def update_instance(instance, prices_syms=None, income_syms=None, expenses_syms=None, cash_returns_syms=None, scenario_probabilities=None, **params):
+    """
+    Overwrites the mutable params of an already constructed instance in place, e.g. to re-solve it
+    with new scenarios. Arrays must have the same shapes as the ones used to create the instance.
+    pNegativeCashBigM is recomputed whenever the scenarios, the initial allocations, pMinimumCash or
+    pPropNegativeCash change (see create_data). Instances whose disjunctions have already been
+    reformulated (big_m.transform_indicators) keep the big-M of the time of the transformation, so
+    they can not be updated in a way that changes it: a new instance has to be created instead.
+    """
+    big_m = params.pop('pNegativeCashBigM', None)
+    update_big_m = (
+        any(array is not None for array in (prices_syms, income_syms, expenses_syms, cash_returns_syms))
+        or any(name in params for name in ('pInitialCashAllocations', 'pInitialNonCashAllocations', 'pMinimumCash', 'pPropNegativeCash'))
+    )
+    if hasattr(instance, 'pNegativeCashBigM') and (big_m is not None or update_big_m) and _is_transformed(instance):
+        raise ValueError("The negative cash disjunctions of the instance have already been reformulated with the big-M of the time of the transformation, which can not be updated: create a new instance instead")
+    sScenarios = list(instance.sScenarios)
+    sTime = list(instance.sTime)
+    sNonFinalTimes = list(instance.sNonFinalTime)
+    arrays = {
+        'pPrices': (prices_syms, [sScenarios, list(instance.sNonCashAssets), sTime]),
+        'pIncome': (None if income_syms is None else np.asarray(income_syms)[:, :len(sNonFinalTimes)], [sScenarios, sNonFinalTimes]),
+        'pExpense': (None if expenses_syms is None else np.asarray(expenses_syms)[:, :len(sNonFinalTimes)], [sScenarios, sNonFinalTimes]),
+        'pCashReturns': (cash_returns_syms, [sScenarios, sTime]),
+        'pScenarioProbability': (None if scenario_probabilities is None else _check_probabilities(scenario_probabilities, len(sScenarios)), [sScenarios]),
+    }
+    for name, (array, index_values) in arrays.items():
+        if array is None:
+            continue
+        if not hasattr(instance, name):
+            raise ValueError(f"{name} is not a param of the model")
+        # Indices are known to be valid, so Pyomo's per-key checks can be skipped
+        getattr(instance, name).store_values(ArrayParamData(np.asarray(array), index_values), check=False)
+
+    initial_non_cash = params.pop('pInitialNonCashAllocations', None)
+    if initial_non_cash is not None:
+        if not isinstance(initial_non_cash, dict):
+            initial_non_cash = {a: float(v) for a, v in zip(instance.sNonCashAssets, initial_non_cash)}
+        for a, v in initial_non_cash.items():
+            instance.pInitialNonCashAllocations[a] = v
+
+    for name, value in params.items():
+        _check_param(instance, name)
+        param = getattr(instance, name)
+        if param.is_indexed():
+            param.store_values(value)
+        else:
+            param.set_value(value)
+
+    if hasattr(instance, 'pNegativeCashBigM'):
+        if big_m is None and update_big_m:
+            big_m = _negative_cash_big_m(instance)
+        if big_m is not None:
+            instance.pNegativeCashBigM.store_values(ArrayParamData(np.asarray(big_m, dtype=float), [sScenarios, sTime]), check=False)
+
+
+def _param_array(param, index_values):
+    values = param.extract_values()
+    return np.array([values[key if len(key) > 1 else key[0]] for key in product(*index_values)], dtype=float).reshape([len(v) for v in index_values])
+
+
+def _is_transformed(instance):
+    # The gdp transformations deactivate the disjunctions they reformulate
+    return any(not disjunction.active for disjunction in instance.component_objects(gdp.Disjunction))
+
+
+def _legacy_big_m(n_scenarios, n_times, initial_cash):
+    # Bound of the original om_*_negativecash models, used when negative_cash_big_m does not hold
+    return np.full((n_scenarios, n_times), n_times*initial_cash, dtype=float)
+
+
+def _negative_cash_big_m(instance):
+    # Big-M of the current params of an instance
+    sScenarios, sTime, sNonFinalTimes = list(instance.sScenarios), list(instance.sTime), list(instance.sNonFinalTime)
+    if pe.value(instance.pPropNegativeCash) >= 1:
+        return _legacy_big_m(len(sScenarios), len(sTime), pe.value(instance.pInitialCashAllocations))
+    non_cash_assets = list(instance.sNonCashAssets)
+    return negative_cash_big_m(
+        _param_array(instance.pPrices, [sScenarios, non_cash_assets, sTime]),
+        _param_array(instance.pIncome, [sScenarios, sNonFinalTimes]),
+        _param_array(instance.pExpense, [sScenarios, sNonFinalTimes]),
+        pe.value(instance.pInitialCashAllocations),
+        _param_array(instance.pInitialNonCashAllocations, [non_cash_assets]),
+        pe.value(instance.pMinimumCash),
+        _param_array(instance.pCashReturns, [sScenarios, sTime]) if hasattr(instance, 'pCashReturns') else None,
+    )
+
+
+def _create_data_dict(prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms=None, **params):
+    # Reference implementation: the per-element tuple dicts used in main.py and example_4.py
+    n_scenarios, n_assets, n_times = prices_syms.shape
+    horizon = n_times - 1
+    sScenarios = list(range(n_scenarios))
+    sTime = list(range(n_times))
+    sNonFinalTimes = list(range(horizon))
+    data = {
+        'sInitialTime': {None: [0]},
+        'sIntermediateTime': {None: list(range(1, horizon))},
+        'sFinalTime': {None: [horizon]},
+        'sNonCashAssets': {None: non_cash_assets},
+        'sScenarios': {None: sScenarios},
+        'pPrices': {(s_i,non_cash_assets[a_i], t_i): prices_syms[s_i,a_i,t_i] for s_i in sScenarios for t_i in sTime for a_i in range(len(non_cash_assets))},
+        'pInitialNonCashAllocations': {a: 0 for a in non_cash_assets},
+        'pIncome': {(s_i,t_i): income_syms[s_i, t_i] for s_i in sScenarios for t_i in sNonFinalTimes},
+        'pExpense': {(s_i,t_i): expenses_syms[s_i, t_i] for s_i in sScenarios for t_i in sNonFinalTimes},
+    }
+    if cash_returns_syms is not None:
+        data['pCashReturns'] = {(s_i,t_i): cash_returns_syms[s_i, t_i] for s_i in sScenarios for t_i in sTime}
+    data.update({name: {None: value} for name, value in params.items()})
+    return {None: data}
+
+
+def compare_with_data_dict(model, prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms=None, **params):
+    """
+    Reports the build time and peak traced memory of create_instance fed with the per-element
+    tuple dicts against the array-backed create_instance, both for the input data alone and for
+    the whole instance build.
+    """
+    non_cash_assets = list(non_cash_assets)
+    data_builders = {
+        'data_dict': lambda: _create_data_dict(prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms, **params),
+        'array': lambda: create_data(model, prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms, **params),
+    }
+    instance_builders = {
+        'data_dict': lambda: model.create_instance(data_builders['data_dict']()),
+        'array': lambda: create_instance(model, prices_syms, income_syms, expenses_syms, non_cash_assets, cash_returns_syms, **params),
+    }
+    report = {}
+    for name, builder in instance_builders.items():
+        gc.collect()
+        t1 = time.time()
+        instance = builder()
+        t2 = time.time()
+        del instance
+        report[name+'_build_time'] = t2 - t1
+    for kind, builders in (('data', data_builders), ('build', instance_builders)):
+        for name, builder in builders.items():
+            gc.collect()
+            tracemalloc.start()
+            result = builder()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+            report[f'{name}_{kind}_peak_memory_mb'] = peak/2**20
+    report['build_time_saved'] = report['data_dict_build_time'] - report['array_build_time']
+    report['data_peak_memory_saved_mb'] = report['data_dict_data_peak_memory_mb'] - report['array_data_peak_memory_mb']
+    report['build_peak_memory_saved_mb'] = report['data_dict_build_peak_memory_mb'] - report['array_build_peak_memory_mb']
+    return report
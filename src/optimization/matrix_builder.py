@@ -0,0 +1,295 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import milp, Bounds, LinearConstraint
+
+from src.optimization.instance_data import create_instance
+
+
+class MatrixModel():
+    """
+    Sparse matrix form of the CVaR portfolio models (om_discrete_cvar / om_continuous_cvar).
+
+    Variables and constraints mirror the Pyomo models one to one: every variable block keeps the
+    Pyomo name and is stored as a contiguous column range, and every cXX constraint block is a
+    contiguous row range. The problem is stored as
+        max Objective  s.t.  row_lb <= A x <= row_ub,  lb <= x <= ub
+    so that it can be handed directly to an in-process solver such as HiGHS.
+    """
+    def __init__(self):
+        self.var_blocks = {}
+        self.constraint_blocks = {}
+        self.n_vars = 0
+        self.n_rows = 0
+        self.A = None
+        self.c = None
+        self.sense = None
+        self.lb = None
+        self.ub = None
+        self.row_lb = None
+        self.row_ub = None
+        self.integrality = None
+        self.result = None
+        self.x = None
+        self.objective = None
+
+        self._lb = []
+        self._ub = []
+        self._integrality = []
+        self._rows = []
+        self._cols = []
+        self._vals = []
+        self._row_lb = []
+        self._row_ub = []
+
+    def add_var(self, name, shape, lb=-np.inf, ub=np.inf, integer=False):
+        size = int(np.prod(shape))
+        cols = np.arange(self.n_vars, self.n_vars + size).reshape(shape)
+        self.var_blocks[name] = cols
+        self.n_vars += size
+        self._lb.append(np.full(size, lb, dtype=float))
+        self._ub.append(np.full(size, ub, dtype=float))
+        self._integrality.append(np.full(size, int(integer), dtype=np.uint8))
+        return cols
+
+    def add_constraints(self, name, terms, lower=-np.inf, upper=np.inf):
+        """
+        Adds one row per element of the first term. Each term is a (cols, coefs) pair where cols has
+        shape (n_rows,) or (n_rows, k) and coefs broadcasts to it.
+        """
+        first_cols = np.asarray(terms[0][0])
+        n = first_cols.shape[0] if first_cols.ndim > 0 else 1
+        rows = np.arange(self.n_rows, self.n_rows + n)
+        for cols, coefs in terms:
+            cols = np.asarray(cols).reshape(n, -1)
+            coefs = np.asarray(coefs, dtype=float)
+            if coefs.ndim > 0:
+                coefs = coefs.reshape(n, -1)
+            coefs = np.broadcast_to(coefs, cols.shape)
+            self._rows.append(np.broadcast_to(rows[:, None], cols.shape).ravel())
+            self._cols.append(cols.ravel())
+            self._vals.append(coefs.ravel())
+        self._row_lb.append(np.broadcast_to(np.asarray(lower, dtype=float), (n,)))
+        self._row_ub.append(np.broadcast_to(np.asarray(upper, dtype=float), (n,)))
+        self.constraint_blocks[name] = slice(self.n_rows, self.n_rows + n)
+        self.n_rows += n
+
+    def set_objective(self, name, sense='max'):
+        if sense not in ('max', 'min'):
+            raise ValueError(f"sense should be 'max' or 'min', got {sense}")
+        self.sense = sense
+        self.c = np.zeros(self.n_vars)
+        self.c[self.var_blocks[name]] = -1 if sense == 'max' else 1
+
+    def finalize(self):
+        self.lb = np.concatenate(self._lb)
+        self.ub = np.concatenate(self._ub)
+        self.integrality = np.concatenate(self._integrality)
+        self.row_lb = np.concatenate(self._row_lb)
+        self.row_ub = np.concatenate(self._row_ub)
+        self.A = sp.csr_matrix(
+            (np.concatenate(self._vals), (np.concatenate(self._rows), np.concatenate(self._cols))),
+            shape=(self.n_rows, self.n_vars),
+        )
+        self._lb = self._ub = self._integrality = self._row_lb = self._row_ub = None
+        self._rows = self._cols = self._vals = None
+
+    def solve(self, time_limit=None, mip_rel_gap=None, disp=False):
+        options = {'disp': disp}
+        if time_limit is not None:
+            options['time_limit'] = time_limit
+        if mip_rel_gap is not None:
+            options['mip_rel_gap'] = mip_rel_gap
+        self.result = milp(
+            c=self.c,
+            integrality=self.integrality,
+            bounds=Bounds(self.lb, self.ub),
+            constraints=LinearConstraint(self.A, self.row_lb, self.row_ub),
+            options=options,
+        )
+        if self.result.x is None:
+            raise RuntimeError(f"Solver did not return a solution: {self.result.message}")
+        self.x = self.result.x
+        self.objective = -self.result.fun if self.sense == 'max' else self.result.fun
+        return self.result
+
+    def get_values(self, name):
+        if self.x is None:
+            raise ValueError("Model not solved. Please use solve() method first.")
+        return self.x[self.var_blocks[name]]
+
+
+def create_matrix_model(prices_syms, income_syms, expenses_syms, initial_cash, initial_non_cash=None, trade_fee=0., cvar_alpha=0.05, cvar_gamma=0., discrete=False, scenario_probabilities=None):
+    """
+    Builds the om_discrete_cvar (discrete=True) or om_continuous_cvar (discrete=False) problem
+    directly from the simulated arrays:
+        prices_syms: (n_scenarios, n_assets, horizon+1)
+        income_syms, expenses_syms: (n_scenarios, horizon+1)
+        scenario_probabilities: (n_scenarios,), uniform if not given
+    """
+    prices_syms = np.asarray(prices_syms, dtype=float)
+    n_scenarios, n_assets, n_times = prices_syms.shape
+    horizon = n_times - 1
+    if initial_non_cash is None:
+        initial_non_cash = np.zeros(n_assets)
+    if scenario_probabilities is None:
+        scenario_probabilities = np.full(n_scenarios, 1/n_scenarios)
+    net_cashflow = np.asarray(income_syms, dtype=float)[:, :horizon] - np.asarray(expenses_syms, dtype=float)[:, :horizon]
+    trade_prices = prices_syms[:, :, :horizon].transpose(0, 2, 1) # (scenario, time, asset)
+
+    mm = MatrixModel()
+
+    # Variables
+    vCashAllocations = mm.add_var('vCashAllocations', (n_scenarios, n_times), lb=0)
+    vNonCashAllocations = mm.add_var('vNonCashAllocations', (n_assets, n_times), lb=0, integer=discrete)
+    vCashTrades = mm.add_var('vCashTrades', (n_scenarios, horizon))
+    vCashTradesAbs = mm.add_var('vCashTradesAbs', (n_scenarios, horizon), lb=0)
+    vNonCashTrades = mm.add_var('vNonCashTrades', (n_assets, horizon), integer=discrete)
+    vNonCashTradesAbs = mm.add_var('vNonCashTradesAbs', (n_assets, horizon), lb=0, integer=discrete)
+    vCVaR = mm.add_var('vCVaR', (1,))
+    vVaR = mm.add_var('vVaR', (1,))
+    vLoss = mm.add_var('vLoss', (n_scenarios, 1), lb=0)
+    vTotalWealth = mm.add_var('vTotalWealth', (n_scenarios, n_times), lb=0)
+    Objective = mm.add_var('Objective', (1,))
+
+    final_wealth = vTotalWealth[:, horizon]
+    trade_rows = (n_scenarios, horizon, n_assets)
+
+    # Constraints
+    mm.add_constraints('c00_objective_function', [
+        (Objective, 1.),
+        (final_wealth[None, :], -(1 - cvar_gamma)*scenario_probabilities),
+        (vCVaR, cvar_gamma),
+    ], lower=0., upper=0.)
+    mm.add_constraints('c01_initial_non_cash_allocations', [
+        (vNonCashAllocations[:, 0], 1.),
+    ], lower=initial_non_cash, upper=initial_non_cash)
+    mm.add_constraints('c02_initial_cash_allocations', [
+        (vCashAllocations[:, 0], 1.),
+    ], lower=initial_cash, upper=initial_cash)
+    mm.add_constraints('c03_allocations_evolution_non_cash', [
+        (vNonCashAllocations[:, 1:].ravel(), 1.),
+        (vNonCashAllocations[:, :-1].ravel(), -1.),
+        (vNonCashTrades.ravel(), -1.),
+    ], lower=0., upper=0.)
+    mm.add_constraints('c04_allocations_evolution_cash', [
+        (vCashAllocations[:, 1:].ravel(), 1.),
+        (vCashAllocations[:, :-1].ravel(), -1.),
+        (vCashTrades.ravel(), -1.),
+    ], lower=net_cashflow.ravel(), upper=net_cashflow.ravel())
+    mm.add_constraints('c05_absolute_value_cash_trade_positive', [
+        (vCashTrades.ravel(), 1.),
+        (vCashTradesAbs.ravel(), -1.),
+    ], upper=0.)
+    mm.add_constraints('c06_absolute_value_cash_trade_negative', [
+        (vCashTrades.ravel(), -1.),
+        (vCashTradesAbs.ravel(), -1.),
+    ], upper=0.)
+    mm.add_constraints('c07_absolute_value_non_cash_trade_positive', [
+        (vNonCashTrades.ravel(), 1.),
+        (vNonCashTradesAbs.ravel(), -1.),
+    ], upper=0.)
+    mm.add_constraints('c08_absolute_value_non_cash_trade_negative', [
+        (vNonCashTrades.ravel(), -1.),
+        (vNonCashTradesAbs.ravel(), -1.),
+    ], upper=0.)
+    mm.add_constraints('c09_self_financing', [
+        (np.broadcast_to(vNonCashTrades.T, trade_rows).reshape(-1, n_assets), trade_prices.reshape(-1, n_assets)),
+        (vCashTrades.ravel(), 1.),
+        (np.broadcast_to(vNonCashTradesAbs.T, trade_rows).reshape(-1, n_assets), trade_fee*trade_prices.reshape(-1, n_assets)),
+        (vCashTradesAbs.ravel(), trade_fee),
+    ], upper=0.)
+    mm.add_constraints('c10_total_wealth', [
+        (vTotalWealth.ravel(), 1.),
+        (vCashAllocations.ravel(), -1.),
+        (np.broadcast_to(vNonCashAllocations.T, (n_scenarios, n_times, n_assets)).reshape(-1, n_assets), -prices_syms.transpose(0, 2, 1).reshape(-1, n_assets)),
+    ], lower=0., upper=0.)
+    mm.add_constraints('c11_final_wealth_cvar_loss', [
+        (vLoss.ravel(), -1.),
+        (np.broadcast_to(vVaR, (n_scenarios,)), -1.),
+        (final_wealth, -1.),
+    ], upper=0.)
+    mm.add_constraints('c12_cvar', [
+        (vCVaR, 1.),
+        (vVaR, -1.),
+        (vLoss.ravel()[None, :], -scenario_probabilities/cvar_alpha),
+    ], lower=0., upper=0.)
+
+    mm.set_objective('Objective', sense='max')
+    mm.finalize()
+    return mm
+
+
+# Relative MIP gap option of the Pyomo solver plugins, the appsi solvers take it as config.mip_gap
+MIP_GAP_OPTIONS = {'cbc': 'ratioGap', 'glpk': 'mipgap', 'cplex': 'mipgap', 'gurobi': 'MIPGap', 'gurobi_direct': 'MIPGap', 'gurobi_persistent': 'MIPGap'}
+
+
+def _set_mip_gap(solver, mip_rel_gap):
+    if hasattr(solver, 'config') and hasattr(solver.config, 'mip_gap'):
+        solver.config.mip_gap = mip_rel_gap
+    elif getattr(solver, 'name', None) in MIP_GAP_OPTIONS:
+        solver.options[MIP_GAP_OPTIONS[solver.name]] = mip_rel_gap
+    else:
+        raise ValueError(f"Unknown MIP gap option of solver {getattr(solver, 'name', solver)}, use one of {sorted(MIP_GAP_OPTIONS)} or an appsi solver")
+
+
+def _create_pyomo_instance(prices_syms, income_syms, expenses_syms, initial_cash, initial_non_cash, trade_fee, cvar_alpha, cvar_gamma, discrete, non_cash_assets, scenario_probabilities):
+    if discrete:
+        from src.optimization.om_discrete_cvar import create_model
+    else:
+        from src.optimization.om_continuous_cvar import create_model
+
+    return create_instance(
+        create_model(), prices_syms, income_syms, expenses_syms, non_cash_assets,
+        scenario_probabilities=scenario_probabilities,
+        pInitialNonCashAllocations=initial_non_cash,
+        pInitialCashAllocations=initial_cash,
+        pTradeFee=trade_fee,
+        pCVaRAlpha=cvar_alpha,
+        pCVaRGamma=cvar_gamma,
+    )
+
+
+def compare_with_pyomo(prices_syms, income_syms, expenses_syms, initial_cash, initial_non_cash=None, trade_fee=0., cvar_alpha=0.05, cvar_gamma=0., discrete=False, non_cash_assets=None, solver=None, rtol=1e-6, time_limit=None, scenario_probabilities=None, mip_rel_gap=0.):
+    """
+    Builds and solves the same problem through the matrix builder and through the Pyomo model and
+    checks that both objectives match. Both solves use mip_rel_gap, which is added twice to rtol for
+    discrete problems. Returns a dict with objectives and build/solve timings.
+    """
+    import pyomo.environ as pe
+
+    prices_syms = np.asarray(prices_syms, dtype=float)
+    n_assets = prices_syms.shape[1]
+    if non_cash_assets is None:
+        non_cash_assets = [f'Asset{a_i+1}' for a_i in range(n_assets)]
+    if initial_non_cash is None:
+        initial_non_cash = np.zeros(n_assets)
+    if solver is None:
+        solver = pe.SolverFactory('cbc')
+    _set_mip_gap(solver, mip_rel_gap)
+
+    t1 = time.time()
+    mm = create_matrix_model(prices_syms, income_syms, expenses_syms, initial_cash, initial_non_cash, trade_fee, cvar_alpha, cvar_gamma, discrete, scenario_probabilities)
+    t2 = time.time()
+    mm.solve(time_limit=time_limit, mip_rel_gap=mip_rel_gap)
+    t3 = time.time()
+    instance = _create_pyomo_instance(prices_syms, income_syms, expenses_syms, initial_cash, initial_non_cash, trade_fee, cvar_alpha, cvar_gamma, discrete, non_cash_assets, scenario_probabilities)
+    t4 = time.time()
+    solver.solve(instance)
+    t5 = time.time()
+
+    pyomo_objective = pe.value(instance.f_obj)
+    abs_diff = abs(mm.objective - pyomo_objective)
+    rel_diff = abs_diff/max(abs(pyomo_objective), 1.)
+    return {
+        'matrix_objective': mm.objective,
+        'pyomo_objective': pyomo_objective,
+        'abs_diff': abs_diff,
+        'rel_diff': rel_diff,
+        'match': rel_diff <= rtol + (2*mip_rel_gap if discrete else 0.),
+        'matrix_build_time': t2 - t1,
+        'matrix_solve_time': t3 - t2,
+        'pyomo_build_time': t4 - t3,
+        'pyomo_solve_time': t5 - t4,
+    }
@@ -0,0 +1,214 @@
+import pyomo.environ as pe
+from pyomo import gdp
+
+NEGATIVE_CASH_OPTIONS = (None, 'chance', 'unrestricted')
+NEGATIVE_CASH_FORMULATIONS = ('big_m', 'indicator')
+
+
+def create_model(cvar_levels=((0.05, 0.5),), discrete=True, negative_cash=None, cash_returns=False, cvar_cuts=False, negative_cash_formulation='big_m'):
+    """
+    Builds any of the om_* AbstractModels from feature switches:
+        cvar_levels: (alpha, gamma) pairs of the CVaR terms in the objective. Pairs with a zero gamma
+            are not built, so they cost nothing at build or solve time, and their params can not be
+            set later. A single pair uses the names of om_discrete_cvar (pCVaRAlpha, vCVaR...),
+            several ones the names of om_discrete_cvar3 numbered by their position in cvar_levels
+            (pCVaRAlpha1, vCVaR1...), whether the other pairs are built or not. Without terms the
+            objective is the expected final wealth as in om_discrete.
+        discrete: integer number of shares (om_discrete*) or continuous allocations (om_continuous*)
+        negative_cash: None for non negative cash, 'chance' to allow a pPropNegativeCash share of
+            scenarios to go below pMinimumCash (om_*_negativecash) or 'unrestricted' for any cash
+            (om_continuous_cvar3_unrestrictednegcash)
+        cash_returns: cash grows by the pCashReturns factors (om_continuous_cvar_cashreturns)
+        cvar_cuts: CVaR terms bounded by aggregated cuts instead of one loss per scenario, to be
+            solved with cvar_cuts.CVaRCuttingPlane
+        negative_cash_formulation: with negative_cash='chance', link vHasNegativeCash to the
+            negative cash with the pNegativeCashBigM big-M ('big_m') or with a disjunction per
+            scenario ('indicator') to be reformulated with big_m.transform_indicators
+    """
+    if negative_cash not in NEGATIVE_CASH_OPTIONS:
+        raise ValueError(f"negative_cash should be one of {NEGATIVE_CASH_OPTIONS}, got {negative_cash}")
+    if negative_cash_formulation not in NEGATIVE_CASH_FORMULATIONS:
+        raise ValueError(f"negative_cash_formulation should be one of {NEGATIVE_CASH_FORMULATIONS}, got {negative_cash_formulation}")
+    indicator = negative_cash == 'chance' and negative_cash_formulation == 'indicator'
+    cvar_levels = list(cvar_levels)
+    if sum(gamma for _, gamma in cvar_levels) > 1:
+        raise ValueError("CVaR gammas should add up to at most 1")
+    # Suffixes follow the position in the input, so that dropping a level does not rename the others
+    built = [i for i, (_, gamma) in enumerate(cvar_levels) if gamma != 0]
+    suffixes = ['' if len(cvar_levels) == 1 else str(i+1) for i in built]
+    cvar_levels = [cvar_levels[i] for i in built]
+    integers = pe.Integers if discrete else pe.Reals
+    non_negative_integers = pe.NonNegativeIntegers if discrete else pe.NonNegativeReals
+
+    model = pe.AbstractModel()
+
+    # Sets
+    model.sInitialTime = pe.Set(within=pe.NonNegativeIntegers, initialize=[0])
+    model.sIntermediateTime = pe.Set(within=pe.NonNegativeIntegers)
+    model.sFinalTime = pe.Set(within=pe.NonNegativeIntegers)
+    model.sTime = model.sInitialTime | model.sIntermediateTime | model.sFinalTime
+    model.sNonInitialTime = model.sIntermediateTime | model.sFinalTime
+    model.sNonFinalTime = model.sInitialTime | model.sIntermediateTime
+    model.sNonCashAssets = pe.Set()
+    model.sScenarios = pe.Set(within=pe.Integers)
+
+    # Parameters
+    model.pPrices = pe.Param(model.sScenarios, model.sNonCashAssets, model.sTime, mutable=True, within=pe.NonNegativeReals)
+    model.pInitialNonCashAllocations = pe.Param(model.sNonCashAssets, mutable=True, within=non_negative_integers) # shorting not allowed
+    model.pInitialCashAllocations = pe.Param(mutable=True, within=pe.NonNegativeReals)
+    model.pIncome = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
+    model.pExpense = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
+    model.pTradeFee = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0)
+    model.pScenarioProbability = pe.Param(model.sScenarios, mutable=True, within=pe.NonNegativeReals, initialize=lambda model, s: 1/len(model.sScenarios)) # uniform unless reduced scenarios are used
+    if cash_returns:
+        model.pCashReturns = pe.Param(model.sScenarios, model.sTime, mutable=True, within=pe.Reals)
+    for suffix, (alpha, gamma) in zip(suffixes, cvar_levels):
+        model.add_component('pCVaRAlpha'+suffix, pe.Param(mutable=True, within=pe.NonNegativeReals, default=alpha))
+        model.add_component('pCVaRGamma'+suffix, pe.Param(mutable=True, within=pe.NonNegativeReals, default=gamma))
+    if negative_cash == 'chance':
+        model.pMinimumCash = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0)
+        model.pPropNegativeCash = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0.05)
+        model.pNegativeCashBigM = pe.Param(model.sScenarios, model.sTime, mutable=True, within=pe.NonNegativeReals, initialize=lambda model, s, t: len(model.sTime)*pe.value(model.pInitialCashAllocations)) # bounds from big_m.negative_cash_big_m, set by create_instance
+
+    # Variables
+    model.vCashAllocations = pe.Var(model.sScenarios, model.sTime, domain=pe.NonNegativeReals if negative_cash is None else pe.Reals, initialize=0)
+    if negative_cash == 'chance':
+        # The disjunctions are reformulated with the bounds of the negative cash
+        bounds = (lambda model, s, t: (-model.pNegativeCashBigM[s, t], 0)) if indicator else (None, 0)
+        model.vNegativeCashAllocations = pe.Var(model.sScenarios, model.sTime, domain=pe.Reals, bounds=bounds, initialize=0)
+        model.vHasNegativeCash = pe.Var(model.sScenarios, domain=pe.Binary, initialize=0)
+    model.vNonCashAllocations = pe.Var(model.sNonCashAssets, model.sTime, domain=non_negative_integers, initialize=0) # shorting not allowed
+    model.vCashTrades = pe.Var(model.sScenarios, model.sNonFinalTime, domain=pe.Reals, initialize=0)
+    model.vCashTradesAbs = pe.Var(model.sScenarios, model.sNonFinalTime, domain=pe.NonNegativeReals, initialize=0)
+    model.vNonCashTrades = pe.Var(model.sNonCashAssets, model.sNonFinalTime, domain=integers, initialize=0)
+    model.vNonCashTradesAbs = pe.Var(model.sNonCashAssets, model.sNonFinalTime, domain=non_negative_integers, initialize=0)
+
+    for suffix in suffixes:
+        model.add_component('vCVaR'+suffix, pe.Var(model.sFinalTime, domain=pe.Reals, initialize=0))
+        model.add_component('vVaR'+suffix, pe.Var(model.sFinalTime, domain=pe.Reals, initialize=0))
+        if cvar_cuts:
+            model.add_component('vExcess'+suffix, pe.Var(model.sFinalTime, domain=pe.NonNegativeReals, initialize=0))
+        else:
+            model.add_component('vLoss'+suffix, pe.Var(model.sScenarios, model.sFinalTime, domain=pe.NonNegativeReals, initialize=0))
+
+    model.vTotalWealth = pe.Var(model.sScenarios, model.sTime, domain=pe.NonNegativeReals)
+
+    model.Objective = pe.Var(domain=pe.Reals, initialize=0)
+
+    def c00_objective_function(model, t):
+        gammas = [getattr(model, 'pCVaRGamma'+suffix) for suffix in suffixes]
+        cvars = [getattr(model, 'vCVaR'+suffix)[t] for suffix in suffixes]
+        return model.Objective == sum(model.pScenarioProbability[s]*model.vTotalWealth[s,t] for s in model.sScenarios)*(1-sum(gammas)) - sum(cvar*gamma for cvar, gamma in zip(cvars, gammas))
+
+    def c01_initial_non_cash_allocations(model, a, t):
+        return model.vNonCashAllocations[a,t] == model.pInitialNonCashAllocations[a]
+
+    def c02_initial_cash_allocations(model, s, t):
+        return model.vCashAllocations[s,t] == model.pInitialCashAllocations
+
+    def c03_allocations_evolution_non_cash(model, a, t):
+        return model.vNonCashAllocations[a,t] == model.vNonCashAllocations[a,t-1] + model.vNonCashTrades[a,t-1]
+
+    def c04_allocations_evolution_cash(model, s, t):
+        cash = model.vCashAllocations[s,t-1] + model.vCashTrades[s,t-1] + model.pIncome[s,t-1] - model.pExpense[s,t-1]
+        if cash_returns:
+            cash = cash*model.pCashReturns[s,t-1]
+        return model.vCashAllocations[s,t] == cash
+
+    def c05_absolute_value_cash_trade_positive(model, s, t):
+        return model.vCashTrades[s,t] <= model.vCashTradesAbs[s,t]
+
+    def c06_absolute_value_cash_trade_negative(model, s, t):
+        return -model.vCashTrades[s,t] <= model.vCashTradesAbs[s,t]
+
+    def c07_absolute_value_non_cash_trade_positive(model, a, t):
+        return model.vNonCashTrades[a,t] <= model.vNonCashTradesAbs[a,t]
+
+    def c08_absolute_value_non_cash_trade_negative(model, a, t):
+        return -model.vNonCashTrades[a,t] <= model.vNonCashTradesAbs[a,t]
+
+    def c09_self_financing(model, s, t):
+        return sum(model.vNonCashTrades[a,t]*model.pPrices[s,a,t] for a in model.sNonCashAssets) + model.vCashTrades[s,t] + sum(model.vNonCashTradesAbs[a,t]*model.pPrices[s,a,t]*model.pTradeFee for a in model.sNonCashAssets) + model.vCashTradesAbs[s,t]*model.pTradeFee <= 0
+
+    def c10_total_wealth(model, s, t):
+        return model.vTotalWealth[s,t] == model.vCashAllocations[s,t] + sum(model.vNonCashAllocations[a,t]*model.pPrices[s,a,t] for a in model.sNonCashAssets)
+
+    def c11_final_wealth_cvar_loss(suffix):
+        def rule(model, s, t):
+            return getattr(model, 'vLoss'+suffix)[s,t] >= - getattr(model, 'vVaR'+suffix)[t] - model.vTotalWealth[s,t]
+        return rule
+
+    def c12_cvar(suffix):
+        def rule(model, t):
+            return getattr(model, 'vCVaR'+suffix)[t] == getattr(model, 'vVaR'+suffix)[t] + 1/getattr(model, 'pCVaRAlpha'+suffix)*sum(model.pScenarioProbability[s]*getattr(model, 'vLoss'+suffix)[s,t] for s in model.sScenarios)
+        return rule
+
+    def c11_cvar_cut_definition(suffix):
+        def rule(model, t):
+            return getattr(model, 'vCVaR'+suffix)[t] == getattr(model, 'vVaR'+suffix)[t] + 1/getattr(model, 'pCVaRAlpha'+suffix)*getattr(model, 'vExcess'+suffix)[t]
+        return rule
+
+    def c12_cvar_cuts(suffix):
+        # Starts with the cut of the whole scenario set, the rest are added by CVaRCuttingPlane
+        def rule(model):
+            for t in model.sFinalTime:
+                yield getattr(model, 'vExcess'+suffix)[t] >= -getattr(model, 'vVaR'+suffix)[t] - sum(model.pScenarioProbability[s]*model.vTotalWealth[s,t] for s in model.sScenarios)
+        return rule
+
+    def c13_negative_cash(model, s, t):
+        return model.vNegativeCashAllocations[s,t] <= model.vCashAllocations[s,t] - model.pMinimumCash
+
+    def c14_count_negative_scenarios(model, s, t):
+        return model.vNegativeCashAllocations[s, t] + model.vHasNegativeCash[s]*model.pNegativeCashBigM[s, t] >= 0
+
+    def d14_cash_above_minimum(disjunct, s):
+        model = disjunct.model()
+        disjunct.c14_no_negative_cash = pe.Constraint(model.sTime, rule=lambda disjunct, t: model.vNegativeCashAllocations[s, t] >= 0)
+
+    def c14_negative_cash_disjunction(model, s):
+        return [model.d14_cash_above_minimum[s], model.d14_cash_below_minimum[s]]
+
+    def c14_has_negative_cash(model, s):
+        return model.vHasNegativeCash[s] == model.d14_cash_below_minimum[s].binary_indicator_var
+
+    def c15_max_negative_scenarios(model):
+        return sum(model.pScenarioProbability[s]*model.vHasNegativeCash[s] for s in model.sScenarios) <= model.pPropNegativeCash
+
+    # Objective function
+    def obj_expression(model):
+        return model.Objective
+
+    # Activate constraints
+    model.c00_objective_function = pe.Constraint(model.sFinalTime, rule=c00_objective_function)
+    model.c01_initial_non_cash_allocations = pe.Constraint(model.sNonCashAssets, model.sInitialTime, rule=c01_initial_non_cash_allocations)
+    model.c02_initial_cash_allocations = pe.Constraint(model.sScenarios, model.sInitialTime, rule=c02_initial_cash_allocations)
+    model.c03_allocations_evolution_non_cash = pe.Constraint(model.sNonCashAssets, model.sNonInitialTime, rule=c03_allocations_evolution_non_cash)
+    model.c04_allocations_evolution_cash = pe.Constraint(model.sScenarios, model.sNonInitialTime, rule=c04_allocations_evolution_cash)
+    model.c05_absolute_value_cash_trade_positive = pe.Constraint(model.sScenarios, model.sNonFinalTime, rule=c05_absolute_value_cash_trade_positive)
+    model.c06_absolute_value_cash_trade_negative = pe.Constraint(model.sScenarios, model.sNonFinalTime, rule=c06_absolute_value_cash_trade_negative)
+    model.c07_absolute_value_non_cash_trade_positive = pe.Constraint(model.sNonCashAssets, model.sNonFinalTime, rule=c07_absolute_value_non_cash_trade_positive)
+    model.c08_absolute_value_non_cash_trade_negative = pe.Constraint(model.sNonCashAssets, model.sNonFinalTime, rule=c08_absolute_value_non_cash_trade_negative)
+    model.c09_self_financing = pe.Constraint(model.sScenarios, model.sNonFinalTime, rule=c09_self_financing)
+    model.c10_total_wealth = pe.Constraint(model.sScenarios, model.sTime, rule=c10_total_wealth)
+    for suffix in suffixes:
+        if cvar_cuts:
+            model.add_component('cCVaRCutDefinition'+suffix, pe.Constraint(model.sFinalTime, rule=c11_cvar_cut_definition(suffix)))
+            model.add_component('cCVaRCuts'+suffix, pe.ConstraintList(rule=c12_cvar_cuts(suffix)))
+        else:
+            model.add_component('c11_final_wealth_cvar_loss'+suffix, pe.Constraint(model.sScenarios, model.sFinalTime, rule=c11_final_wealth_cvar_loss(suffix)))
+            model.add_component('c12_cvar'+suffix, pe.Constraint(model.sFinalTime, rule=c12_cvar(suffix)))
+    if negative_cash == 'chance':
+        model.c13_negative_cash = pe.Constraint(model.sScenarios, model.sTime, rule=c13_negative_cash)
+        if indicator:
+            model.d14_cash_above_minimum = gdp.Disjunct(model.sScenarios, rule=d14_cash_above_minimum)
+            model.d14_cash_below_minimum = gdp.Disjunct(model.sScenarios)
+            model.c14_negative_cash_disjunction = gdp.Disjunction(model.sScenarios, rule=c14_negative_cash_disjunction)
+            model.c14_has_negative_cash = pe.Constraint(model.sScenarios, rule=c14_has_negative_cash)
+        else:
+            model.c14_count_negative_scenarios = pe.Constraint(model.sScenarios, model.sTime, rule=c14_count_negative_scenarios)
+        model.c15_max_negative_scenarios = pe.Constraint(rule=c15_max_negative_scenarios)
+
+    # Objective function
+    model.f_obj = pe.Objective(rule=obj_expression, sense=pe.maximize)
+
+    return model
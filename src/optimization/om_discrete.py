@@ -21,6 +21,7 @@ def create_model():
     model.pIncome = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
     model.pExpense = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
     model.pTradeFee = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0)
+    model.pScenarioProbability = pe.Param(model.sScenarios, mutable=True, within=pe.NonNegativeReals, initialize=lambda model, s: 1/len(model.sScenarios)) # uniform unless reduced scenarios are used
     
     # Variables
     model.vCashAllocations = pe.Var(model.sScenarios, model.sTime, domain=pe.NonNegativeReals, initialize=0) # shorting not allowed
@@ -35,8 +36,7 @@ def create_model():
     model.Objective = pe.Var(domain=pe.Reals, initialize=0)
     
     def c00_objective_function(model, t):
-        n_scenarios = len(model.sScenarios)
-        return model.Objective == sum(model.vTotalWealth[s,t] for s in model.sScenarios)/n_scenarios
+        return model.Objective == sum(model.pScenarioProbability[s]*model.vTotalWealth[s,t] for s in model.sScenarios)
 
     def c01_initial_non_cash_allocations(model, a, t):
         return model.vNonCashAllocations[a,t] == model.pInitialNonCashAllocations[a]
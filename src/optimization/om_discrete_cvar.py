@@ -21,6 +21,7 @@ def create_model():
     model.pIncome = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
     model.pExpense = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
     model.pTradeFee = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0)
+    model.pScenarioProbability = pe.Param(model.sScenarios, mutable=True, within=pe.NonNegativeReals, initialize=lambda model, s: 1/len(model.sScenarios)) # uniform unless reduced scenarios are used
     model.pCVaRAlpha = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0.05)
     model.pCVaRGamma = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0.0)
     # Variables
@@ -40,8 +41,7 @@ def create_model():
     model.Objective = pe.Var(domain=pe.Reals, initialize=0)
     
     def c00_objective_function(model, t):
-        n_scenarios = len(model.sScenarios)
-        return model.Objective == sum(model.vTotalWealth[s,t] for s in model.sScenarios)/n_scenarios*(1-model.pCVaRGamma) - model.vCVaR[t]*model.pCVaRGamma
+        return model.Objective == sum(model.pScenarioProbability[s]*model.vTotalWealth[s,t] for s in model.sScenarios)*(1-model.pCVaRGamma) - model.vCVaR[t]*model.pCVaRGamma
         
     def c01_initial_non_cash_allocations(model, a, t):
         return model.vNonCashAllocations[a,t] == model.pInitialNonCashAllocations[a]
@@ -77,8 +77,7 @@ def create_model():
         return model.vLoss[s,t] >= - model.vVaR[t] - model.vTotalWealth[s,t]
 
     def c12_cvar(model, t):
-        n_scenarios = len(model.sScenarios)
-        return model.vCVaR[t] == model.vVaR[t] + 1/model.pCVaRAlpha/n_scenarios*sum(model.vLoss[s,t] for s in model.sScenarios)
+        return model.vCVaR[t] == model.vVaR[t] + 1/model.pCVaRAlpha*sum(model.pScenarioProbability[s]*model.vLoss[s,t] for s in model.sScenarios)
         
 
     # Objective function
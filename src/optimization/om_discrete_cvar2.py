@@ -21,6 +21,7 @@ def create_model():
     model.pIncome = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
     model.pExpense = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
     model.pTradeFee = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0)
+    model.pScenarioProbability = pe.Param(model.sScenarios, mutable=True, within=pe.NonNegativeReals, initialize=lambda model, s: 1/len(model.sScenarios)) # uniform unless reduced scenarios are used
     model.pCVaRAlpha1 = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0.05)
     model.pCVaRGamma1 = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0.0)
     model.pCVaRAlpha2 = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0.1)
@@ -45,8 +46,7 @@ def create_model():
     model.Objective = pe.Var(domain=pe.Reals, initialize=0)
     
     def c00_objective_function(model, t):
-        n_scenarios = len(model.sScenarios)
-        return model.Objective == sum(model.vTotalWealth[s,t] for s in model.sScenarios)/n_scenarios*(1-model.pCVaRGamma1-model.pCVaRGamma2) - model.vCVaR1[t]*model.pCVaRGamma1 - model.vCVaR2[t]*model.pCVaRGamma2
+        return model.Objective == sum(model.pScenarioProbability[s]*model.vTotalWealth[s,t] for s in model.sScenarios)*(1-model.pCVaRGamma1-model.pCVaRGamma2) - model.vCVaR1[t]*model.pCVaRGamma1 - model.vCVaR2[t]*model.pCVaRGamma2
         
     def c01_initial_non_cash_allocations(model, a, t):
         return model.vNonCashAllocations[a,t] == model.pInitialNonCashAllocations[a]
@@ -82,15 +82,13 @@ def create_model():
         return model.vLoss1[s,t] >= - model.vVaR1[t] - model.vTotalWealth[s,t]
 
     def c12_cvar1(model, t):
-        n_scenarios = len(model.sScenarios)
-        return model.vCVaR1[t] == model.vVaR1[t] + 1/model.pCVaRAlpha1/n_scenarios*sum(model.vLoss1[s,t] for s in model.sScenarios)
+        return model.vCVaR1[t] == model.vVaR1[t] + 1/model.pCVaRAlpha1*sum(model.pScenarioProbability[s]*model.vLoss1[s,t] for s in model.sScenarios)
         
     def c13_final_wealth_cvar_loss2(model, s, t):
         return model.vLoss2[s,t] >= - model.vVaR2[t] - model.vTotalWealth[s,t]
 
     def c14_cvar2(model, t):
-        n_scenarios = len(model.sScenarios)
-        return model.vCVaR2[t] == model.vVaR2[t] + 1/model.pCVaRAlpha2/n_scenarios*sum(model.vLoss2[s,t] for s in model.sScenarios)
+        return model.vCVaR2[t] == model.vVaR2[t] + 1/model.pCVaRAlpha2*sum(model.pScenarioProbability[s]*model.vLoss2[s,t] for s in model.sScenarios)
         
 
     # Objective function
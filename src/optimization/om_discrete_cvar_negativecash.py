@@ -21,10 +21,12 @@ def create_model():
     model.pIncome = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
     model.pExpense = pe.Param(model.sScenarios, model.sNonFinalTime, mutable=True, within=pe.NonNegativeReals)
     model.pTradeFee = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0)
+    model.pScenarioProbability = pe.Param(model.sScenarios, mutable=True, within=pe.NonNegativeReals, initialize=lambda model, s: 1/len(model.sScenarios)) # uniform unless reduced scenarios are used
     model.pCVaRAlpha = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0.05)
     model.pCVaRGamma = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0.5)
     model.pMinimumCash = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0)
     model.pPropNegativeCash = pe.Param(mutable=True, within=pe.NonNegativeReals, default=0.05)
+    model.pNegativeCashBigM = pe.Param(model.sScenarios, model.sTime, mutable=True, within=pe.NonNegativeReals, initialize=lambda model, s, t: len(model.sTime)*pe.value(model.pInitialCashAllocations)) # bounds from big_m.negative_cash_big_m, set by create_instance
     # Variables
     model.vCashAllocations = pe.Var(model.sScenarios, model.sTime, domain=pe.Reals, initialize=0) # shorting not allowed
     model.vNegativeCashAllocations = pe.Var(model.sScenarios, model.sTime, domain=pe.Reals, bounds=(None, 0), initialize=0)
@@ -44,8 +46,7 @@ def create_model():
     model.Objective = pe.Var(domain=pe.Reals, initialize=0)
     
     def c00_objective_function(model, t):
-        n_scenarios = len(model.sScenarios)
-        return model.Objective == sum(model.vTotalWealth[s,t] for s in model.sScenarios)/n_scenarios*(1-model.pCVaRGamma) - model.vCVaR[t]*model.pCVaRGamma
+        return model.Objective == sum(model.pScenarioProbability[s]*model.vTotalWealth[s,t] for s in model.sScenarios)*(1-model.pCVaRGamma) - model.vCVaR[t]*model.pCVaRGamma
         
     def c01_initial_non_cash_allocations(model, a, t):
         return model.vNonCashAllocations[a,t] == model.pInitialNonCashAllocations[a]
@@ -81,19 +82,16 @@ def create_model():
         return model.vLoss[s,t] >= - model.vVaR[t] - model.vTotalWealth[s,t]
 
     def c12_cvar(model, t):
-        n_scenarios = len(model.sScenarios)
-        return model.vCVaR[t] == model.vVaR[t] + 1/model.pCVaRAlpha/n_scenarios*sum(model.vLoss[s,t] for s in model.sScenarios)
+        return model.vCVaR[t] == model.vVaR[t] + 1/model.pCVaRAlpha*sum(model.pScenarioProbability[s]*model.vLoss[s,t] for s in model.sScenarios)
         
     def c13_negative_cash(model, s, t):
         return model.vNegativeCashAllocations[s,t] <= model.vCashAllocations[s,t] - model.pMinimumCash
     
     def c14_count_negative_scenarios(model, s, t):
-        n_times = len(model.sTime)
-        return model.vNegativeCashAllocations[s, t] + model.vHasNegativeCash[s]*n_times*model.pInitialCashAllocations >= 0
+        return model.vNegativeCashAllocations[s, t] + model.vHasNegativeCash[s]*model.pNegativeCashBigM[s, t] >= 0
 
     def c15_max_negative_scenarios(model):
-        n_scenarios = len(model.sScenarios)
-        return sum(model.vHasNegativeCash[s] for s in model.sScenarios)/n_scenarios <= model.pPropNegativeCash
+        return sum(model.pScenarioProbability[s]*model.vHasNegativeCash[s] for s in model.sScenarios) <= model.pPropNegativeCash
 
     # Objective function
     def obj_expression(model):
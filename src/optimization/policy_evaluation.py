@@ -0,0 +1,137 @@
+import numpy as np
+
+# Paths replayed at once, which bounds the temporary memory to a few times
+# PATHS_CHUNK*n_assets*(horizon+1) floats
+PATHS_CHUNK = 50_000
+
+
+def cvar(wealth, alpha, probabilities=None):
+    """
+    VaR and CVaR of the losses -wealth at level alpha, as defined in the om_* models (c11, c12):
+        CVaR = min_VaR VaR + 1/alpha*E[max(0, -wealth - VaR)]
+    whose minimum is reached at the 1-alpha quantile of the losses.
+    """
+    losses = -np.asarray(wealth, dtype=float)
+    probabilities = np.full(len(losses), 1/len(losses)) if probabilities is None else np.asarray(probabilities, dtype=float)
+    order = np.argsort(losses)
+    cumulative = np.cumsum(probabilities[order])
+    var = losses[order][min(np.searchsorted(cumulative, 1 - alpha - 1e-12), len(losses) - 1)]
+    return var, var + probabilities@np.maximum(losses - var, 0)/alpha
+
+
+class PolicyEvaluator():
+    """
+    Replays a solved trade schedule on new scenarios without any solver. In every om_* model the
+    asset trades vNonCashTrades[a,t] do not depend on the scenario, so for given prices the rest of
+    the decisions follow from the constraints:
+        c03: asset holdings are the initial ones plus the cumulated trades
+        c09: the cash trade is the largest one allowed by the self financing constraint (which is
+            always tight at the optimum), i.e. minus the cost of the asset trades and their fees,
+            net of the fee of the cash trade itself
+        c04: cash evolves with the cash trades, income and expenses (and pCashReturns if given)
+        c10: total wealth is the cash plus the value of the holdings
+    All the scenarios of a chunk are computed at once with NumPy broadcasting.
+    """
+    def __init__(self, trades, initial_non_cash, initial_cash, trade_fee=0., alpha=(0.05,), non_cash_assets=None):
+        self.trades = np.asarray(trades, dtype=float)
+        self.initial_non_cash = np.asarray(initial_non_cash, dtype=float)
+        self.initial_cash = float(initial_cash)
+        self.trade_fee = float(trade_fee)
+        self.alpha = tuple(np.atleast_1d(alpha))
+        self.non_cash_assets = non_cash_assets
+        # c03, holdings (n_assets, horizon+1)
+        self.holdings = np.concatenate([self.initial_non_cash[:, None], self.initial_non_cash[:, None] + np.cumsum(self.trades, axis=1)], axis=1)
+
+    @classmethod
+    def from_instance(cls, instance):
+        """
+        Evaluator of the trade schedule of a solved instance of any om_* model, with its initial
+        allocations, fee and CVaR levels.
+        """
+        from src.results import ResultsAnalyzer
+
+        analyzer = ResultsAnalyzer(instance)
+        alphas = [float(analyzer.get_array(name)) for name in analyzer.params if name.startswith('pCVaRAlpha')]
+        return cls(
+            analyzer.get_array('vNonCashTrades'),
+            analyzer.get_array('pInitialNonCashAllocations'),
+            analyzer.get_array('pInitialCashAllocations'),
+            analyzer.get_array('pTradeFee') if 'pTradeFee' in analyzer.params else 0.,
+            alphas if alphas else (0.05,),
+            analyzer.get_index('vNonCashTrades')[0],
+        )
+
+    def _replay(self, prices, income, expenses, cash_returns):
+        horizon = self.trades.shape[1]
+        fee = self.trade_fee
+        # c09: asset trades cost (trades + fee*|trades|)@prices, paid with the cash trade and its fee
+        asset_cost = np.einsum('sat,at->st', prices[:, :, :horizon], self.trades + fee*np.abs(self.trades))
+        cash_trades = np.where(asset_cost <= 0, -asset_cost/(1 + fee), -asset_cost/(1 - fee))
+        fees = fee*(np.einsum('sat,at->st', prices[:, :, :horizon], np.abs(self.trades)) + np.abs(cash_trades))
+
+        # c04: cash[t] = (cash[t-1] + cash_trades[t-1] + income[t-1] - expenses[t-1])*cash_returns[t-1]
+        flows = cash_trades + income[:, :horizon] - expenses[:, :horizon]
+        cash = np.empty((len(prices), horizon + 1))
+        cash[:, 0] = self.initial_cash
+        if cash_returns is None:
+            cash[:, 1:] = self.initial_cash + np.cumsum(flows, axis=1)
+        else:
+            growth = np.cumprod(cash_returns[:, :horizon], axis=1)
+            cash[:, 1:] = growth*(self.initial_cash + np.cumsum(flows/np.concatenate([np.ones((len(prices), 1)), growth[:, :-1]], axis=1), axis=1))
+
+        # c10
+        total_wealth = cash + np.einsum('sat,at->st', prices, self.holdings)
+        return cash, cash_trades, fees, total_wealth
+
+    def evaluate(self, prices_syms, income_syms, expenses_syms, cash_returns_syms=None, probabilities=None, chunk_size=PATHS_CHUNK, return_paths=False):
+        """
+        Replays the schedule on the scenarios (arrays as for instance_data.create_instance, possibly
+        memory-mapped, which are read chunk_size scenarios at a time) and returns a dict with
+            expected_final_wealth, var, cvar (one per alpha) and objective terms of the final wealth
+            negative_cash_frequency: share of the scenarios with a negative cash at any time
+            negative_cash_frequency_by_time: (horizon+1,) share of negative cash at every time
+            final_wealth: (n_scenarios,)
+            expected_fees: expected total fees paid
+        and, with return_paths, the cash, cash_trades, fees and total_wealth arrays.
+        """
+        n_scenarios, n_assets, n_times = np.shape(prices_syms)
+        if (n_assets, n_times - 1) != self.trades.shape:
+            raise ValueError(f"Prices have {n_assets} assets and {n_times - 1} periods but the trades are {self.trades.shape}")
+        final_wealth = np.empty(n_scenarios)
+        total_fees = np.empty(n_scenarios)
+        negative_cash = np.zeros(n_times)
+        any_negative_cash = 0
+        paths = {'cash': [], 'cash_trades': [], 'fees': [], 'total_wealth': []}
+        for start in range(0, n_scenarios, chunk_size):
+            chunk = slice(start, min(start + chunk_size, n_scenarios))
+            cash_returns = None if cash_returns_syms is None else np.asarray(cash_returns_syms[chunk], dtype=float)
+            cash, cash_trades, fees, total_wealth = self._replay(
+                np.asarray(prices_syms[chunk], dtype=float),
+                np.asarray(income_syms[chunk], dtype=float),
+                np.asarray(expenses_syms[chunk], dtype=float),
+                cash_returns,
+            )
+            final_wealth[chunk] = total_wealth[:, -1]
+            total_fees[chunk] = fees.sum(axis=1)
+            negative = cash < 0
+            negative_cash += negative.sum(axis=0)
+            any_negative_cash += negative.any(axis=1).sum()
+            if return_paths:
+                for name, values in zip(paths, (cash, cash_trades, fees, total_wealth)):
+                    paths[name].append(values)
+
+        probabilities = np.full(n_scenarios, 1/n_scenarios) if probabilities is None else np.asarray(probabilities, dtype=float)
+        risk = [cvar(final_wealth, alpha, probabilities) for alpha in self.alpha]
+        results = {
+            'alpha': np.array(self.alpha),
+            'expected_final_wealth': probabilities@final_wealth,
+            'var': np.array([r[0] for r in risk]),
+            'cvar': np.array([r[1] for r in risk]),
+            'expected_fees': probabilities@total_fees,
+            'negative_cash_frequency': any_negative_cash/n_scenarios,
+            'negative_cash_frequency_by_time': negative_cash/n_scenarios,
+            'final_wealth': final_wealth,
+        }
+        if return_paths:
+            results.update({name: np.concatenate(values) for name, values in paths.items()})
+        return results
@@ -0,0 +1,167 @@
+import logging
+import time
+
+import numpy as np
+import pyomo.environ as pe
+from pyomo.contrib import appsi
+
+from src.optimization.instance_data import create_instance, update_instance
+
+logger = logging.getLogger(__name__)
+
+# appsi update_config flags, all of them off makes solve use the solver model as it is
+UPDATE_FLAGS = (
+    'check_for_new_or_removed_constraints', 'check_for_new_or_removed_vars', 'check_for_new_or_removed_params', 'check_for_new_objective',
+    'update_constraints', 'update_vars', 'update_params', 'update_named_expressions', 'update_objective',
+)
+
+
+class RollingHorizonSolver():
+    """
+    Model Predictive Control driver for the om_* models. The instance is built once and kept in a
+    persistent (appsi) solver. On every step only the mutable params are overwritten with the new
+    scenarios and allocations, the previous solution is shifted one period forward as a warm start
+    as MIP start and the problem is re-solved. Only the first period trades are meant to be executed.
+    """
+    def __init__(self, model, non_cash_assets, solver=None, warm_start=True, **params):
+        self.model = model
+        self.non_cash_assets = list(non_cash_assets)
+        self.solver = solver if solver is not None else appsi.solvers.Highs()
+        self.warm_start = warm_start
+        self.params = params
+        self.instance = None
+        self.n_steps = 0
+        self.timings = []
+
+    def _build(self, prices_syms, income_syms, expenses_syms, cash_returns_syms, initial_cash, initial_non_cash):
+        self.instance = create_instance(
+            self.model, prices_syms, income_syms, expenses_syms, self.non_cash_assets, cash_returns_syms,
+            pInitialCashAllocations=initial_cash,
+            pInitialNonCashAllocations=initial_non_cash,
+            **self.params,
+        )
+
+    def _update(self, prices_syms, income_syms, expenses_syms, cash_returns_syms, initial_cash, initial_non_cash):
+        n_scenarios, n_assets, n_times = np.shape(prices_syms)
+        if n_scenarios != len(self.instance.sScenarios) or n_times != len(self.instance.sTime):
+            raise ValueError(f"Scenarios of shape {np.shape(prices_syms)} do not match the instance, which has {len(self.instance.sScenarios)} scenarios and {len(self.instance.sTime)} times")
+        update_instance(
+            self.instance, prices_syms, income_syms, expenses_syms, cash_returns_syms,
+            pInitialCashAllocations=initial_cash,
+            pInitialNonCashAllocations=initial_non_cash,
+        )
+        if self.warm_start:
+            shift_solution(self.instance)
+
+    def step(self, prices_syms, income_syms, expenses_syms, initial_cash, initial_non_cash=None, cash_returns_syms=None):
+        if initial_non_cash is None:
+            initial_non_cash = np.zeros(len(self.non_cash_assets))
+        t1 = time.time()
+        if self.instance is None:
+            self._build(prices_syms, income_syms, expenses_syms, cash_returns_syms, initial_cash, initial_non_cash)
+            t2 = time.time()
+            results = self.solver.solve(self.instance)
+        else:
+            self._update(prices_syms, income_syms, expenses_syms, cash_returns_syms, initial_cash, initial_non_cash)
+            t2 = time.time()
+            results = solve_warm(self.solver, self.instance) if self.warm_start else self.solver.solve(self.instance)
+        t3 = time.time()
+
+        timing = {
+            'step': self.n_steps,
+            'rebuild': self.n_steps == 0,
+            'update_time': t2 - t1,
+            'solve_time': t3 - t2,
+            'total_time': t3 - t1,
+        }
+        self.timings.append(timing)
+        logger.info(f"Step {self.n_steps}: {'built' if timing['rebuild'] else 'updated'} in {timing['update_time']:.2f} s, solved in {timing['solve_time']:.2f} s")
+        self.n_steps += 1
+
+        return {
+            'non_cash_trades': self.get_first_trades(),
+            'objective': pe.value(self.instance.f_obj),
+            'results': results,
+            'timing': timing,
+        }
+
+    def get_first_trades(self):
+        t0 = self.instance.sInitialTime.first()
+        return np.array([self.instance.vNonCashTrades[a, t0].value for a in self.non_cash_assets])
+
+    def run(self, n_steps, generate_scenarios, execute, initial_cash, initial_non_cash=None):
+        """
+        Runs n_steps of the MPC loop:
+            generate_scenarios(step, cash, non_cash) -> (prices_syms, income_syms, expenses_syms) or
+                (prices_syms, income_syms, expenses_syms, cash_returns_syms) for the models with
+                pCashReturns
+            execute(step, non_cash_trades, cash, non_cash) -> (cash, non_cash)
+        Returns the list of step outputs.
+        """
+        cash = initial_cash
+        non_cash = np.zeros(len(self.non_cash_assets)) if initial_non_cash is None else np.asarray(initial_non_cash)
+        outputs = []
+        for step in range(n_steps):
+            scenarios = generate_scenarios(step, cash, non_cash)
+            if len(scenarios) not in (3, 4):
+                raise ValueError(f"generate_scenarios should return 3 or 4 arrays, got {len(scenarios)}")
+            prices_syms, income_syms, expenses_syms = scenarios[:3]
+            cash_returns_syms = scenarios[3] if len(scenarios) == 4 else None
+            output = self.step(prices_syms, income_syms, expenses_syms, cash, non_cash, cash_returns_syms)
+            cash, non_cash = execute(step, output['non_cash_trades'], cash, non_cash)
+            outputs.append(output)
+        return outputs
+
+
+def shift_solution(instance):
+    """
+    Shifts the values of every time indexed variable one period forward (the value at t takes the
+    one at t+1), so that the previous plan can be used as the starting point of the next solve.
+    """
+    time_sets = [instance.sTime, instance.sNonFinalTime, instance.sNonInitialTime, instance.sFinalTime]
+    for var in instance.component_objects(pe.Var, active=True):
+        if not var.is_indexed():
+            continue
+        last_set = list(var.index_set().subsets(expand_all_set_operators=False))[-1]
+        if not any(last_set is s for s in time_sets):
+            continue
+        values = {idx: var[idx].value for idx in var}
+        for idx in var:
+            next_idx = idx[:-1] + (idx[-1] + 1,) if isinstance(idx, tuple) else idx + 1
+            next_value = values.get(next_idx)
+            if next_value is not None:
+                var[idx].set_value(next_value, skip_validation=True)
+
+
+def solve_warm(solver, instance):
+    """
+    Re-solves the instance of a persistent solver with the current variable values as MIP start, through
+    the Start attribute (Gurobi) or set on the HiGHS model (appsi Highs). LPs and the other solvers only
+    keep their internal model and basis between solves.
+    """
+    variables = [var for var in instance.component_data_objects(pe.Var, active=True) if var.value is not None]
+    if not any(var.is_integer() for var in variables):
+        return solver.solve(instance)
+    if hasattr(solver, 'set_var_attr'):
+        for var in variables:
+            solver.set_var_attr(var, 'Start', var.value)
+        return solver.solve(instance)
+    if not isinstance(solver, appsi.solvers.Highs) or getattr(solver, '_model', None) is not instance:
+        return solver.solve(instance)
+
+    # Any change of the HiGHS model drops the start, so the instance changes are pushed before setting
+    # it and the solve runs without pushing them again
+    solver.update()
+    var_map = solver._pyomo_var_to_solver_var_map
+    columns = np.array([var_map[id(var)] for var in variables], dtype=np.int32)
+    values = np.array([var.value for var in variables], dtype=float)
+    solver._solver_model.setSolution(len(columns), columns, values)
+    config = solver.update_config
+    flags = {name: getattr(config, name) for name in UPDATE_FLAGS}
+    for name in UPDATE_FLAGS:
+        setattr(config, name, False)
+    try:
+        return solver.solve(instance)
+    finally:
+        for name, value in flags.items():
+            setattr(config, name, value)
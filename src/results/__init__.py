@@ -1 +1,2 @@
-from .analyzer import ResultsAnalyzer
\ No newline at end of file
+from .analyzer import ResultsAnalyzer, quantile_bands, scenario_matrix
+from .downsampling import lttb, stratified_scenarios
\ No newline at end of file
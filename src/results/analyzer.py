@@ -2,8 +2,12 @@
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
+import numpy as np
 import pandas as pd
 
+from src.results.archive import open_archive, write_archive
+from src.results.downsampling import MAX_PLOT_POINTS, lttb, stratified_scenarios
+
 class ResultsAnalyzer():
     def __init__(self,instance):
         self.instance = instance
@@ -11,9 +15,72 @@ class ResultsAnalyzer():
         self.vars = None
         self.params = None
         self.sets = None
+        # Caches of the extracted arrays, keyed on (name, dtype), and of the DataFrames built from
+        # them, keyed on (name, col_names)
+        self.array_dict = {}
+        self.index_dict = {}
         self.df_dict = {}
+        # Number of defined values of every variable or param, smaller than the array size for
+        # sparse components
+        self.sizes = {}
+        self.set_dict = {}
+        self.metadata = {}
+
+        if instance is not None:
+            self._load_vars()
+
+    @classmethod
+    def from_archive(cls, path):
+        """
+        Analyzer of a solved instance saved with save_archive, without Pyomo nor the instance. The
+        arrays are memory-mapped from the archive, so only the values that are used are read.
+        """
+        arrays, metadata = open_archive(path)
+        analyzer = cls(None)
+        analyzer.all_vars = metadata['all_vars']
+        analyzer.vars = metadata['vars']
+        analyzer.params = metadata['params']
+        analyzer.sets = metadata['sets']
+        analyzer.sizes = metadata['sizes']
+        analyzer.metadata = metadata['metadata']
+        for name in analyzer.vars + analyzer.params:
+            analyzer.array_dict[(name, np.dtype(np.float64).str)] = arrays['v/'+name]
+            analyzer.index_dict[name] = [arrays[f'i/{name}/{axis}'].tolist() for axis in range(metadata['ndim'][name])]
+        for name in analyzer.sets:
+            analyzer.set_dict[name] = arrays['s/'+name].tolist()
+        return analyzer
+
+    def save_archive(self, path, results=None, **metadata):
+        """
+        Writes the values and indices of all the variables and params, the sets, the objective and
+        the solver results (optional, from legacy or appsi solvers) of the instance to a single
+        uncompressed .npz archive, which can be reopened with ResultsAnalyzer.from_archive. Extra
+        keyword arguments are saved in the metadata.
+        """
+        if self.instance is None:
+            raise ValueError("The analyzer has no instance to save")
+        from pyomo.environ import Objective, value
 
-        self._load_vars()
+        arrays = self.extract()
+        arrays = {'v/'+name: array for name, array in arrays.items()}
+        ndim = {}
+        for name in self.vars + self.params:
+            index_values = self.get_index(name)
+            ndim[name] = len(index_values)
+            for axis, values in enumerate(index_values):
+                arrays[f'i/{name}/{axis}'] = _index_array(values)
+        for name in self.sets:
+            arrays['s/'+name] = _index_array(self.get_set(name))
+        objectives = {obj.name: value(obj) for obj in self.instance.component_data_objects(Objective, active=True)}
+        write_archive(path, arrays, {
+            'all_vars': self.vars + self.params + self.sets,
+            'vars': self.vars,
+            'params': self.params,
+            'sets': self.sets,
+            'ndim': ndim,
+            'sizes': self.sizes,
+            'metadata': {'objectives': objectives, **_solver_metadata(results), **{k: _to_json(v) for k, v in metadata.items()}},
+        })
 
     def _load_vars(self):
         self.all_vars = list(self.instance._decl.keys())
@@ -31,126 +98,211 @@ class ResultsAnalyzer():
     def get_sets(self):
         return self.sets
 
+    def get_set(self, name):
+        if name not in self.sets:
+            raise ValueError(f"{name} is not a valid set in the model. Get all valid sets through the .get_sets method.")
+        if name not in self.set_dict:
+            self.set_dict[name] = list(getattr(self.instance, name))
+        return self.set_dict[name]
+
     def pprint(self, name):
         if name not in self.all_vars:
             raise ValueError(f"{name} is not a valid variable or parameter in the model. Get all valid variables or parameters through the .get_vars or .get_params methods.")
+        if self.instance is None:
+            raise ValueError("pprint needs the Pyomo instance, which is not available for analyzers loaded from an archive")
         obj = getattr(self.instance, name)
         obj.pprint()
 
     
-    def get_df(self, name, col_names = None):
+    def _check_name(self, name):
         if name not in self.all_vars:
             raise ValueError(f"{name} is not a valid variable or parameter in the model. Get all valid variables or parameters through the .get_vars or .get_params methods.")
-        if name in self.df_dict.keys():
-            if col_names is not None:
-                if set(col_names + ['value']) == set(self.df_dict[name].columns):
-                    return self.df_dict[name]
+
+    def get_index(self, name):
+        """
+        Ordered values of every index set of the variable or parameter, one list per axis of its
+        array (e.g. scenarios, assets and times for pPrices).
+        """
+        self._check_name(name)
+        if name not in self.index_dict:
+            obj = getattr(self.instance, name)
+            if not obj.is_indexed():
+                self.index_dict[name] = []
             else:
-                return self.df_dict[name]
-        
-        obj = getattr(self.instance, name)   
-        keys = getattr(self.instance, name+'_index')
+                index_set = obj.index_set()
+                subsets = list(index_set.subsets(expand_all_set_operators=False)) if index_set.dimen != 1 else [index_set]
+                self.index_dict[name] = [list(subset) for subset in subsets]
+        return self.index_dict[name]
+
+    def get_array(self, name, dtype=np.float64):
+        """
+        Values of the variable or parameter as an array with one axis per index set (see get_index),
+        e.g. (scenario, asset, time) for pPrices and (scenario, time) for vTotalWealth. Values that
+        are not defined (unset variables or missing indices) are NaN.
+        """
+        key = (name, np.dtype(dtype).str)
+        if key in self.array_dict:
+            return self.array_dict[key]
+        if self.instance is None:
+            self._check_name(name)
+            array = self.array_dict[(name, np.dtype(np.float64).str)].astype(dtype)
+            self.array_dict[key] = array
+            return array
+        index_values = self.get_index(name)
+        obj = getattr(self.instance, name)
+        values = obj.extract_values()
+        self.sizes[name] = len(values)
+        shape = tuple(len(v) for v in index_values)
+        flat = np.fromiter((np.nan if v is None else v for v in values.values()), dtype=np.float64, count=len(values))
+        if len(values) == int(np.prod(shape)):
+            # Dense components are stored in the order of the product of their index sets
+            array = flat.reshape(shape)
+        else:
+            array = np.full(shape, np.nan)
+            positions = [{v: i for i, v in enumerate(axis)} for axis in index_values]
+            keys = [k if isinstance(k, tuple) else (k,) for k in values.keys()]
+            array[tuple(np.array([p[k[j]] for k in keys], dtype=np.intp) for j, p in enumerate(positions))] = flat
+        array = array.astype(dtype, copy=False)
+        self.array_dict[key] = array
+        return array
 
+    def extract(self, names=None, dtype=np.float64):
+        """
+        Arrays of all the variables and parameters (or the given names), see get_array.
+        """
+        names = self.vars + self.params if names is None else names
+        return {name: self.get_array(name, dtype) for name in names}
+
+    def get_df(self, name, col_names = None):
+        self._check_name(name)
+        index_values = self.get_index(name)
         if col_names is not None:
-            if len(col_names) != len(keys[1]):
-                raise ValueError(f"{len(col_names)} column names have been provided but there are {len(keys[1])} values in the index. For reference, the first index is {keys[1]}")
+            if len(col_names) != len(index_values):
+                raise ValueError(f"{len(col_names)} column names have been provided but there are {len(index_values)} values in the index. For reference, the first index is {tuple(v[0] for v in index_values)}")
         else:
-            col_names = [f'i_{i}' for i in range(len(keys[1]))]
-        
-        df_values = {i:[] for i in col_names + ['value']}
-        for i in keys:
-            for j,c in enumerate(col_names):
-                df_values[c].append(i[j])
-            df_values['value'].append(obj[i].value)
-
-        df = pd.DataFrame(df_values)
-        self.df_dict[name] = df
+            col_names = [f'i_{i}' for i in range(len(index_values))]
+        key = (name, tuple(col_names))
+        if key in self.df_dict:
+            return self.df_dict[key]
+
+        array = self.get_array(name)
+        if index_values:
+            index = pd.MultiIndex.from_product(index_values, names=col_names)
+            df = pd.DataFrame({'value': array.ravel()}, index=index).reset_index()
+        else:
+            df = pd.DataFrame({'value': array.ravel()})
+        # Missing indices of sparse components are not rows of the DataFrame
+        if self.sizes[name] != array.size:
+            df = df[~np.isnan(array.ravel())].reset_index(drop=True)
+        self.df_dict[key] = df
         return df
     
-    def plot_ts(self, name, time_col, col_names=None, colors=None, filter=None, inline_plot=False, df=None):
-        if not df:
+    def _output(self, fig, prefix, inline_plot, path, auto_open):
+        # Figures are written to path, or to a timestamped file in the working directory
+        if inline_plot:
+            fig.show()
+        else:
+            if path is None:
+                path = prefix+'_'+datetime.now().strftime('%Y%m%d%H%M%S%f')+'.html'
+            fig.write_html(path, auto_open=auto_open)
+        return fig
+
+    def plot_ts(self, name, time_col, col_names=None, colors=None, filter=None, inline_plot=False, df=None, path=None, auto_open=True):
+        if df is None:
             df = self.get_df(name=name, col_names=col_names)
         if filter:
             for k in filter.keys():
                 df = df[df[k]==filter[k]]
         fig = px.line(df, x=time_col, y="value", color=colors)
 
-        if inline_plot:
-            fig.show()
-        else:
-            fig.write_html('plot_ts_'+datetime.now().strftime('%Y%m%d%H%M%S')+'.html', auto_open=True)
+        return self._output(fig, 'plot_ts', inline_plot, path, auto_open)
 
-    def plot_dist(self, name, filter, col_names=None, marginal='violin', colors=None, inline_plot=False, df=None):
-        if not df:
+    def plot_paths(self, name, time_col, scenario_col, col_names=None, filter=None, max_scenarios=100, max_points=MAX_PLOT_POINTS, inline_plot=False, df=None, path=None, auto_open=True):
+        """
+        Paths of the variable or param (summed over any other index) for large scenario sets, drawn
+        with WebGL (Scattergl). At most max_scenarios scenarios are drawn, stratified by their final
+        value so that the whole distribution is shown, and the paths are downsampled with LTTB when
+        needed to keep the figure under max_points points.
+        """
+        if df is None:
+            df = self.get_df(name=name, col_names=col_names)
+        if filter:
+            for k in filter.keys():
+                df = df[df[k]==filter[k]]
+
+        times, values = scenario_matrix(df, time_col, scenario_col)
+        scenarios = df[scenario_col].drop_duplicates().sort_values().to_numpy()
+        selected = stratified_scenarios(values[:, -1], max(1, min(max_scenarios, max_points//3)))
+        n_points = max(3, max_points//len(selected))
+        indices = lttb(times, values[selected], n_points) if n_points < len(times) else np.tile(np.arange(len(times)), (len(selected), 1))
+
+        fig = go.Figure()
+        for row, scenario in enumerate(selected):
+            fig.add_trace(
+                go.Scattergl(
+                    x=times[indices[row]],
+                    y=values[scenario, indices[row]],
+                    mode='lines',
+                    line=dict(width=1),
+                    opacity=0.5,
+                    name=f'{scenario_col} {scenarios[scenario]}',
+                )
+            )
+        fig.update_layout(xaxis_title=time_col, yaxis_title=name)
+
+        return self._output(fig, 'plot_paths', inline_plot, path, auto_open)
+
+    def plot_dist(self, name, filter, col_names=None, marginal='violin', colors=None, inline_plot=False, df=None, path=None, auto_open=True):
+        if df is None:
             df = self.get_df(name=name, col_names=col_names)
         if filter:
             for k in filter.keys():
                 df = df[df[k]==filter[k]]
         fig = px.histogram(df,x='value',marginal=marginal, color=colors)
         
-        if inline_plot:
-            fig.show()
-        else:
-            fig.write_html('plot_dist_'+datetime.now().strftime('%Y%m%d%H%M%S')+'.html', auto_open=True)
+        return self._output(fig, 'plot_dist', inline_plot, path, auto_open)
     
-    def plot_ci(self, name, time_col, scenario_col, filter=None, col_names=None, confidence=.95, inline_plot=False, df=None):
-        if confidence <=0 or confidence > 1:
-            raise ValueError(f"Confidence value should be between 0 and 1")
-        if not df:
+    def plot_ci(self, name, time_col, scenario_col, filter=None, col_names=None, confidence=.95, inline_plot=False, df=None, path=None, auto_open=True):
+        """
+        Mean and confidence bands across scenarios of the variable or param (summed over any other
+        index, e.g. assets) at every time. confidence can be a single level or a list of them.
+        """
+        if df is None:
             df = self.get_df(name=name, col_names=col_names)
         if filter:
             for k in filter.keys():
                 df = df[df[k]==filter[k]]
-        
-        first_time_col = df[time_col].iloc[0]
-        n_samples = len(df[df[time_col]==first_time_col])
-        lower_bound = n_samples*(1-confidence)//2
-        upper_bound = n_samples - lower_bound - 1
-
-        df_plot_values = {
-            'time':[],
-            'lower_'+name:[],
-            'upper_'+name:[],
-            'mean_'+name:[],
-        }
-        df_agg = df.groupby([time_col, scenario_col]).agg(func={'value':'sum'}).reset_index()
-        df_agg = df_agg.sort_values(by=[time_col, 'value'], ascending=[True, True])
-        for t in pd.unique(df_agg[time_col]):
-            values = df_agg[df_agg[time_col]==t]['value'].reset_index(drop=True)
-            df_plot_values[time_col].append(t)
-            df_plot_values['lower_'+name].append(values[lower_bound])
-            df_plot_values['upper_'+name].append(values[upper_bound])
-            df_plot_values['mean_'+name].append(values.mean())
-        
-        df_plot = pd.DataFrame(df_plot_values)
-        fig = px.scatter(df_plot, x=time_col, y='lower_'+name)
-        fig.add_trace(px.scatter(df_plot, x=time_col, y='upper_'+name).data[0])
 
-        # Add shaded region between the two time series
-        fig.add_trace(
-            go.Scatter(
-                x=df_plot['time'].tolist() + df_plot['time'].tolist()[::-1],
-                y=df_plot['lower_'+name].tolist() + df_plot['upper_'+name].tolist()[::-1],
-                fill='toself',
-                fillcolor='rgba(0,100,80,0.2)',
-                line=dict(color='rgba(255,255,255,0)'),
-                showlegend=False
+        times, values = scenario_matrix(df, time_col, scenario_col)
+        bands = quantile_bands(values, confidence)
+
+        fig = go.Figure()
+        for i, level in enumerate(bands['confidence']):
+            # Wider bands are drawn first and lighter
+            opacity = 0.1 + 0.3*(i + 1)/len(bands['confidence'])
+            fig.add_trace(
+                go.Scatter(
+                    x=np.concatenate([times, times[::-1]]),
+                    y=np.concatenate([bands['lower'][i], bands['upper'][i][::-1]]),
+                    fill='toself',
+                    fillcolor=f'rgba(0,100,80,{opacity:.2f})',
+                    line=dict(color='rgba(255,255,255,0)'),
+                    name=f'{level:.0%} band',
+                )
             )
-        )
+            for bound in ('lower', 'upper'):
+                fig.add_trace(go.Scatter(x=times, y=bands[bound][i], mode='markers', name=f'{bound}_{name} {level:.0%}'))
         fig.add_trace(
             go.Scatter(
-                x=df_plot[time_col],
-                y=df_plot['mean_'+name],
+                x=times,
+                y=bands['mean'],
                 mode='lines',
                 name='Mean',
                 line=dict(color='red', width=2)
             )
         )
 
-        if inline_plot:
-            fig.show()
-        else:
-            fig.write_html('plot_ci_'+datetime.now().strftime('%Y%m%d%H%M%S')+'.html', auto_open=True)
+        return self._output(fig, 'plot_ci', inline_plot, path, auto_open)
     
     def save_csv(self, name, csv_path_name, col_names=None, filter=None):
         df = self.get_df(name=name, col_names=col_names)
@@ -161,3 +313,69 @@ class ResultsAnalyzer():
             
         
 
+
+def scenario_matrix(df, time_col, scenario_col):
+    """
+    Values of a long DataFrame (as returned by ResultsAnalyzer.get_df) as a (n_scenarios, n_times)
+    array, summed over any other column, and the sorted times.
+    """
+    matrix = df.groupby([scenario_col, time_col])['value'].sum().unstack(time_col)
+    return matrix.columns.to_numpy(), matrix.to_numpy(dtype=float)
+
+
+def quantile_bands(values, confidence=.95):
+    """
+    Mean and central confidence bands of values (n_scenarios, n_times) across scenarios, computed
+    with a single np.quantile call for all times and levels. Returns a dict with
+        confidence: (n_levels,) levels, widest first
+        mean: (n_times,)
+        lower, upper: (n_levels, n_times) quantiles (1-confidence)/2 and (1+confidence)/2
+    """
+    levels = np.sort(np.atleast_1d(np.asarray(confidence, dtype=float)))[::-1]
+    if np.any(levels <= 0) or np.any(levels > 1):
+        raise ValueError(f"Confidence value should be between 0 and 1")
+    values = np.asarray(values, dtype=float)
+    quantiles = np.quantile(values, np.concatenate([(1 - levels)/2, (1 + levels)/2]), axis=0)
+    return {
+        'confidence': levels,
+        'mean': values.mean(axis=0),
+        'lower': quantiles[:len(levels)],
+        'upper': quantiles[len(levels):],
+    }
+
+
+def _index_array(values):
+    # Index values of mixed types would give an object array, which can not be memory-mapped
+    array = np.asarray(values)
+    return array.astype(str) if array.dtype.hasobject else array
+
+
+def _to_json(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _solver_metadata(results):
+    """
+    Termination condition, status, objective and time of the results of a legacy (SolverFactory)
+    or appsi solver.
+    """
+    if results is None:
+        return {}
+    solver = getattr(results, 'solver', None)
+    if solver is not None and hasattr(solver, 'termination_condition'):
+        return {
+            'termination_condition': str(solver.termination_condition),
+            'status': str(solver.status),
+            'solver_time': _to_json(getattr(solver, 'time', None)),
+        }
+    return {
+        'termination_condition': str(results.termination_condition),
+        'best_feasible_objective': _to_json(getattr(results, 'best_feasible_objective', None)),
+        'best_objective_bound': _to_json(getattr(results, 'best_objective_bound', None)),
+        'solver_time': _to_json(getattr(results, 'wallclock_time', None)),
+    }
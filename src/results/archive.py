@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+METADATA_KEY = '__metadata__'
+
+
+def write_archive(path, arrays, metadata):
+    """
+    Writes the arrays and a JSON serializable metadata dict to a single uncompressed .npz file, so
+    that every array can later be memory-mapped straight from the archive (see open_archive).
+    """
+    arrays = {**arrays, METADATA_KEY: np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8)}
+    # Written to a temporary file first so that an interrupted run never leaves a broken archive
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _member_offset(f, info):
+    # The data of a zip member starts after its local header, whose name and extra field lengths
+    # may differ from the ones in the central directory
+    f.seek(info.header_offset + 26)
+    name_length, extra_length = np.frombuffer(f.read(4), dtype='<u2')
+    return info.header_offset + 30 + int(name_length) + int(extra_length)
+
+
+def open_archive(path):
+    """
+    Arrays of an archive written by write_archive, memory-mapped in read mode, and its metadata
+    dict. Only the zip directory and the .npy headers are read, so opening takes milliseconds
+    whatever the size of the archive.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            key = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} is compressed, archives should be written with write_archive")
+            f.seek(_member_offset(f, info))
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            if dtype.hasobject:
+                raise ValueError(f"{info.filename} is an object array, which can not be memory-mapped")
+            if np.prod(shape) == 0:
+                arrays[key] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[key] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape, order='F' if fortran_order else 'C')
+    metadata = json.loads(np.asarray(arrays.pop(METADATA_KEY)).tobytes().decode())
+    return arrays, metadata
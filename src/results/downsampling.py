@@ -0,0 +1,57 @@
+import numpy as np
+
+# Default cap of plotted points per figure, which keeps the HTML files at a few MB
+MAX_PLOT_POINTS = 100_000
+
+
+def stratified_scenarios(final_values, n_scenarios):
+    """
+    Indices of n_scenarios scenarios evenly spread over the ranks of their final values (e.g. final
+    wealth), always including the worst and the best one, in increasing order of final value.
+    """
+    final_values = np.asarray(final_values)
+    order = np.argsort(final_values, kind='stable')
+    if n_scenarios >= len(order):
+        return order
+    ranks = np.unique(np.round(np.linspace(0, len(order) - 1, n_scenarios)).astype(int))
+    return order[ranks]
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling: indices of the n_out points of the series y(x)
+    that best keep its visual shape. y can be a (n_series, n_points) array of series sharing x, in
+    which case the indices are (n_series, n_out) and all the series are processed at once, with a
+    loop over the buckets only.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    single = y.ndim == 1
+    y = np.atleast_2d(y)
+    n_series, n = y.shape
+    if n_out < 3:
+        raise ValueError(f"n_out should be at least 3, got {n_out}")
+    if n_out >= n:
+        indices = np.tile(np.arange(n), (n_series, 1))
+        return indices[0] if single else indices
+
+    # First and last points are kept, the rest is split in n_out-2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty((n_series, n_out), dtype=int)
+    indices[:, 0] = 0
+    indices[:, -1] = n - 1
+    rows = np.arange(n_series)
+    previous = np.zeros(n_series, dtype=int)
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i+1]
+        next_stop = edges[i+2] if i + 2 < len(edges) else n
+        # Point of the bucket that forms the largest triangle with the previous selected point
+        # and the average of the next bucket
+        next_x = x[stop:next_stop].mean()
+        next_y = y[:, stop:next_stop].mean(axis=1)
+        prev_x = x[previous]
+        prev_y = y[rows, previous]
+        area = np.abs((prev_x - next_x)[:, None]*(y[:, start:stop] - prev_y[:, None]) - (prev_x[:, None] - x[start:stop])*(next_y - prev_y)[:, None])
+        previous = start + area.argmax(axis=1)
+        indices[:, i+1] = previous
+    return indices[0] if single else indices
@@ -0,0 +1,112 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.results.analyzer import ResultsAnalyzer
+
+# Figures of every report: file name (without extension) -> (ResultsAnalyzer plot method, kwargs)
+DEFAULT_FIGURES = {
+    'total_wealth_paths': ('plot_paths', {'name': 'vTotalWealth', 'time_col': 'time', 'scenario_col': 'scenario', 'col_names': ['scenario', 'time']}),
+    'total_wealth_bands': ('plot_ci', {'name': 'vTotalWealth', 'time_col': 'time', 'scenario_col': 'scenario', 'col_names': ['scenario', 'time'], 'confidence': (.5, .9)}),
+    'cash_bands': ('plot_ci', {'name': 'vCashAllocations', 'time_col': 'time', 'scenario_col': 'scenario', 'col_names': ['scenario', 'time'], 'confidence': (.5, .9)}),
+}
+# Variables and params summarised at their final time in summary.csv
+DEFAULT_TABLES = ('vTotalWealth', 'vCashAllocations')
+
+
+def summary_table(analyzer, names=DEFAULT_TABLES):
+    """
+    Statistics across scenarios (and any other index) of the values of every variable or param at
+    their last index value, e.g. the final time.
+    """
+    rows = []
+    for name in names:
+        values = np.asarray(analyzer.get_array(name))
+        values = values[..., -1].ravel() if values.ndim else values.ravel()
+        values = values[~np.isnan(values)]
+        quantiles = np.quantile(values, [.05, .5, .95]) if len(values) else [np.nan]*3
+        rows.append({
+            'name': name,
+            'mean': values.mean() if len(values) else np.nan,
+            'std': values.std() if len(values) else np.nan,
+            'min': values.min() if len(values) else np.nan,
+            'q05': quantiles[0],
+            'median': quantiles[1],
+            'q95': quantiles[2],
+            'max': values.max() if len(values) else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+
+def report_name(archive_path):
+    return os.path.splitext(os.path.basename(archive_path))[0]
+
+
+def build_report(archive_path, output_dir, figures=DEFAULT_FIGURES, tables=DEFAULT_TABLES):
+    """
+    Writes the figures (headless, one html file per figure) and the summary table of a result
+    archive to output_dir/<archive name>/. Figures that fail, e.g. because the model does not have
+    the variable, are recorded in the timings instead of stopping the report.
+    Returns the run summary (archive metadata) and the timings of every step.
+    """
+    run = report_name(archive_path)
+    directory = os.path.join(output_dir, run)
+    os.makedirs(directory, exist_ok=True)
+    timings = []
+
+    t1 = time.perf_counter()
+    analyzer = ResultsAnalyzer.from_archive(archive_path)
+    timings.append({'run': run, 'item': 'load', 'time': time.perf_counter() - t1, 'error': None})
+
+    for figure, (method, kwargs) in figures.items():
+        t1 = time.perf_counter()
+        error = None
+        try:
+            getattr(analyzer, method)(**kwargs, inline_plot=False, path=os.path.join(directory, figure + '.html'), auto_open=False)
+        except Exception as e:
+            error = repr(e)
+        timings.append({'run': run, 'item': figure, 'time': time.perf_counter() - t1, 'error': error})
+
+    t1 = time.perf_counter()
+    names = [name for name in tables if name in analyzer.all_vars]
+    summary_table(analyzer, names).to_csv(os.path.join(directory, 'summary.csv'), index=False)
+    timings.append({'run': run, 'item': 'summary', 'time': time.perf_counter() - t1, 'error': None})
+
+    metadata = analyzer.metadata
+    summary = {'run': run, **{k: v for k, v in metadata.items() if k != 'objectives'}, **metadata.get('objectives', {})}
+    return summary, timings
+
+
+def _build_report(args):
+    return build_report(*args)
+
+
+def generate_reports(archive_paths, output_dir, figures=DEFAULT_FIGURES, tables=DEFAULT_TABLES, n_workers=None):
+    """
+    Builds the report of every result archive (see ResultsAnalyzer.save_archive) with a pool of
+    n_workers processes, without opening any browser. Every report goes to
+    output_dir/<archive name>/<figure>.html and summary.csv, and output_dir gets runs.csv (one row of
+    solver metadata and objectives per archive) and timings.csv (time of every figure and table).
+    """
+    archive_paths = list(archive_paths)
+    runs = [report_name(path) for path in archive_paths]
+    if len(set(runs)) != len(runs):
+        raise ValueError("Archive file names should be unique, as they name the report directories")
+    os.makedirs(output_dir, exist_ok=True)
+
+    tasks = list(zip(archive_paths, repeat(output_dir), repeat(figures), repeat(tables)))
+    if n_workers == 1 or len(tasks) <= 1:
+        results = [_build_report(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(n_workers) as executor:
+            results = list(executor.map(_build_report, tasks))
+
+    df_runs = pd.DataFrame([summary for summary, _ in results])
+    df_timings = pd.DataFrame([timing for _, timings in results for timing in timings])
+    df_runs.to_csv(os.path.join(output_dir, 'runs.csv'), index=False)
+    df_timings.to_csv(os.path.join(output_dir, 'timings.csv'), index=False)
+    return df_runs, df_timings
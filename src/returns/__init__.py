@@ -1 +1,3 @@
-from .gaussian import LogNormalReturns
\ No newline at end of file
+from .gaussian import LogNormalReturns
+from .factor import FactorReturns
+from .bootstrap import BootstrapReturns
\ No newline at end of file
@@ -0,0 +1,148 @@
+import numpy as np
+
+from src.returns.gaussian import CHUNK_ELEMENTS
+from src.sampling import PathDrawer, as_path_drawer, as_seed_sequence, path_chunks
+from src.scenarios.store import write_chunks
+
+BLOCK_METHODS = ('stationary', 'circular')
+
+
+class BootstrapReturns():
+    """
+    Non-parametric returns model which resamples blocks of the historical log returns of all the
+    assets at once, keeping their cross-sectional and short-term serial dependence.
+        method='circular': blocks of exactly block_size periods starting at uniform random dates,
+            wrapping around the end of the history
+        method='stationary': blocks of geometric length with mean block_size (Politis & Romano)
+    The historical period of every simulated period is computed for all paths at once and the
+    returns are gathered with a single fancy indexing operation, without any per-path loop.
+    """
+    def __init__(self, block_size=10, method='stationary', seed=42):
+        if method not in BLOCK_METHODS:
+            raise ValueError(f"method should be one of {BLOCK_METHODS}, got {method}")
+        if block_size < 1:
+            raise ValueError(f"block_size should be at least 1, got {block_size}")
+        self.block_size = block_size
+        self.method = method
+        self.seed = seed
+        self.prices = None
+        self.last_prices = None
+        self.log_returns = None
+        self.mean = None
+        self.seed_sequence = as_seed_sequence(seed)
+        self.price_0 = None
+
+    def fit(self, df_prices):
+        self.prices = df_prices
+        self.last_prices = df_prices.iloc[-1,:].to_numpy(dtype=float)
+        self.log_returns = np.log(df_prices / df_prices.shift(1)).dropna().to_numpy(dtype=float)
+        self.mean = self.log_returns.mean(axis=0)
+
+    def get_config(self):
+        return {'block_size': self.block_size, 'method': self.method}
+
+    def get_params(self):
+        params = {
+            'log_returns': self.log_returns,
+            'last_prices': self.last_prices,
+        }
+        # Only a price_0 set explicitly is kept, otherwise the last prices are used
+        if self.price_0 is not None:
+            params['price_0'] = np.asarray(self.price_0, dtype=float)
+        return params
+
+    def set_params(self, params):
+        self.log_returns = params['log_returns']
+        self.mean = self.log_returns.mean(axis=0)
+        self.price_0 = params.get('price_0')
+        self.last_prices = params['last_prices']
+
+    def set_price_0(self, price_0):
+        self.price_0 = price_0
+
+    def set_horizon(self, horizon):
+        self.horizon = horizon
+
+    def set_seed(self, seed):
+        self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
+
+    def next_stream(self):
+        """
+        SeedSequence of the next simulation. Every simulation uses a new child of the seed, so
+        repeated calls give different but reproducible paths.
+        """
+        return self.seed_sequence.spawn(1)[0]
+
+    def _get_price_0(self, price_0):
+        if self.log_returns is None:
+            raise ValueError("Model not fitted. Please use fit() method first.")
+        if price_0 is None:
+            price_0 = self.price_0 if self.price_0 is not None else self.last_prices
+        return np.asarray(price_0, dtype=float)
+
+    def _sample_indices(self, rng, n_paths, horizon):
+        """
+        (n_paths, horizon) array with the historical period resampled for every simulated one.
+        """
+        n_obs = len(self.log_returns)
+        if self.method == 'circular':
+            n_blocks = -(-horizon//self.block_size)
+            starts = rng.integers(0, n_obs, size=(n_paths, n_blocks))
+            indices = starts[:, :, None] + np.arange(self.block_size)
+            return indices.reshape(n_paths, -1)[:, :horizon] % n_obs
+        # A new block starts at every period with probability 1/block_size. Every period takes the
+        # index of the start of its block plus the periods elapsed since then
+        starts = rng.integers(0, n_obs, size=(n_paths, horizon))
+        new_block = rng.random((n_paths, horizon)) < 1/self.block_size
+        new_block[:, 0] = True
+        periods = np.arange(horizon)
+        block_start = np.maximum.accumulate(np.where(new_block, periods, 0), axis=1)
+        return (np.take_along_axis(starts, block_start, axis=1) + periods - block_start) % n_obs
+
+    def simulate(self, stream, horizon, n_paths, start=0, stop=None, price_0=None, time_major=False, dtype=np.float64):
+        """
+        Paths start to stop of the simulation of n_paths paths with the stream (a SeedSequence from
+        next_stream, or a src.sampling.PathDrawer of it).
+        """
+        price_0 = self._get_price_0(price_0)
+        stop = n_paths if stop is None else stop
+        # The indices of a block are drawn at once, as the draws of _sample_indices depend on the batch
+        drawer = as_path_drawer(stream, n_paths)
+        indices = drawer.draw(start, stop, lambda rng: lambda n: self._sample_indices(rng, n, horizon), sequential=False)
+        n_paths = stop - start
+        log_prices = self.log_returns[indices]
+        np.cumsum(log_prices, axis=1, out=log_prices)
+        np.exp(log_prices, out=log_prices)
+        log_prices *= price_0
+        n_assets = len(price_0)
+        if time_major:
+            prices = np.empty((horizon+1, n_paths, n_assets), dtype=dtype)
+            prices[0] = price_0
+            prices[1:] = log_prices.transpose(1, 0, 2)
+        else:
+            prices = np.empty((n_paths, n_assets, horizon+1), dtype=dtype)
+            prices[:, :, 0] = price_0
+            prices[:, :, 1:] = log_prices.transpose(0, 2, 1)
+        return prices
+
+    def predict_chunks(self, horizon, n_paths=1, price_0=None, chunk_size=None, time_major=False, dtype=np.float64, stream=None):
+        drawer = PathDrawer(self.next_stream() if stream is None else stream, n_paths)
+        if chunk_size is None:
+            chunk_size = max(1, CHUNK_ELEMENTS//max(1, horizon*len(self.mean)))
+        for start, stop in path_chunks(n_paths, chunk_size):
+            yield self.simulate(drawer, horizon, n_paths, start, stop, price_0, time_major, dtype)
+
+    def predict(self, horizon, n_paths=1, price_0=None, time_major=False, dtype=np.float64, chunk_size=None, stream=None):
+        """
+        Simulates n_paths price paths of shape (n_paths, n_assets, horizon+1), or
+        (horizon+1, n_paths, n_assets) if time_major, as LogNormalReturns.predict.
+        """
+        chunks = list(self.predict_chunks(horizon, n_paths, price_0, chunk_size, time_major, dtype, stream))
+        return np.concatenate(chunks, axis=1 if time_major else 0)
+
+    def predict_to_file(self, path, horizon, n_paths=1, price_0=None, chunk_size=None, time_major=False, dtype=np.float64):
+        n_assets = len(self.mean)
+        shape = (horizon+1, n_paths, n_assets) if time_major else (n_paths, n_assets, horizon+1)
+        chunks = self.predict_chunks(horizon, n_paths, price_0, chunk_size, time_major, dtype)
+        return write_chunks(path, chunks, shape, dtype, axis=1 if time_major else 0)
@@ -0,0 +1,164 @@
+import numpy as np
+
+from src.returns.gaussian import CHUNK_ELEMENTS
+from src.sampling import BATCH_SAMPLING_METHODS, NormalSampler, PathDrawer, as_path_drawer, as_seed_sequence, path_chunks
+from src.scenarios.store import write_chunks
+
+
+class FactorReturns():
+    """
+    Statistical factor model of the asset log returns for large universes:
+        log_returns = mean + loadings@factors + idiosyncratic
+    The factors are the first n_factors principal components of the historical log returns,
+    standardised and independent, and the idiosyncratic terms are independent with the variance
+    left unexplained by the factors (diagonal covariance). Sampling costs O(n_assets*n_factors) per
+    path and period instead of the O(n_assets^2) of the dense LogNormalReturns.
+    """
+    def __init__(self, n_factors=5, seed=42, sampling='random'):
+        self.n_factors = n_factors
+        self.seed = seed
+        self.sampling = sampling
+        self.prices = None
+        self.last_prices = None
+        self.mean = None
+        self.loadings = None
+        self.idiosyncratic_std = None
+        self.explained_variance_ratio = None
+        self.seed_sequence = as_seed_sequence(seed)
+        self.price_0 = None
+
+    def fit(self, df_prices):
+        self.prices = df_prices
+        self.last_prices = df_prices.iloc[-1,:].to_numpy(dtype=float)
+        log_returns = np.log(df_prices / df_prices.shift(1)).dropna().to_numpy()
+        n_obs, n_assets = log_returns.shape
+        if not 0 < self.n_factors <= min(n_obs - 1, n_assets):
+            raise ValueError(f"n_factors should be between 1 and {min(n_obs - 1, n_assets)}, got {self.n_factors}")
+        self.mean = log_returns.mean(axis=0)
+        centered = log_returns - self.mean
+        _, singular_values, components = np.linalg.svd(centered, full_matrices=False)
+        factor_std = singular_values[:self.n_factors]/np.sqrt(n_obs - 1)
+        self.loadings = components[:self.n_factors].T*factor_std
+        variance = centered.var(axis=0, ddof=1)
+        self.idiosyncratic_std = np.sqrt(np.clip(variance - (self.loadings**2).sum(axis=1), 0, None))
+        self.explained_variance_ratio = (factor_std**2).sum()/variance.sum()
+
+    def get_config(self):
+        return {'n_factors': self.n_factors, 'sampling': self.sampling}
+
+    def get_params(self):
+        params = {
+            'mean': self.mean,
+            'loadings': self.loadings,
+            'idiosyncratic_std': self.idiosyncratic_std,
+            'last_prices': self.last_prices,
+        }
+        # Only a price_0 set explicitly is kept, otherwise the last prices are used
+        if self.price_0 is not None:
+            params['price_0'] = np.asarray(self.price_0, dtype=float)
+        return params
+
+    def set_params(self, params):
+        if params['loadings'].shape[1] != self.n_factors:
+            raise ValueError(f"The params have {params['loadings'].shape[1]} factors but the model has n_factors={self.n_factors}")
+        self.mean = params['mean']
+        self.loadings = params['loadings']
+        self.idiosyncratic_std = params['idiosyncratic_std']
+        self.price_0 = params.get('price_0')
+        self.last_prices = params['last_prices']
+
+    def set_price_0(self, price_0):
+        self.price_0 = price_0
+
+    def set_horizon(self, horizon):
+        self.horizon = horizon
+
+    def set_seed(self, seed):
+        self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
+
+    def next_stream(self):
+        """
+        SeedSequence of the next simulation. Every simulation uses a new child of the seed, so
+        repeated calls give different but reproducible paths.
+        """
+        return self.seed_sequence.spawn(1)[0]
+
+    @property
+    def cov(self):
+        # Implied covariance, only built on request as it is n_assets x n_assets
+        return self.loadings@self.loadings.T + np.diag(self.idiosyncratic_std**2)
+
+    def _get_price_0(self, price_0):
+        if self.mean is None or self.loadings is None:
+            raise ValueError("Model not fitted. Please use fit() method first.")
+        if price_0 is None:
+            price_0 = self.price_0 if self.price_0 is not None else self.last_prices
+        return np.asarray(price_0, dtype=float)
+
+    def simulate(self, stream, horizon, n_paths, start=0, stop=None, price_0=None, time_major=False, dtype=np.float64, sampling=None, return_factors=False):
+        """
+        Paths start to stop of the simulation of n_paths paths with the stream (a SeedSequence from
+        next_stream, or a src.sampling.PathDrawer of it).
+        """
+        price_0 = self._get_price_0(price_0)
+        stop = n_paths if stop is None else stop
+        n_assets = len(self.mean)
+        dim = horizon*(self.n_factors + n_assets)
+        method = self.sampling if sampling is None else sampling
+        drawer = as_path_drawer(stream, n_paths)
+        shocks = drawer.draw(start, stop, lambda rng: NormalSampler(dim, method, rng).draw, method not in BATCH_SAMPLING_METHODS)
+        n_paths = stop - start
+        shocks = shocks.reshape(n_paths, horizon, self.n_factors + n_assets)
+        factor_returns = shocks[:, :, :self.n_factors]
+        log_prices = factor_returns@self.loadings.T
+        log_prices += shocks[:, :, self.n_factors:]*self.idiosyncratic_std
+        log_prices += self.mean
+        np.cumsum(log_prices, axis=1, out=log_prices)
+        np.exp(log_prices, out=log_prices)
+        log_prices *= price_0
+        if time_major:
+            prices = np.empty((horizon+1, n_paths, n_assets), dtype=dtype)
+            prices[0] = price_0
+            prices[1:] = log_prices.transpose(1, 0, 2)
+        else:
+            prices = np.empty((n_paths, n_assets, horizon+1), dtype=dtype)
+            prices[:, :, 0] = price_0
+            prices[:, :, 1:] = log_prices.transpose(0, 2, 1)
+        if not return_factors:
+            return prices
+        # Cumulative standardised factor returns, 0 at the first period
+        factors = np.zeros((n_paths, self.n_factors, horizon+1), dtype=dtype)
+        factors[:, :, 1:] = np.cumsum(factor_returns, axis=1).transpose(0, 2, 1)
+        return prices, factors
+
+    def predict_chunks(self, horizon, n_paths=1, price_0=None, chunk_size=None, time_major=False, dtype=np.float64, sampling=None, return_factors=False, stream=None):
+        """
+        Yields the simulated prices chunk_size paths at a time (see predict), or (prices, factors)
+        tuples if return_factors.
+        """
+        drawer = PathDrawer(self.next_stream() if stream is None else stream, n_paths)
+        if chunk_size is None:
+            chunk_size = max(1, CHUNK_ELEMENTS//max(1, horizon*(self.n_factors + len(self.mean))))
+        for start, stop in path_chunks(n_paths, chunk_size):
+            yield self.simulate(drawer, horizon, n_paths, start, stop, price_0, time_major, dtype, sampling, return_factors)
+
+    def predict(self, horizon, n_paths=1, price_0=None, time_major=False, dtype=np.float64, chunk_size=None, sampling=None, return_factors=False, stream=None):
+        """
+        Simulates n_paths price paths of shape (n_paths, n_assets, horizon+1), or
+        (horizon+1, n_paths, n_assets) if time_major. With return_factors, the cumulative factor
+        paths (n_paths, n_factors, horizon+1) are returned too, e.g. to be used as the features of
+        scenarios.ScenarioReduction.
+        """
+        chunks = list(self.predict_chunks(horizon, n_paths, price_0, chunk_size, time_major, dtype, sampling, return_factors, stream))
+        if not return_factors:
+            return np.concatenate(chunks, axis=1 if time_major else 0)
+        prices = np.concatenate([c[0] for c in chunks], axis=1 if time_major else 0)
+        factors = np.concatenate([c[1] for c in chunks], axis=0)
+        return prices, factors
+
+    def predict_to_file(self, path, horizon, n_paths=1, price_0=None, chunk_size=None, time_major=False, dtype=np.float64, sampling=None):
+        n_assets = len(self.mean)
+        shape = (horizon+1, n_paths, n_assets) if time_major else (n_paths, n_assets, horizon+1)
+        chunks = self.predict_chunks(horizon, n_paths, price_0, chunk_size, time_major, dtype, sampling)
+        return write_chunks(path, chunks, shape, dtype, axis=1 if time_major else 0)
@@ -1,22 +1,109 @@
-from scipy.stats import multivariate_normal
 import numpy as np
+import pandas as pd
+
+from src.moments import RunningMoments
+from src.sampling import BATCH_SAMPLING_METHODS, NormalSampler, PathDrawer, as_path_drawer, as_seed_sequence, path_chunks
+from src.scenarios.store import write_chunks
+
+# Default number of shocks (paths x periods x assets) generated at once when chunking
+CHUNK_ELEMENTS = 2**24
 
 class LogNormalReturns():
-    def __init__(self, seed=42):
+    def __init__(self, seed=42, sampling='random', decay=None):
         self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
+        self.sampling = sampling
+        self.decay = decay
         self.prices = None
+        self.assets = None
+        self.last_prices = None
+        self.moments = None
         self.log_returns = None
         self.mean = None
         self.cov = None
-        self.dist = None
+        self.chol = None
         self.price_0 = None
 
     def fit(self, df_prices):
         self.prices = df_prices
+        self.assets = list(df_prices.columns)
+        self.last_prices = df_prices.iloc[-1,:].to_numpy(dtype=float)
         log_returns = np.log(df_prices / df_prices.shift(1)).dropna()
-        self.mean = log_returns.mean().values
-        self.cov = log_returns.cov().values
-        self.dist = multivariate_normal(self.mean, self.cov, seed=self.seed)
+        if self.decay is None:
+            self.mean = log_returns.mean().values
+            self.cov = log_returns.cov().values
+            self.moments = RunningMoments.from_data(log_returns.values, mean=self.mean, cov=self.cov)
+        else:
+            self.moments = RunningMoments.from_data(log_returns.values, decay=self.decay)
+            self.mean = self.moments.mean
+            self.cov = self.moments.cov()
+        self.chol = cholesky_factor(self.cov)
+
+    def partial_fit(self, df_new_prices):
+        """
+        Updates the fit with new price rows (e.g. the latest monthly bar) that follow the ones
+        already seen, in O(n_assets^2) per row. With decay, older log returns are exponentially
+        down-weighted. The Cholesky factor is only recomputed at the next simulation.
+        """
+        if self.moments is None:
+            raise ValueError("Model not fitted. Please use fit() method first.")
+        if isinstance(df_new_prices, pd.DataFrame) and self.assets is not None:
+            if set(df_new_prices.columns) != set(self.assets):
+                raise ValueError(f"New prices have columns {list(df_new_prices.columns)} but the model was fitted on {self.assets}")
+            df_new_prices = df_new_prices[self.assets]
+        for prices in np.asarray(df_new_prices, dtype=float).reshape(-1, len(self.mean)):
+            self.moments.update(np.log(prices/self.last_prices))
+            self.last_prices = prices
+        self.mean = self.moments.mean
+        self.cov = self.moments.cov()
+        self.chol = None
+
+    def update(self, new_prices):
+        self.partial_fit(new_prices)
+
+    def _refresh(self):
+        if self.chol is None:
+            self.chol = cholesky_factor(self.cov)
+
+    def next_stream(self):
+        """
+        SeedSequence of the next simulation. Every simulation uses a new child of the seed, so
+        repeated calls give different but reproducible paths.
+        """
+        return self.seed_sequence.spawn(1)[0]
+
+    def get_config(self):
+        # Constructor settings, which together with the seed and the data define the results
+        return {'sampling': self.sampling, 'decay': self.decay}
+
+    def get_params(self):
+        params = {
+            'mean': self.mean,
+            'cov': self.cov,
+            'last_prices': self.last_prices,
+            'weight': np.array(self.moments.weight),
+            'weight_sq': np.array(self.moments.weight_sq),
+        }
+        if self.assets is not None:
+            params['assets'] = np.array(self.assets, dtype=str)
+        # Only a price_0 set explicitly is kept, otherwise the last prices are used
+        if self.price_0 is not None:
+            params['price_0'] = np.asarray(self.price_0, dtype=float)
+        return params
+
+    def set_params(self, params):
+        # Restores a fitted model without the price history, e.g. from the cache
+        self.assets = list(params['assets']) if 'assets' in params else None
+        self.mean = params['mean']
+        self.cov = params['cov']
+        self.price_0 = params.get('price_0')
+        self.last_prices = params['last_prices']
+        self.moments = RunningMoments(len(self.mean), self.decay)
+        self.moments.weight = float(params['weight'])
+        self.moments.weight_sq = float(params['weight_sq'])
+        self.moments.mean = self.mean
+        self.moments.m2 = self.cov*self.moments._cov_denominator()
+        self.chol = cholesky_factor(self.cov)
 
     def set_price_0(self, price_0):
         self.price_0 = price_0
@@ -24,24 +111,105 @@ class LogNormalReturns():
     def set_horizon(self, horizon):
         self.horizon = horizon
 
-    def predict(self, horizon, n_paths=1, price_0=None):
+    def set_seed(self, seed):
+        self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
+
+    def _get_price_0(self, price_0):
         if self.mean is None or self.cov is None:
             raise ValueError("Model not fitted. Please use fit() method first.")
-        
-        if self.price_0 is None and price_0 is None:
-            self.set_price_0(self.prices.iloc[-1,:].to_numpy())
 
         if price_0 is None:
-            price_0 = self.price_0
-        
-        # Generate new prices for each path
-        prices = np.zeros((n_paths, len(self.mean), horizon+1))
-        prices[:, :, 0] = np.tile(price_0, (n_paths, 1))
+            price_0 = self.price_0 if self.price_0 is not None else self.last_prices
+        return np.asarray(price_0, dtype=float)
+
+    def _simulate_into(self, out, drawer, start, stop, horizon, price_0, time_major, sampling):
+        # The shocks are drawn in (path, period, asset) order, by blocks of paths of the stream, so
+        # that the result does not depend on the chunks
+        dim = horizon*len(self.mean)
+        method = self.sampling if sampling is None else sampling
+        shocks = drawer.draw(start, stop, lambda rng: NormalSampler(dim, method, rng).draw, method not in BATCH_SAMPLING_METHODS)
+        prices = shocks.reshape(stop-start, horizon, len(self.mean))@self.chol.T
+        prices += self.mean
+        np.cumsum(prices, axis=1, out=prices)
+        np.exp(prices, out=prices)
+        prices *= price_0
+        if time_major:
+            out[0] = price_0
+            out[1:] = prices.transpose(1, 0, 2)
+        else:
+            out[:, :, 0] = price_0
+            out[:, :, 1:] = prices.transpose(0, 2, 1)
+
+    def _chunks(self, horizon, n_paths, chunk_size):
+        if chunk_size is None:
+            chunk_size = max(1, CHUNK_ELEMENTS//max(1, horizon*len(self.mean)))
+        return path_chunks(n_paths, chunk_size)
+
+    def simulate(self, stream, horizon, n_paths, start=0, stop=None, price_0=None, time_major=False, dtype=np.float64, sampling=None):
+        """
+        Paths start to stop of the simulation of n_paths paths with the stream (a SeedSequence from
+        next_stream), or a src.sampling.PathDrawer of it. Used to split a simulation, e.g. across
+        processes, see src.scenarios.parallel.parallel_predict.
+        """
+        price_0 = self._get_price_0(price_0)
+        self._refresh()
+        drawer = as_path_drawer(stream, n_paths)
+        stop = n_paths if stop is None else stop
+        n_assets = len(self.mean)
+        shape = (horizon+1, stop-start, n_assets) if time_major else (stop-start, n_assets, horizon+1)
+        prices = np.empty(shape, dtype=dtype)
+        for chunk_start, chunk_stop in self._chunks(horizon, stop-start, None):
+            out = prices[:, chunk_start:chunk_stop] if time_major else prices[chunk_start:chunk_stop]
+            self._simulate_into(out, drawer, start+chunk_start, start+chunk_stop, horizon, price_0, time_major, sampling)
+        return prices
+
+    def predict_chunks(self, horizon, n_paths=1, price_0=None, chunk_size=None, time_major=False, dtype=np.float64, sampling=None, stream=None):
+        """
+        Yields the simulated prices chunk_size paths at a time, with shape
+        (chunk_size, n_assets, horizon+1) or (horizon+1, chunk_size, n_assets) if time_major.
+        """
+        drawer = PathDrawer(self.next_stream() if stream is None else stream, n_paths)
+        for start, stop in self._chunks(horizon, n_paths, chunk_size):
+            yield self.simulate(drawer, horizon, n_paths, start, stop, price_0, time_major, dtype, sampling)
+
+    def predict(self, horizon, n_paths=1, price_0=None, time_major=False, dtype=np.float64, chunk_size=None, sampling=None, stream=None):
+        """
+        Simulates n_paths price paths of shape (n_paths, n_assets, horizon+1), or the contiguous
+        (horizon+1, n_paths, n_assets) if time_major. Paths are generated chunk_size at a time to
+        bound the temporary memory, which does not change the result. sampling overrides the
+        sampling method of the model (see src.sampling.NormalSampler). Each call uses a new stream
+        of the seed (see next_stream) unless one is given.
+        """
+        price_0 = self._get_price_0(price_0)
+        self._refresh()
+        drawer = PathDrawer(self.next_stream() if stream is None else stream, n_paths)
+        n_assets = len(self.mean)
+        shape = (horizon+1, n_paths, n_assets) if time_major else (n_paths, n_assets, horizon+1)
+        prices = np.empty(shape, dtype=dtype)
+        for start, stop in self._chunks(horizon, n_paths, chunk_size):
+            self._simulate_into(prices[:, start:stop] if time_major else prices[start:stop], drawer, start, stop, horizon, price_0, time_major, sampling)
 
-        for t in range(1, horizon+1):
-            log_returns_sampled = self.dist.rvs(size=n_paths)
-            prices[:, :, t] = prices[:, :, t-1] * np.exp(log_returns_sampled)
+        return prices
 
+    def predict_to_file(self, path, horizon, n_paths=1, price_0=None, chunk_size=None, time_major=False, dtype=np.float64, sampling=None):
+        """
+        Writes the simulated prices chunk by chunk to a .npy file, so that they never have to fit in
+        memory, and returns them memory-mapped.
+        """
+        n_assets = len(self.mean)
+        shape = (horizon+1, n_paths, n_assets) if time_major else (n_paths, n_assets, horizon+1)
+        chunks = self.predict_chunks(horizon, n_paths, price_0, chunk_size, time_major, dtype, sampling)
+        return write_chunks(path, chunks, shape, dtype, axis=1 if time_major else 0)
 
-        return np.clip(prices, 0, None)
 
+def cholesky_factor(cov):
+    """
+    Factor L with L@L.T == cov: the lower triangular Cholesky factor or, for singular covariance
+    matrices (e.g. perfectly correlated assets), the one from the eigendecomposition.
+    """
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(cov)
+        return vectors*np.sqrt(np.clip(values, 0, None))
@@ -0,0 +1,162 @@
+import warnings
+
+import numpy as np
+from scipy.stats import norm, qmc
+
+SAMPLING_METHODS = ('random', 'antithetic', 'moment_matching', 'sobol', 'halton')
+
+# Paths drawn from each child seed of a simulation stream. Path i is always generated from the
+# block i//SEED_BLOCK_PATHS, so any range of paths can be simulated on its own (e.g. by different
+# processes) and the concatenation does not depend on how the paths were split
+SEED_BLOCK_PATHS = 1024
+
+# Methods whose draws depend on the batch sizes, which are drawn a whole block at a time
+BATCH_SAMPLING_METHODS = ('moment_matching',)
+
+# Largest dimension of the scipy Sobol direction numbers, also used as limit for Halton
+MAX_QMC_DIM = 21201
+
+
+def as_seed_sequence(seed):
+    """
+    numpy SeedSequence from an int (or None, for fresh entropy) or an existing SeedSequence, e.g.
+    one of the children of SeedSequence(seed).spawn(n) used to give independent streams to several
+    models. SeedSequences are copied without their spawned children, so that the same seed always
+    gives the same simulations.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size)
+    return np.random.SeedSequence(seed)
+
+
+def block_generator(stream, block):
+    """
+    Generator of the block-th block of paths of the simulation stream (a SeedSequence). It is the
+    same as stream.spawn(block+1)[block] but does not depend on the children already spawned.
+    """
+    return np.random.default_rng(np.random.SeedSequence(stream.entropy, spawn_key=stream.spawn_key + (block,)))
+
+
+class PathDrawer():
+    """
+    Random draws of the paths of a simulation of n_paths paths with the stream (a SeedSequence),
+    path i always from the block i//block_paths. The sampler of the current block is kept between
+    calls, so that consecutive ranges of paths (e.g. the chunks of a simulation) only draw their own
+    paths, whatever their size.
+    """
+    def __init__(self, stream, n_paths, block_paths=SEED_BLOCK_PATHS):
+        self.stream = stream
+        self.n_paths = n_paths
+        self.block_paths = block_paths
+        self._block = None
+        self._position = 0
+        self._draw = None
+        self._values = None
+
+    def draw(self, start, stop, sampler, sequential=True):
+        """
+        Draws of the paths start to stop. sampler(rng) returns the function drawing the next n paths
+        (along the first axis) of a block with the Generator rng, e.g. NormalSampler(dim, method,
+        rng).draw, and should be the same in every call.
+        Sequential samplers continue their sequence from call to call, so a range is drawn by carrying
+        on from the previous one, or skipping to its start, within its block. The others (e.g. moment
+        matching, whose draws depend on the batch) draw every block at once, which is kept until a
+        range of another block is drawn.
+        """
+        draws = []
+        for block in range(start//self.block_paths, -(-stop//self.block_paths)):
+            block_start = block*self.block_paths
+            block_stop = min(block_start + self.block_paths, self.n_paths)
+            first, last = max(start, block_start) - block_start, min(stop, block_stop) - block_start
+            if sequential:
+                draws.append(self._draw_sequential(block, first, last, sampler))
+            else:
+                if self._block != block:
+                    self._block, self._values = block, sampler(block_generator(self.stream, block))(block_stop - block_start)
+                draws.append(self._values[first:last])
+        return draws[0] if len(draws) == 1 else np.concatenate(draws)
+
+    def _draw_sequential(self, block, first, last, sampler):
+        if self._block != block or self._position > first:
+            self._block, self._position = block, 0
+            self._draw = sampler(block_generator(self.stream, block))
+        # The paths before the range are skipped at most a range at a time, to bound the memory
+        while self._position < first:
+            n = min(first - self._position, last - first)
+            self._draw(n)
+            self._position += n
+        self._position = last
+        return self._draw(last - first)
+
+
+def as_path_drawer(stream, n_paths):
+    """
+    PathDrawer of the simulation of n_paths paths with the stream, which can already be one, e.g. to
+    carry on drawing from the previous chunk.
+    """
+    return stream if isinstance(stream, PathDrawer) else PathDrawer(stream, n_paths)
+
+
+def path_chunks(n_paths, chunk_size, block_paths=SEED_BLOCK_PATHS):
+    """
+    (start, stop) of consecutive chunks of chunk_size paths, rounded down to whole blocks of paths
+    when bigger than a block so that no block of a batch sampler (see PathDrawer.draw) has to be
+    drawn twice.
+    """
+    if chunk_size is None:
+        chunk_size = n_paths
+    if chunk_size > block_paths:
+        chunk_size -= chunk_size % block_paths
+    chunk_size = max(1, chunk_size)
+    for start in range(0, n_paths, chunk_size):
+        yield start, min(start + chunk_size, n_paths)
+
+
+class NormalSampler():
+    """
+    Draws standard normal vectors of dimension dim, one per path, with one of the sampling methods:
+        random: plain Monte Carlo
+        antithetic: every draw z is followed by -z
+        moment_matching: every batch is shifted and scaled to have exactly mean 0 and variance 1
+            along each dimension
+        sobol, halton: scrambled quasi Monte Carlo points mapped through the normal inverse CDF
+    Consecutive calls to draw continue the same sequence. Only moment matching depends on the batch
+    sizes, as the moments are matched batch by batch. random_state is a numpy Generator or anything
+    accepted by np.random.default_rng.
+    """
+    def __init__(self, dim, method='random', random_state=None):
+        if method not in SAMPLING_METHODS:
+            raise ValueError(f"Sampling method should be one of {SAMPLING_METHODS}, got {method}")
+        self.dim = dim
+        self.method = method
+        self.random_state = np.random.default_rng(random_state)
+        self.engine = None
+        if method in ('sobol', 'halton'):
+            if dim > MAX_QMC_DIM:
+                raise ValueError(f"{method} sampling supports up to {MAX_QMC_DIM} dimensions (periods x assets or factors), got {dim}. Use another sampling method or fewer periods")
+            engine = qmc.Sobol if method == 'sobol' else qmc.Halton
+            self.engine = engine(d=dim, scramble=True, seed=self.random_state)
+        self._pending = np.empty((0, dim))
+
+    def draw(self, n):
+        if self.method == 'random':
+            return self.random_state.standard_normal(size=(n, self.dim))
+        if self.method == 'antithetic':
+            n_new = max(0, n - len(self._pending))
+            z = self.random_state.standard_normal(size=((n_new + 1)//2, self.dim))
+            pairs = np.empty((2*len(z), self.dim))
+            pairs[0::2] = z
+            pairs[1::2] = -z
+            samples = np.concatenate([self._pending, pairs])
+            self._pending = samples[n:]
+            return samples[:n]
+        if self.method == 'moment_matching':
+            z = self.random_state.standard_normal(size=(n, self.dim))
+            if n < 2:
+                return z
+            return (z - z.mean(axis=0))/z.std(axis=0)
+        with warnings.catch_warnings():
+            # Sobol points lose some balance when n is not a power of 2, but remain valid
+            warnings.simplefilter('ignore', UserWarning)
+            u = self.engine.random(n)
+        return norm.ppf(np.clip(u, 1e-12, 1 - 1e-12))
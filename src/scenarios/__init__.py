@@ -0,0 +1,3 @@
+from .reduction import ScenarioReduction
+from .store import ScenarioStore
+from .joint import JointScenarioGenerator
\ No newline at end of file
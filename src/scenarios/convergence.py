@@ -0,0 +1,47 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.sampling import SAMPLING_METHODS
+
+
+def sampling_convergence(returns_model, income_model, expenses_model, horizon, initial_cash, scenario_counts=(50, 100, 200, 400), sampling_methods=SAMPLING_METHODS, n_repetitions=10, seed=0, **matrix_model_params):
+    """
+    Solves the problem n_repetitions times, each with a different seed, for every scenario count and
+    sampling method, and reports the mean and variance of the optimal objective. Sampling methods
+    with a lower variance reach the same objective stability with fewer scenarios.
+    The fitted models are reseeded with set_seed and restored to their original seeds at the end.
+    Problems are built and solved with optimization.matrix_builder.
+    """
+    from src.optimization.matrix_builder import create_matrix_model
+
+    models = (returns_model, income_model, expenses_model)
+    original_seeds = [model.seed for model in models]
+    rows = []
+    try:
+        for method in sampling_methods:
+            for n_scenarios in scenario_counts:
+                objectives = []
+                t1 = time.time()
+                for repetition in range(n_repetitions):
+                    for i, model in enumerate(models):
+                        model.set_seed(seed + 3*repetition + i)
+                    prices_syms = returns_model.predict(horizon, n_scenarios, sampling=method)
+                    income_syms = income_model.predict(horizon, n_scenarios, sampling=method)
+                    expenses_syms = expenses_model.predict(horizon, n_scenarios, sampling=method)
+                    mm = create_matrix_model(prices_syms, income_syms, expenses_syms, initial_cash, **matrix_model_params)
+                    mm.solve()
+                    objectives.append(mm.objective)
+                rows.append({
+                    'sampling': method,
+                    'n_scenarios': n_scenarios,
+                    'mean_objective': np.mean(objectives),
+                    'std_objective': np.std(objectives, ddof=1) if n_repetitions > 1 else np.nan,
+                    'var_objective': np.var(objectives, ddof=1) if n_repetitions > 1 else np.nan,
+                    'time': time.time() - t1,
+                })
+    finally:
+        for model, model_seed in zip(models, original_seeds):
+            model.set_seed(model_seed)
+    return pd.DataFrame(rows)
@@ -0,0 +1,191 @@
+import numpy as np
+
+from src.sampling import BATCH_SAMPLING_METHODS, NormalSampler, as_path_drawer, as_seed_sequence
+
+# Names of the non asset factors, after the asset names in the joint correlation matrix
+SHORT_RATE = 'short_rate'
+INCOME = 'income'
+EXPENSES = 'expenses'
+
+
+class JointScenarioGenerator():
+    """
+    Simulates the prices, short rates, cash returns, income and expenses of every scenario together,
+    from a single tensor of correlated normal shocks of shape (n_paths, horizon+1, n_assets+3):
+        prices: log-normal, as LogNormalReturns
+        short rates: Vasicek, r[t+1] = theta + (r[t] - theta)*phi + sigma*z, per period
+        cash returns: gross factors exp(r[t]) of the cash held from t to t+1 (pCashReturns)
+        income, expenses: normal and clipped at 0, as NormalCashFlows
+    The shocks of period t drive the asset returns and the short rate from t to t+1 and the
+    cashflows of period t. Their joint correlation is estimated in fit from the series that are
+    aligned with the price history, the others are taken as independent, and single entries can be
+    set with correlations, a dict {(factor_1, factor_2): rho} of asset names or SHORT_RATE, INCOME
+    and EXPENSES.
+    Without a short rate history, the Vasicek params are rate_0, rate_mean, rate_reversion
+    (1 - phi) and rate_vol, and the default constant 0 rate gives cash returns of 1.
+    """
+    def __init__(self, seed=42, sampling='random', correlations=None, rate_0=0., rate_mean=0., rate_reversion=0.1, rate_vol=0.):
+        self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
+        self.sampling = sampling
+        self.correlations = {} if correlations is None else correlations
+        self.rate_0 = rate_0
+        self.rate_mean = rate_mean
+        self.rate_phi = 1 - rate_reversion
+        self.rate_vol = rate_vol
+        self.assets = None
+        self.last_prices = None
+        self.mean = None
+        self.std = None
+        self.corr = None
+        self.chol = None
+        self.price_0 = None
+
+    @property
+    def factors(self):
+        return self.assets + [SHORT_RATE, INCOME, EXPENSES]
+
+    def _fit_short_rate(self, short_rates):
+        # AR(1) regression of the rate on its previous value, which is the exact Vasicek discretisation
+        r = np.asarray(short_rates, dtype=float)
+        phi, intercept = np.polyfit(r[:-1], r[1:], 1)
+        innovations = r[1:] - (intercept + phi*r[:-1])
+        self.rate_phi = phi
+        self.rate_mean = intercept/(1 - phi) if phi != 1 else r.mean()
+        self.rate_vol = innovations.std(ddof=2)
+        self.rate_0 = r[-1]
+        return innovations
+
+    def fit(self, df_prices, income, expenses, short_rates=None):
+        """
+        df_prices: price history of the assets, one column per asset
+        income, expenses: cashflow histories
+        short_rates: optional per period short rate history (e.g. monthly rates for monthly prices)
+        """
+        self.assets = list(df_prices.columns)
+        self.last_prices = df_prices.iloc[-1,:].to_numpy(dtype=float)
+        log_returns = np.log(df_prices / df_prices.shift(1)).dropna().to_numpy(dtype=float)
+        n_obs, n_assets = log_returns.shape
+        rate_innovations = self._fit_short_rate(short_rates) if short_rates is not None else np.zeros(0)
+        income = np.ravel(income).astype(float)
+        expenses = np.ravel(expenses).astype(float)
+
+        self.mean = np.concatenate([log_returns.mean(axis=0), [0., income.mean(), expenses.mean()]])
+        self.std = np.concatenate([log_returns.std(axis=0, ddof=1), [1., income.std(), expenses.std()]])
+
+        # Correlations of the series aligned with the log returns (same number of observations)
+        columns = list(range(n_assets))
+        data = [log_returns]
+        for i, values in enumerate((rate_innovations, income, expenses)):
+            if len(values) == n_obs:
+                columns.append(n_assets + i)
+                data.append(values[:, None])
+        self.corr = np.eye(n_assets + 3)
+        self.corr[np.ix_(columns, columns)] = np.nan_to_num(np.corrcoef(np.concatenate(data, axis=1), rowvar=False))
+        np.fill_diagonal(self.corr, 1)
+        self.set_correlations(self.correlations)
+
+    def set_correlations(self, correlations):
+        """
+        Overrides entries of the joint correlation matrix, {(factor_1, factor_2): rho}.
+        """
+        from src.returns.gaussian import cholesky_factor
+
+        if self.corr is None:
+            raise ValueError("Model not fitted. Please use fit() method first.")
+        factors = self.factors
+        for (a, b), rho in correlations.items():
+            i, j = factors.index(a), factors.index(b)
+            self.corr[i, j] = self.corr[j, i] = rho
+        self.correlations = {**self.correlations, **correlations}
+        # Not positive semidefinite overrides are projected by cholesky_factor
+        self.chol = cholesky_factor(self.corr)
+
+    def get_config(self):
+        # The rate params and correlations are fitted or overridden, so they are part of get_params
+        return {'sampling': self.sampling}
+
+    def get_params(self):
+        price_0 = self.price_0 if self.price_0 is not None else self.last_prices
+        return {
+            'mean': self.mean,
+            'std': self.std,
+            'corr': self.corr,
+            'price_0': np.asarray(price_0, dtype=float),
+            'last_prices': self.last_prices,
+            'rate': np.array([self.rate_0, self.rate_mean, self.rate_phi, self.rate_vol]),
+        }
+
+    def set_price_0(self, price_0):
+        self.price_0 = price_0
+
+    def set_seed(self, seed):
+        self.seed = seed
+        self.seed_sequence = as_seed_sequence(seed)
+
+    def next_stream(self):
+        """
+        SeedSequence of the next simulation, see LogNormalReturns.next_stream.
+        """
+        return self.seed_sequence.spawn(1)[0]
+
+    def _short_rate_paths(self, shocks, rate_0):
+        # r[t] = theta + (r_0 - theta)*phi^t + sigma*sum_k phi^(t-1-k)*z[k], as a single product
+        # with the lower triangular matrix of powers of phi
+        horizon = shocks.shape[1]
+        steps = np.arange(horizon+1)
+        lags = steps[1:, None] - 1 - np.arange(horizon)[None, :]
+        powers = np.where(lags >= 0, self.rate_phi**np.clip(lags, 0, None), 0)
+        rates = np.empty((shocks.shape[0], horizon+1))
+        rates[:, 0] = 0
+        rates[:, 1:] = self.rate_vol*(shocks@powers.T)
+        rates += self.rate_mean + (rate_0 - self.rate_mean)*self.rate_phi**steps
+        return rates
+
+    def simulate(self, stream, horizon, n_paths, start=0, stop=None, price_0=None, rate_0=None, dtype=np.float64, sampling=None):
+        """
+        Scenarios start to stop of the simulation of n_paths scenarios with the stream, see predict.
+        """
+        if self.corr is None:
+            raise ValueError("Model not fitted. Please use fit() method first.")
+        if price_0 is None:
+            price_0 = self.price_0 if self.price_0 is not None else self.last_prices
+        price_0 = np.asarray(price_0, dtype=float)
+        rate_0 = self.rate_0 if rate_0 is None else rate_0
+        stop = n_paths if stop is None else stop
+        n_assets = len(self.assets)
+        dim = n_assets + 3
+        method = self.sampling if sampling is None else sampling
+
+        drawer = as_path_drawer(stream, n_paths)
+        shocks = drawer.draw(start, stop, lambda rng: NormalSampler((horizon+1)*dim, method, rng).draw, method not in BATCH_SAMPLING_METHODS)
+        shocks = shocks.reshape(stop-start, horizon+1, dim)@self.chol.T
+
+        log_prices = shocks[:, :horizon, :n_assets]*self.std[:n_assets] + self.mean[:n_assets]
+        np.cumsum(log_prices, axis=1, out=log_prices)
+        np.exp(log_prices, out=log_prices)
+        log_prices *= price_0
+        prices = np.empty((stop-start, n_assets, horizon+1), dtype=dtype)
+        prices[:, :, 0] = price_0
+        prices[:, :, 1:] = log_prices.transpose(0, 2, 1)
+
+        short_rates = self._short_rate_paths(shocks[:, :horizon, n_assets], rate_0)
+        cashflows = np.clip(shocks[:, :, n_assets+1:]*self.std[n_assets+1:] + self.mean[n_assets+1:], 0, None)
+        return {
+            'prices_syms': prices,
+            'income_syms': cashflows[:, :, 0].astype(dtype),
+            'expenses_syms': cashflows[:, :, 1].astype(dtype),
+            'cash_returns_syms': np.exp(short_rates).astype(dtype),
+        }
+
+    def predict(self, horizon, n_paths=1, price_0=None, rate_0=None, dtype=np.float64, sampling=None, stream=None):
+        """
+        Simulates n_paths joint scenarios and returns a dict with
+            prices_syms: (n_paths, n_assets, horizon+1)
+            income_syms, expenses_syms, cash_returns_syms: (n_paths, horizon+1)
+        which are the arguments of optimization.instance_data.create_instance:
+            create_instance(model, non_cash_assets=generator.assets, **scenarios, pTradeFee=...)
+        The short rates are np.log(cash_returns_syms).
+        """
+        stream = self.next_stream() if stream is None else stream
+        return self.simulate(stream, horizon, n_paths, price_0=price_0, rate_0=rate_0, dtype=dtype, sampling=sampling)
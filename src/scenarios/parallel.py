@@ -0,0 +1,32 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+from src.sampling import SEED_BLOCK_PATHS
+
+
+def _simulate(args):
+    model, stream, horizon, n_paths, start, stop, kwargs = args
+    return model.simulate(stream, horizon, n_paths, start, stop, **kwargs)
+
+
+def parallel_predict(model, horizon, n_paths, n_workers=None, task_paths=None, **kwargs):
+    """
+    Same paths as model.predict(horizon, n_paths, **kwargs) (for any returns or cashflows model),
+    simulated by n_workers processes. The paths are split in tasks of task_paths paths, a multiple
+    of src.sampling.SEED_BLOCK_PATHS, each drawn from its own children of the simulation stream, so
+    the result does not depend on the number of workers.
+    """
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    if task_paths is None:
+        task_paths = -(-n_paths//n_workers)
+    task_paths = max(1, -(-task_paths//SEED_BLOCK_PATHS))*SEED_BLOCK_PATHS
+    stream = model.next_stream()
+    tasks = [(model, stream, horizon, n_paths, start, min(start + task_paths, n_paths), kwargs) for start in range(0, n_paths, task_paths)]
+    if n_workers == 1 or len(tasks) == 1:
+        results = [_simulate(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(n_workers) as executor:
+            results = list(executor.map(_simulate, tasks))
+    return np.concatenate(results, axis=1 if kwargs.get('time_major') else 0)
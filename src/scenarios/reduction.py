@@ -0,0 +1,180 @@
+import time
+
+import numpy as np
+
+
+def scenario_features(prices_syms, income_syms=None, expenses_syms=None, factors=None):
+    """
+    Joint price and cashflow path features used to measure the distance between scenarios: the
+    log price paths relative to the first period and the cashflow paths, every column standardised.
+    If the factor paths of the scenarios are given (e.g. from FactorReturns.predict with
+    return_factors) they replace the log price paths, which is much cheaper for many assets.
+    """
+    prices_syms = np.asarray(prices_syms, dtype=float)
+    n_scenarios = prices_syms.shape[0]
+    if factors is None:
+        features = [np.log(np.clip(prices_syms[:, :, 1:], 1e-12, None)/np.clip(prices_syms[:, :, :1], 1e-12, None)).reshape(n_scenarios, -1)]
+    else:
+        features = [np.asarray(factors, dtype=float)[:, :, 1:].reshape(n_scenarios, -1)]
+    for cashflow in (income_syms, expenses_syms):
+        if cashflow is not None:
+            features.append(np.asarray(cashflow, dtype=float).reshape(n_scenarios, -1))
+    features = np.concatenate(features, axis=1)
+    std = features.std(axis=0)
+    keep = std > 0
+    return (features[:, keep] - features[:, keep].mean(axis=0))/std[keep]
+
+
+def _distances(x, y):
+    sq = (x**2).sum(axis=1)[:, None] - 2*x@y.T + (y**2).sum(axis=1)[None, :]
+    return np.sqrt(np.clip(sq, 0, None))
+
+
+class ScenarioReduction():
+    """
+    Compresses a large set of simulated scenarios into a smaller set of representative ones with
+    probabilities, to be used through the pScenarioProbability param of the om_* models.
+        method='kmedoids': weighted k-medoids (alternating) with k-means++ initialisation
+        method='forward': fast forward selection (Heitsch & Römisch)
+    Every original scenario is assigned to its closest selected one, whose probability is the sum
+    of the probabilities assigned to it.
+    """
+    def __init__(self, n_scenarios, method='kmedoids', seed=42, max_iter=100, block_size=1024):
+        if method not in ('kmedoids', 'forward'):
+            raise ValueError(f"method should be 'kmedoids' or 'forward', got {method}")
+        self.n_scenarios = n_scenarios
+        self.method = method
+        self.seed = seed
+        self.max_iter = max_iter
+        self.block_size = block_size
+        self.indices = None
+        self.probabilities = None
+        self.assignment = None
+        self.reduction_time = None
+
+    def fit(self, prices_syms, income_syms=None, expenses_syms=None, probabilities=None, factors=None):
+        t1 = time.time()
+        features = scenario_features(prices_syms, income_syms, expenses_syms, factors)
+        n = features.shape[0]
+        if probabilities is None:
+            probabilities = np.full(n, 1/n)
+        probabilities = np.asarray(probabilities, dtype=float)
+        if self.n_scenarios >= n:
+            self.indices = np.arange(n)
+            self.assignment = np.arange(n)
+        elif self.method == 'kmedoids':
+            self.indices, self.assignment = self._kmedoids(features, probabilities)
+        else:
+            self.indices, self.assignment = self._forward_selection(features, probabilities)
+        self.probabilities = np.bincount(self.assignment, weights=probabilities, minlength=len(self.indices))
+        self.reduction_time = time.time() - t1
+        return self
+
+    def transform(self, *arrays):
+        if self.indices is None:
+            raise ValueError("Reduction not fitted. Please use fit() method first.")
+        reduced = tuple(None if a is None else np.asarray(a)[self.indices] for a in arrays)
+        return reduced[0] if len(reduced) == 1 else reduced
+
+    def fit_transform(self, prices_syms, income_syms=None, expenses_syms=None, probabilities=None, factors=None):
+        self.fit(prices_syms, income_syms, expenses_syms, probabilities, factors)
+        return self.transform(prices_syms, income_syms, expenses_syms)
+
+    def _assign(self, features, medoids):
+        assignment = np.empty(features.shape[0], dtype=int)
+        distance = np.empty(features.shape[0])
+        for start in range(0, features.shape[0], self.block_size):
+            d = _distances(features[start:start+self.block_size], features[medoids])
+            assignment[start:start+self.block_size] = d.argmin(axis=1)
+            distance[start:start+self.block_size] = d.min(axis=1)
+        return assignment, distance
+
+    def _kmedoids(self, features, probabilities):
+        rng = np.random.default_rng(self.seed)
+        n = features.shape[0]
+        k = self.n_scenarios
+
+        # k-means++ initialisation
+        medoids = [rng.choice(n, p=probabilities)]
+        min_sq = _distances(features, features[medoids])[:, 0]**2
+        for _ in range(1, k):
+            weights = probabilities*min_sq
+            new = rng.choice(n, p=weights/weights.sum()) if weights.sum() > 0 else rng.choice(np.setdiff1d(np.arange(n), medoids))
+            medoids.append(new)
+            min_sq = np.minimum(min_sq, _distances(features, features[[new]])[:, 0]**2)
+        medoids = np.array(medoids)
+
+        for _ in range(self.max_iter):
+            assignment, _ = self._assign(features, medoids)
+            new_medoids = medoids.copy()
+            for j in range(k):
+                members = np.flatnonzero(assignment == j)
+                if len(members) == 0:
+                    continue
+                cost = _distances(features[members], features[members]).T@probabilities[members]
+                new_medoids[j] = members[cost.argmin()]
+            if np.array_equal(new_medoids, medoids):
+                break
+            medoids = new_medoids
+        assignment, _ = self._assign(features, medoids)
+        return medoids, assignment
+
+    def _forward_selection(self, features, probabilities):
+        n = features.shape[0]
+        # The full distance matrix is computed once (float32 to halve its memory)
+        distances = np.empty((n, n), dtype=np.float32)
+        for start in range(0, n, self.block_size):
+            distances[start:start+self.block_size] = _distances(features[start:start+self.block_size], features)
+        weights = probabilities.astype(np.float32)
+
+        selected = []
+        # Distance of every scenario to the closest selected one
+        closest = np.full(n, np.inf, dtype=np.float32)
+        remaining = np.ones(n, dtype=bool)
+        for _ in range(self.n_scenarios):
+            best, best_cost = None, np.inf
+            for start in range(0, n, self.block_size):
+                candidates = np.flatnonzero(remaining[start:start+self.block_size]) + start
+                if len(candidates) == 0:
+                    continue
+                cost = weights@np.minimum(closest[:, None], distances[:, candidates])
+                j = cost.argmin()
+                if cost[j] < best_cost:
+                    best, best_cost = candidates[j], cost[j]
+            selected.append(best)
+            remaining[best] = False
+            closest = np.minimum(closest, distances[:, best])
+        selected = np.array(selected)
+        assignment, _ = self._assign(features, selected)
+        return selected, assignment
+
+
+def evaluate_reduction(reduction, prices_syms, income_syms, expenses_syms, initial_cash, **matrix_model_params):
+    """
+    Solves the full and the reduced problem with the matrix builder and reports the reduction time
+    and the objective error of the reduced problem.
+    """
+    from src.optimization.matrix_builder import create_matrix_model
+
+    t1 = time.time()
+    full = create_matrix_model(prices_syms, income_syms, expenses_syms, initial_cash, **matrix_model_params)
+    full.solve()
+    t2 = time.time()
+    if reduction.indices is None:
+        reduction.fit(prices_syms, income_syms, expenses_syms)
+    reduced_prices, reduced_income, reduced_expenses = reduction.transform(prices_syms, income_syms, expenses_syms)
+    t3 = time.time()
+    reduced = create_matrix_model(reduced_prices, reduced_income, reduced_expenses, initial_cash, scenario_probabilities=reduction.probabilities, **matrix_model_params)
+    reduced.solve()
+    t4 = time.time()
+    return {
+        'n_scenarios': prices_syms.shape[0],
+        'n_reduced_scenarios': len(reduction.indices),
+        'reduction_time': reduction.reduction_time,
+        'full_objective': full.objective,
+        'reduced_objective': reduced.objective,
+        'objective_error': reduced.objective - full.objective,
+        'relative_objective_error': (reduced.objective - full.objective)/abs(full.objective),
+        'full_solve_time': t2 - t1,
+        'reduced_solve_time': t4 - t3,
+    }
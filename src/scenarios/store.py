@@ -0,0 +1,116 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+METADATA_FILE = 'metadata.json'
+
+
+def _seed_metadata(seed):
+    # SeedSequences are not JSON serializable
+    if isinstance(seed, np.random.SeedSequence):
+        return {'entropy': str(seed.entropy), 'spawn_key': list(seed.spawn_key)}
+    return seed
+
+
+def write_chunks(path, chunks, shape, dtype=np.float64, axis=0):
+    """
+    Writes the chunks, consecutive slices along axis, to a .npy file of the given shape without
+    holding more than one chunk in memory, and returns the file memory-mapped in read mode.
+    """
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+    start = 0
+    for chunk in chunks:
+        stop = start + chunk.shape[axis]
+        index = (slice(None),)*axis + (slice(start, stop),)
+        out[index] = chunk
+        start = stop
+    if start != shape[axis]:
+        raise ValueError(f"{start} elements have been written along axis {axis} but the file has {shape[axis]}")
+    out.flush()
+    del out
+    return np.load(path, mmap_mode='r')
+
+
+class ScenarioStore():
+    """
+    Directory of simulated scenario arrays (prices, income, expenses...) stored as .npy files, with a
+    small metadata.json describing each of them (shape, dtype, layout and generation parameters).
+    Arrays are written chunk by chunk and read back memory-mapped, so slices of them can be used
+    without loading the whole simulation in memory.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        metadata_path = os.path.join(path, METADATA_FILE)
+        self.metadata = {}
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                self.metadata = json.load(f)
+
+    def _save_metadata(self):
+        with open(os.path.join(self.path, METADATA_FILE), 'w') as f:
+            json.dump(self.metadata, f, indent=2)
+
+    def names(self):
+        return list(self.metadata.keys())
+
+    def write(self, name, chunks, shape, dtype=np.float64, axis=0, **metadata):
+        """
+        Writes the chunks (e.g. from the predict_chunks methods of the returns and cashflows models)
+        as the array name. Extra keyword arguments are saved in its metadata.
+        """
+        file_name = name + '.npy'
+        array = write_chunks(os.path.join(self.path, file_name), chunks, tuple(shape), dtype, axis)
+        self.metadata[name] = {'file': file_name, 'shape': list(shape), 'dtype': np.dtype(dtype).str, 'path_axis': axis, **metadata}
+        self._save_metadata()
+        return array
+
+    def generate(self, returns_model, income_model, expenses_model, horizon, n_paths, chunk_size=None, dtype=np.float64, **metadata):
+        """
+        Simulates and stores the prices, income and expenses of n_paths scenarios chunk by chunk.
+        """
+        n_assets = len(returns_model.mean)
+        self.write('prices', returns_model.predict_chunks(horizon, n_paths, chunk_size=chunk_size, dtype=dtype), (n_paths, n_assets, horizon+1), dtype,
+                   model=type(returns_model).__name__, seed=_seed_metadata(returns_model.seed), **metadata)
+        for name, model in (('income', income_model), ('expenses', expenses_model)):
+            self.write(name, model.predict_chunks(horizon, n_paths, chunk_size=chunk_size, dtype=dtype), (n_paths, horizon+1), dtype,
+                       model=type(model).__name__, seed=_seed_metadata(model.seed), **metadata)
+
+    def __contains__(self, name):
+        return name in self.metadata
+
+    def __getitem__(self, name):
+        return self.load(name)
+
+    def load(self, name, mmap_mode='r'):
+        if name not in self.metadata:
+            raise KeyError(f"{name} is not in the store. Stored arrays are {self.names()}")
+        return np.load(os.path.join(self.path, self.metadata[name]['file']), mmap_mode=mmap_mode)
+
+    def iter_chunks(self, name, chunk_size):
+        """
+        Yields zero-copy slices of chunk_size paths of the stored array.
+        """
+        array = self.load(name)
+        axis = self.metadata[name]['path_axis']
+        for start in range(0, array.shape[axis], chunk_size):
+            yield array[(slice(None),)*axis + (slice(start, start+chunk_size),)]
+
+    def to_df(self, name, col_names=None, paths=None):
+        """
+        Long DataFrame with one column per axis plus 'value', as returned by ResultsAnalyzer.get_df,
+        so that the stored scenarios can be passed to its plot methods. paths selects a subset of
+        the paths (e.g. a slice) to avoid loading all of them.
+        """
+        array = self.load(name)
+        axis = self.metadata[name]['path_axis']
+        if paths is not None:
+            array = array[(slice(None),)*axis + (paths,)]
+        if col_names is None:
+            col_names = [f'i_{i}' for i in range(array.ndim)]
+        if len(col_names) != array.ndim:
+            raise ValueError(f"{len(col_names)} column names have been provided but {name} has {array.ndim} dimensions")
+        index = pd.MultiIndex.from_product([range(n) for n in array.shape], names=col_names)
+        return pd.DataFrame({'value': np.asarray(array).ravel()}, index=index).reset_index()
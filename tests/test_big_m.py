@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from src.optimization.big_m import negative_cash_big_m, transform_indicators
+from src.optimization.instance_data import create_instance, update_instance
+from src.optimization.model_factory import create_model
+
+N_SCENARIOS, N_ASSETS, HORIZON = 4, 2, 3
+INITIAL_CASH = 100.
+
+
+@pytest.fixture
+def scenarios():
+    rng = np.random.default_rng(0)
+    prices_syms = 50*np.exp(np.cumsum(rng.normal(0, 0.05, size=(N_SCENARIOS, N_ASSETS, HORIZON+1)), axis=2))
+    zeros = np.zeros((N_SCENARIOS, HORIZON+1))
+    return dict(prices_syms=prices_syms, income_syms=zeros, expenses_syms=zeros, non_cash_assets=['A', 'B'], pInitialCashAllocations=INITIAL_CASH)
+
+
+def big_m_values(instance):
+    return np.array([[instance.pNegativeCashBigM[s, t].value for t in instance.sTime] for s in instance.sScenarios])
+
+
+def test_legacy_big_m_when_every_scenario_can_go_negative(scenarios):
+    model = create_model(negative_cash='chance')
+    legacy = np.full((N_SCENARIOS, HORIZON+1), (HORIZON+1)*INITIAL_CASH)
+    instance = create_instance(model, **scenarios, pPropNegativeCash=1.)
+    assert np.allclose(big_m_values(instance), legacy)
+
+    instance = create_instance(model, **scenarios, pPropNegativeCash=0.5)
+    expected = negative_cash_big_m(scenarios['prices_syms'], scenarios['income_syms'], scenarios['expenses_syms'], INITIAL_CASH)
+    assert np.allclose(big_m_values(instance), expected)
+    update_instance(instance, pPropNegativeCash=1.)
+    assert np.allclose(big_m_values(instance), legacy)
+    update_instance(instance, pPropNegativeCash=0.5)
+    assert np.allclose(big_m_values(instance), expected)
+
+
+@pytest.mark.parametrize('method', ['gdp.bigm', 'gdp.hull'])
+def test_transformed_instance_refuses_big_m_updates(scenarios, method):
+    model = create_model(negative_cash='chance', negative_cash_formulation='indicator')
+    instance = transform_indicators(create_instance(model, **scenarios), method)
+    with pytest.raises(ValueError, match='reformulated'):
+        update_instance(instance, prices_syms=2*scenarios['prices_syms'])
+    with pytest.raises(ValueError, match='reformulated'):
+        update_instance(instance, pInitialCashAllocations=2*INITIAL_CASH)
+    update_instance(instance, pCVaRGamma=0.2)
+    assert instance.pCVaRGamma.value == 0.2
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.cache import DiskCache, cached_fit, cached_predict
+from src.returns import BootstrapReturns, FactorReturns, LogNormalReturns
+
+
+@pytest.fixture
+def df_prices():
+    rng = np.random.default_rng(0)
+    log_returns = rng.normal(0.001, 0.02, size=(120, 6))
+    return pd.DataFrame(100*np.exp(np.cumsum(log_returns, axis=0)), columns=[f'Asset{i}' for i in range(6)])
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DiskCache(str(tmp_path))
+
+
+def test_fit_key_includes_decay(df_prices, cache):
+    cached_fit(LogNormalReturns(seed=1), df_prices, cache)
+    decayed = cached_fit(LogNormalReturns(seed=1, decay=0.97), df_prices, cache)
+    expected = LogNormalReturns(seed=1, decay=0.97)
+    expected.fit(df_prices)
+    assert np.allclose(decayed.cov, expected.cov)
+    assert cache.hits == 0
+
+
+def test_predict_key_includes_sampling(df_prices, cache):
+    cached_predict(cached_fit(LogNormalReturns(seed=1), df_prices, cache), cache, 12, 64)
+    sobol = cached_predict(cached_fit(LogNormalReturns(seed=1, sampling='sobol'), df_prices, cache), cache, 12, 64)
+    expected = LogNormalReturns(seed=1, sampling='sobol')
+    expected.fit(df_prices)
+    assert np.allclose(sobol, expected.predict(12, 64))
+
+
+def test_predict_key_includes_bootstrap_method(df_prices, cache):
+    cached_predict(cached_fit(BootstrapReturns(method='stationary', seed=1), df_prices, cache), cache, 12, 64)
+    circular = cached_predict(cached_fit(BootstrapReturns(method='circular', seed=1), df_prices, cache), cache, 12, 64)
+    expected = BootstrapReturns(method='circular', seed=1)
+    expected.fit(df_prices)
+    assert np.allclose(circular, expected.predict(12, 64))
+
+
+def test_fit_key_includes_n_factors(df_prices, cache):
+    cached_fit(FactorReturns(n_factors=4, seed=1), df_prices, cache)
+    model = cached_fit(FactorReturns(n_factors=2, seed=1), df_prices, cache)
+    assert model.loadings.shape == (6, 2)
+
+
+def test_factor_set_params_checks_n_factors(df_prices):
+    model = FactorReturns(n_factors=4)
+    model.fit(df_prices)
+    with pytest.raises(ValueError):
+        FactorReturns(n_factors=2).set_params(model.get_params())
+
+
+def test_cache_hit_restores_fit(df_prices, cache):
+    cached_fit(LogNormalReturns(seed=1, decay=0.97), df_prices, cache)
+    model = cached_fit(LogNormalReturns(seed=1, decay=0.97), df_prices, cache)
+    assert cache.hits == 1
+    assert model.assets == list(df_prices.columns)
+
+
+@pytest.mark.parametrize('decay', [None, 0.97])
+def test_cache_hit_then_partial_fit_predicts_from_new_prices(df_prices, cache, decay):
+    cached_fit(LogNormalReturns(seed=1, decay=decay), df_prices.iloc[:100], cache)
+    model = cached_fit(LogNormalReturns(seed=1, decay=decay), df_prices.iloc[:100], cache)
+    assert cache.hits == 1
+    model.partial_fit(df_prices.iloc[100:])
+    expected = LogNormalReturns(seed=1, decay=decay)
+    expected.fit(df_prices.iloc[:100])
+    expected.partial_fit(df_prices.iloc[100:])
+    assert np.allclose(model.predict(12, 64), expected.predict(12, 64))
+
+
+def test_cache_keeps_explicit_price_0(df_prices, cache):
+    model = LogNormalReturns(seed=1)
+    model.set_price_0(np.full(6, 50.))
+    cached_fit(model, df_prices, cache)
+    restored = cached_fit(LogNormalReturns(seed=1), df_prices, cache)
+    assert np.allclose(restored.predict(12, 4)[:, :, 0], 50.)
+
+
+def test_partial_fit_aligns_columns(df_prices):
+    model = LogNormalReturns()
+    model.fit(df_prices.iloc[:100])
+    expected = LogNormalReturns()
+    expected.fit(df_prices.iloc[:100])
+    model.partial_fit(df_prices.iloc[100:, ::-1])
+    expected.partial_fit(df_prices.iloc[100:])
+    assert np.allclose(model.cov, expected.cov)
+    with pytest.raises(ValueError):
+        model.partial_fit(df_prices.iloc[100:].rename(columns={'Asset0': 'Other'}))
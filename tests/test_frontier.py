@@ -0,0 +1,45 @@
+from functools import partial
+
+import numpy as np
+import pytest
+
+from src.optimization.frontier import efficient_frontier, frontier_grid
+from src.optimization.model_factory import create_model
+
+N_SCENARIOS, N_ASSETS, HORIZON = 20, 2, 3
+ALPHAS, GAMMAS = [0.05, 0.2], [0., 0.3, 0.6, 0.9]
+
+
+@pytest.fixture
+def scenarios():
+    rng = np.random.default_rng(0)
+    prices_syms = 50*np.exp(np.cumsum(rng.normal(0.01, 0.1, size=(N_SCENARIOS, N_ASSETS, HORIZON+1)), axis=2))
+    zeros = np.zeros((N_SCENARIOS, HORIZON+1))
+    return dict(prices_syms=prices_syms, income_syms=zeros, expenses_syms=zeros, non_cash_assets=['A', 'B'], pInitialCashAllocations=1000., pTradeFee=0.01)
+
+
+def test_frontier_grid_is_serpentine():
+    points = frontier_grid([1, 2, 3], [10, 20])
+    assert points == [(1, 10), (1, 20), (2, 20), (2, 10), (3, 10), (3, 20)]
+    assert all(sum(a != b for a, b in zip(p, q)) == 1 for p, q in zip(points, points[1:]))
+
+
+def test_efficient_frontier_trades_wealth_for_cvar(scenarios):
+    frontier = efficient_frontier(partial(create_model, discrete=False), ALPHAS, GAMMAS, **scenarios, n_workers=1)
+    assert list(zip(frontier['alpha'], frontier['gamma'])) == frontier_grid(ALPHAS, GAMMAS)
+    assert (frontier['termination_condition'] == 'TerminationCondition.optimal').all()
+    no_cvar = frontier[frontier['gamma'] == 0]
+    assert np.allclose(no_cvar['objective'], no_cvar['expected_wealth'])
+    for _, points in frontier.groupby('alpha'):
+        points = points.sort_values('gamma')
+        assert (np.diff(points['expected_wealth']) <= 1e-6).all()
+        assert (np.diff(points['cvar']) <= 1e-6).all()
+
+
+def test_efficient_frontier_warm_start_and_workers_keep_the_solutions(scenarios):
+    cold = efficient_frontier(create_model, ALPHAS, GAMMAS, **scenarios, warm_start=False, n_workers=1)
+    warm = efficient_frontier(create_model, ALPHAS, GAMMAS, **scenarios, n_workers=1)
+    split = efficient_frontier(create_model, ALPHAS, GAMMAS, **scenarios, n_workers=2)
+    for frontier in (warm, split):
+        assert np.allclose(frontier['objective'], cold['objective'], rtol=1e-3)
+    assert split['build_time'].gt(0).sum() == 2
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from src.optimization.instance_data import create_instance, update_instance
+from src.optimization.model_factory import create_model
+
+N_SCENARIOS, N_ASSETS, HORIZON = 4, 2, 3
+
+
+@pytest.fixture
+def scenarios():
+    rng = np.random.default_rng(0)
+    prices_syms = 50*np.exp(np.cumsum(rng.normal(0, 0.05, size=(N_SCENARIOS, N_ASSETS, HORIZON+1)), axis=2))
+    zeros = np.zeros((N_SCENARIOS, HORIZON+1))
+    return dict(prices_syms=prices_syms, income_syms=zeros, expenses_syms=zeros, non_cash_assets=['A', 'B'], pInitialCashAllocations=1000.)
+
+
+def test_suffixes_follow_input_position():
+    model = create_model(cvar_levels=((0.05, 0.3), (0.01, 0.), (0.1, 0.2)))
+    assert model.pCVaRGamma1.default() == 0.3
+    assert model.pCVaRGamma3.default() == 0.2
+    assert not hasattr(model, 'pCVaRGamma2')
+    assert not hasattr(model, 'vCVaR2')
+
+
+def test_single_zero_gamma_level_is_not_built():
+    model = create_model(cvar_levels=((0.05, 0.),))
+    assert not hasattr(model, 'pCVaRGamma')
+    assert not hasattr(model, 'vCVaR')
+
+
+def test_setting_dropped_level_raises(scenarios):
+    model = create_model(cvar_levels=((0.05, 0.3), (0.01, 0.)))
+    with pytest.raises(ValueError, match='zero gamma'):
+        create_instance(model, **scenarios, pCVaRGamma2=0.1)
+    instance = create_instance(model, **scenarios, pCVaRGamma1=0.2)
+    assert instance.pCVaRGamma1.value == 0.2
+    with pytest.raises(ValueError, match='zero gamma'):
+        update_instance(instance, pCVaRGamma2=0.1)
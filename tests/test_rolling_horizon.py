@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from src.optimization.model_factory import create_model
+from src.optimization.rolling_horizon import RollingHorizonSolver
+
+N_SCENARIOS, N_ASSETS, HORIZON = 4, 2, 3
+
+
+def generate_scenarios(with_cash_returns):
+    def generate(step, cash, non_cash):
+        rng = np.random.default_rng(step)
+        prices_syms = 50*np.exp(np.cumsum(rng.normal(0, 0.05, size=(N_SCENARIOS, N_ASSETS, HORIZON+1)), axis=2))
+        zeros = np.zeros((N_SCENARIOS, HORIZON+1))
+        if not with_cash_returns:
+            return prices_syms, zeros, zeros
+        return prices_syms, zeros, zeros, np.full((N_SCENARIOS, HORIZON+1), 1.01)
+    return generate
+
+
+def execute(step, non_cash_trades, cash, non_cash):
+    return cash, non_cash
+
+
+def test_run_passes_cash_returns():
+    driver = RollingHorizonSolver(create_model(cash_returns=True), ['A', 'B'], pTradeFee=0.01)
+    outputs = driver.run(2, generate_scenarios(True), execute, 1000.)
+    assert len(outputs) == 2
+    assert all(driver.instance.pCashReturns[s, t].value == 1.01 for s in driver.instance.sScenarios for t in driver.instance.sTime)
+
+
+def test_run_without_cash_returns():
+    driver = RollingHorizonSolver(create_model(), ['A', 'B'], pTradeFee=0.01)
+    assert len(driver.run(2, generate_scenarios(False), execute, 1000.)) == 2
+    with pytest.raises(ValueError, match='cash_returns_syms'):
+        RollingHorizonSolver(create_model(cash_returns=True), ['A', 'B']).run(1, generate_scenarios(False), execute, 1000.)
+
+
+def test_warm_start_reaches_highs():
+    driver = RollingHorizonSolver(create_model(discrete=True), ['A', 'B'], pTradeFee=0.01)
+    generate = generate_scenarios(False)
+    driver.step(*generate(0, 1000., None), 1000.)
+    highs, var_map = driver.solver._solver_model, driver.solver._pyomo_var_to_solver_var_map
+    run, starts = highs.run, []
+
+    def spy_run():
+        # The instance still has the shifted values, the new solution is loaded after run
+        solution = highs.getSolution()
+        shifted = [(var_map[id(var)], var.value) for var in driver.instance.vNonCashAllocations.values()]
+        starts.append(solution.value_valid and all(np.isclose(solution.col_value[i], value) for i, value in shifted))
+        return run()
+
+    highs.run = spy_run
+    output = driver.step(*generate(1, 1000., None), 1000.)
+    assert starts == [True]
+    assert str(output['results'].termination_condition) == 'TerminationCondition.optimal'
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.cashflows import NormalCashFlows
+from src.returns import BootstrapReturns, FactorReturns, LogNormalReturns
+from src.sampling import MAX_QMC_DIM, SAMPLING_METHODS, NormalSampler, PathDrawer
+
+N_PATHS = 2100
+CHUNK_SIZES = [1, 7, 139, 1024, 1500]
+
+
+@pytest.fixture
+def df_prices():
+    rng = np.random.default_rng(0)
+    log_returns = rng.normal(0.001, 0.02, size=(120, 4))
+    return pd.DataFrame(100*np.exp(np.cumsum(log_returns, axis=0)), columns=[f'Asset{i}' for i in range(4)])
+
+
+@pytest.mark.parametrize('sampling', SAMPLING_METHODS)
+def test_chunks_match_predict(df_prices, sampling):
+    model = LogNormalReturns(seed=1, sampling=sampling)
+    model.fit(df_prices)
+    stream = model.next_stream()
+    expected = model.predict(3, N_PATHS, stream=stream)
+    for chunk_size in CHUNK_SIZES:
+        assert np.array_equal(model.predict(3, N_PATHS, chunk_size=chunk_size, stream=stream), expected)
+        chunks = model.predict_chunks(3, N_PATHS, chunk_size=chunk_size, stream=stream)
+        assert np.array_equal(np.concatenate(list(chunks)), expected)
+
+
+@pytest.mark.parametrize('model', [FactorReturns(n_factors=2, seed=1), BootstrapReturns(seed=1)])
+def test_other_models_chunks_match_predict(df_prices, model):
+    model.fit(df_prices)
+    stream = model.next_stream()
+    expected = model.predict(3, N_PATHS, stream=stream)
+    for chunk_size in CHUNK_SIZES:
+        assert np.array_equal(np.concatenate(list(model.predict_chunks(3, N_PATHS, chunk_size=chunk_size, stream=stream))), expected)
+
+
+def test_cashflow_chunks_match_predict():
+    model = NormalCashFlows(seed=1)
+    model.fit(np.random.default_rng(0).normal(1000, 100, size=60))
+    stream = model.next_stream()
+    expected = model.predict(3, N_PATHS, stream=stream)
+    for chunk_size in CHUNK_SIZES:
+        assert np.array_equal(np.concatenate(list(model.predict_chunks(3, N_PATHS, chunk_size=chunk_size, stream=stream))), expected)
+
+
+def test_simulate_range_matches_predict(df_prices):
+    model = LogNormalReturns(seed=1)
+    model.fit(df_prices)
+    stream = model.next_stream()
+    expected = model.predict(3, N_PATHS, stream=stream)
+    assert np.array_equal(model.simulate(stream, 3, N_PATHS, 1500, 1600), expected[1500:1600])
+
+
+def test_consecutive_chunks_draw_their_own_paths():
+    drawn = []
+
+    def sampler(rng):
+        normal = NormalSampler(5, 'random', rng)
+        return lambda n: drawn.append(n) or normal.draw(n)
+
+    drawer = PathDrawer(np.random.SeedSequence(1), N_PATHS)
+    for start in range(0, N_PATHS, 7):
+        drawer.draw(start, min(start + 7, N_PATHS), sampler)
+    assert sum(drawn) == N_PATHS
+    assert max(drawn) == 7
+
+
+def test_cashflow_chunks_default_to_chunk_elements(monkeypatch):
+    monkeypatch.setattr('src.cashflows.gaussian.CHUNK_ELEMENTS', 40)
+    model = NormalCashFlows(seed=1)
+    model.fit(np.random.default_rng(0).normal(1000, 100, size=60))
+    stream = model.next_stream()
+    chunks = list(model.predict_chunks(3, 25, stream=stream))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert np.array_equal(np.concatenate(chunks), model.predict(3, 25, stream=stream))
+
+
+@pytest.mark.parametrize('method', ['sobol', 'halton'])
+def test_qmc_dimension_limit(method):
+    assert NormalSampler(MAX_QMC_DIM, method, 0).draw(2).shape == (2, MAX_QMC_DIM)
+    with pytest.raises(ValueError, match=f'up to {MAX_QMC_DIM}'):
+        NormalSampler(MAX_QMC_DIM + 1, method, 0)